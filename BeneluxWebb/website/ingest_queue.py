@@ -0,0 +1,192 @@
+import time
+import eventlet
+
+from .scheduler import run_async, r, USE_REDIS_LOCK
+from update import update_matches, update_esea_teams_benelux
+from logs.update_logger import get_logger
+webhook_logger = get_logger("webhook")
+
+# Seconds without new events before the queue is flushed, and the maximum time an event waits
+INGEST_DEBOUNCE = 15
+INGEST_MAX_WAIT = 60
+
+# Seconds before the events of a failed or skipped job are flushed again, and the number of failed
+# jobs after which an event is dropped
+INGEST_RETRY_DELAY = 60
+INGEST_MAX_ATTEMPTS = 5
+
+# Redis keys used to keep the pending events across restarts
+REDIS_MATCHES_KEY = "ingest_queue:matches"     # hash match_id -> event_id
+REDIS_TEAMS_KEY = "ingest_queue:teams"         # set of "event_id|team_id"
+
+class IngestQueue:
+    """
+    Debounced ingest queue for the webhook events.
+
+    Repeated events for the same match or team are coalesced. The queue is flushed INGEST_DEBOUNCE
+    seconds after the last event (or INGEST_MAX_WAIT seconds after the first one) into one batched
+    update_matches job and one update_esea_teams_benelux job per event. Pending events are mirrored to
+    Redis when it is available and removed only after their job succeeded, so they survive a restart.
+    The events of a job that failed or could not get its lock are queued again, up to
+    INGEST_MAX_ATTEMPTS times.
+    """
+    def __init__(self, debounce: float = INGEST_DEBOUNCE, max_wait: float = INGEST_MAX_WAIT):
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self._matches = {}      # match_id -> event_id
+        self._teams = set()     # (event_id, team_id)
+        self._attempts = {}     # match_id or (event_id, team_id) -> failed jobs
+        self._first_event = None
+        self._last_event = None
+        self._timer = None
+        self._lock = eventlet.semaphore.Semaphore(1)
+
+    # ------------------
+    # Adding events
+    # ------------------
+    def add_match(self, match_id: str, event_id: str) -> None:
+        """ Queues a match for update_matches """
+        if not match_id:
+            return
+        with self._lock:
+            self._matches[match_id] = event_id
+            self._redis(lambda: r.hset(REDIS_MATCHES_KEY, match_id, event_id or ''))
+            self._touch()
+
+    def add_teams(self, team_ids: list, event_id: str) -> None:
+        """ Queues teams for update_esea_teams_benelux """
+        team_ids = [team_id for team_id in team_ids if team_id]
+        if not team_ids:
+            return
+        with self._lock:
+            self._teams.update((event_id, team_id) for team_id in team_ids)
+            self._redis(lambda: r.sadd(REDIS_TEAMS_KEY, *[f"{event_id}|{team_id}" for team_id in team_ids]))
+            self._touch()
+
+    def restore(self) -> None:
+        """ Loads the events that were still pending in Redis (e.g. after a restart) and schedules a flush """
+        matches = self._redis(lambda: r.hgetall(REDIS_MATCHES_KEY)) or {}
+        teams = self._redis(lambda: r.smembers(REDIS_TEAMS_KEY)) or set()
+        if not matches and not teams:
+            return
+
+        with self._lock:
+            for match_id, event_id in matches.items():
+                self._matches[match_id.decode()] = event_id.decode() or None
+            for entry in teams:
+                event_id, _, team_id = entry.decode().partition('|')
+                self._teams.add((event_id, team_id))
+            self._touch()
+        webhook_logger.info(f"[QUEUE] Restored {len(matches)} matches and {len(teams)} teams from Redis.")
+
+    # ------------------
+    # Flushing
+    # ------------------
+    def _touch(self) -> None:
+        """ Registers a new event and makes sure a flush is scheduled (call with the lock held) """
+        now = time.monotonic()
+        self._last_event = now
+        if self._first_event is None:
+            self._first_event = now
+        if self._timer is None:
+            self._timer = eventlet.spawn_after(self.debounce, self._check)
+
+    def _check(self) -> None:
+        """ Flushes when the queue has been quiet for the debounce window or waited max_wait, otherwise waits """
+        with self._lock:
+            now = time.monotonic()
+            quiet_for = now - self._last_event
+            waited = now - self._first_event
+            if quiet_for < self.debounce and waited < self.max_wait:
+                self._timer = eventlet.spawn_after(min(self.debounce - quiet_for, self.max_wait - waited), self._check)
+                return
+
+            matches, teams = self._matches, self._teams
+            self._matches, self._teams = {}, set()
+            self._first_event = self._last_event = self._timer = None
+
+        try:
+            failed_matches, failed_teams = self.flush(matches, teams)
+        except Exception as e:
+            webhook_logger.error(f"[QUEUE] Error flushing the ingest queue: {e}", exc_info=True)
+            failed_matches, failed_teams = matches, teams
+        self._done(
+            {match_id: event_id for match_id, event_id in matches.items() if match_id not in failed_matches},
+            teams - failed_teams
+        )
+        if failed_matches or failed_teams:
+            self._requeue(failed_matches, failed_teams)
+
+    def flush(self, matches: dict, teams: set) -> tuple[dict, set]:
+        """
+        Runs the batched jobs for the given events, the teams are updated per event.
+        
+        Returns:
+            tuple: (matches, teams) of the jobs that failed or were skipped
+        """
+        failed_matches, failed_teams = {}, set()
+        if matches:
+            webhook_logger.info(f"[QUEUE] Updating {len(matches)} matches.")
+            if not run_async(update_matches, list(matches), list(matches.values()))():
+                failed_matches = dict(matches)
+
+        teams_per_event = {}
+        for event_id, team_id in teams:
+            teams_per_event.setdefault(event_id, set()).add(team_id)
+        for event_id, team_ids in teams_per_event.items():
+            webhook_logger.info(f"[QUEUE] Updating {len(team_ids)} ESEA teams for event {event_id}.")
+            if not run_async(update_esea_teams_benelux, sorted(team_ids), [event_id] if event_id else [])():
+                failed_teams.update((event_id, team_id) for team_id in team_ids)
+
+        return failed_matches, failed_teams
+
+    def _done(self, matches: dict, teams: set) -> None:
+        """ Removes the events of the succeeded jobs from Redis, unless they were queued again meanwhile """
+        with self._lock:
+            for key in [*matches, *teams]:
+                self._attempts.pop(key, None)
+            match_ids = [match_id for match_id in matches if match_id not in self._matches]
+            entries = [f"{event_id}|{team_id}" for event_id, team_id in teams if (event_id, team_id) not in self._teams]
+        if match_ids:
+            self._redis(lambda: r.hdel(REDIS_MATCHES_KEY, *match_ids))
+        if entries:
+            self._redis(lambda: r.srem(REDIS_TEAMS_KEY, *entries))
+
+    def _requeue(self, matches: dict, teams: set) -> None:
+        """ Queues the events of a failed job again, newer events for the same match take precedence """
+        with self._lock:
+            for key in [*matches, *teams]:
+                self._attempts[key] = self._attempts.get(key, 0) + 1
+            dropped = {key for key in [*matches, *teams] if self._attempts[key] >= INGEST_MAX_ATTEMPTS}
+            for key in dropped:
+                self._attempts.pop(key)
+        
+        if dropped:
+            webhook_logger.error(f"[QUEUE] Dropping events after {INGEST_MAX_ATTEMPTS} failed jobs: {sorted(map(str, dropped))}")
+            self._done({match_id: event_id for match_id, event_id in matches.items() if match_id in dropped}, teams & dropped)
+            matches = {match_id: event_id for match_id, event_id in matches.items() if match_id not in dropped}
+            teams = teams - dropped
+            if not matches and not teams:
+                return
+        
+        webhook_logger.warning(f"[QUEUE] Requeueing {len(matches)} matches and {len(teams)} teams, retrying in {INGEST_RETRY_DELAY}s.")
+        with self._lock:
+            self._matches = {**matches, **self._matches}
+            self._teams |= teams
+            if self._first_event is None:
+                self._first_event = self._last_event = time.monotonic()
+            if self._timer is None:
+                self._timer = eventlet.spawn_after(INGEST_RETRY_DELAY, self._check)
+
+    @staticmethod
+    def _redis(operation):
+        """ Runs a Redis operation, the queue keeps working in memory when Redis is unavailable """
+        if not USE_REDIS_LOCK:
+            return None
+        try:
+            return operation()
+        except Exception as e:
+            webhook_logger.debug(f"[QUEUE] Redis unavailable, keeping events in memory only: {e}")
+            return None
+
+ingest_queue = IngestQueue()
@@ -1,15 +1,20 @@
 import eventlet
 import asyncio
 from redis.lock import Lock
+from redis.exceptions import LockError
 import redis
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from logs.update_logger import get_logger
 scheduler_logger = get_logger("scheduler")
 
 # Semaphore to ensure only one task runs at a time (per process)
 job_lock = eventlet.semaphore.Semaphore(1)
 
+# Seconds between two polls of the live match tracking
+LIVE_POLL_INTERVAL = 20
+
 # Redis-based distributed lock
 USE_REDIS_LOCK = False
 try:
@@ -21,49 +26,68 @@ try:
 except ImportError:
     scheduler_logger.warning("Redis not installed, distributed lock disabled.")
 
-def run_async(func, *args, **kwargs):
-    """ Wrap an async function to run in an Eventlet green thread"""
+def run_async(func, *args, exclusive=True, **kwargs):
+    """ 
+    Wrap an async function to run in an Eventlet green thread
+    
+    With exclusive=False the task does not wait for the local lock, so short and frequent tasks
+    (live match tracking) are not queued behind long running jobs.
+    
+    The wrapper returns True when the task ran and finished without an error, and False when it
+    failed or was skipped because another process holds its Redis lock.
+    """
     def wrapper():
-        scheduler_logger.debug(f"[{func.__name__}] Attempting to acquire local lock")
+        if exclusive:
+            scheduler_logger.debug(f"[{func.__name__}] Attempting to acquire local lock")
 
-        # Try to acquire the local lock non-blocking first
-        got_lock = job_lock.acquire(blocking=False)
-        if not got_lock:
-            scheduler_logger.warning(f"[{func.__name__}] Waiting for lock — another job is running")
-            job_lock.acquire()  # Block until available
+            # Try to acquire the local lock non-blocking first
+            got_lock = job_lock.acquire(blocking=False)
+            if not got_lock:
+                scheduler_logger.warning(f"[{func.__name__}] Waiting for lock — another job is running")
+                job_lock.acquire()  # Block until available
         try:
-            scheduler_logger.debug(f"[{func.__name__}] Acquired local lock")
+            if exclusive:
+                scheduler_logger.debug(f"[{func.__name__}] Acquired local lock")
 
             if USE_REDIS_LOCK:
                 lock_name = f"flask_task_lock:{func.__name__}"
                 scheduler_logger.debug(f"[{func.__name__}] Attempting Redis lock")
 
-                with Lock(r, lock_name, timeout=3600, blocking_timeout=10) as redis_lock:
-                    if redis_lock.locked():
-                        scheduler_logger.debug(f"[{func.__name__}] Acquired Redis lock, starting task")
-                        _run(func, *args, **kwargs)
-                    else:
-                        scheduler_logger.warning(f"[{func.__name__}] Could not acquire Redis lock, skipping")
+                redis_lock = Lock(r, lock_name, timeout=3600, blocking_timeout=10)
+                if not redis_lock.acquire():
+                    scheduler_logger.warning(f"[{func.__name__}] Could not acquire Redis lock, skipping")
+                    return False
+                try:
+                    scheduler_logger.debug(f"[{func.__name__}] Acquired Redis lock, starting task")
+                    return _run(func, *args, **kwargs)
+                finally:
+                    try:
+                        redis_lock.release()
+                    except LockError as e:
+                        scheduler_logger.warning(f"[{func.__name__}] Redis lock expired before the task finished: {e}")
             else:
                 scheduler_logger.debug(f"[{func.__name__}] Running with local lock only")
-                _run(func, *args, **kwargs)
+                return _run(func, *args, **kwargs)
 
         finally:
-            job_lock.release()
-            scheduler_logger.debug(f"[{func.__name__}] Released local lock")
+            if exclusive:
+                job_lock.release()
+                scheduler_logger.debug(f"[{func.__name__}] Released local lock")
 
     return wrapper
 
-def _run(func, *args, **kwargs):
-    """Helper to run the async function in a new asyncio loop."""
+def _run(func, *args, **kwargs) -> bool:
+    """Helper to run the async function in a new asyncio loop, returns False when it raised."""
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     try:
         scheduler_logger.info(f"[START] Starting task {func.__name__}")
         loop.run_until_complete(func(*args, **kwargs))
         scheduler_logger.debug(f"[END] Finished task {func.__name__}")
+        return True
     except Exception as e:
         scheduler_logger.error(f"Error running task {func.__name__}: {e}")
+        return False
     finally:
         loop.close()
         
@@ -75,17 +99,39 @@ def init_scheduler(app):
     Initialize APScheduler and schedule your jobs.
     """
     import update
+    from database.db_migrations import pending_migrations, verify_indexes
+    
+    # Migrations run in the deploy (database/db_migrations.py), here only the missing ones are reported
+    try:
+        pending = pending_migrations()
+        if pending:
+            scheduler_logger.warning(f"[INIT] Database migrations {pending} are not applied, run database/db_migrations.py.")
+        verify_indexes()
+    except Exception as e:
+        scheduler_logger.error(f"[INIT] Error checking the database migrations: {e}", exc_info=True)
     
     scheduler_logger.info("Initializing scheduler...")
 
+    from .ingest_queue import ingest_queue
+    
     scheduler = BackgroundScheduler()
     scheduler.start()
 
     try:
-        # --- Every minute ---
+        # --- Live matches (every LIVE_POLL_INTERVAL seconds) ---
+        # Status changes go through the ingest queue, so the full match update runs as an exclusive job
+        scheduler.add_job(
+            run_async(update.track_live_matches, exclusive=False, queue_match=ingest_queue.add_match),
+            trigger=IntervalTrigger(seconds=LIVE_POLL_INTERVAL),
+            max_instances=1,
+            coalesce=True,
+        )
+        
+        # --- Every 15 minutes ---
+        # Full refresh of the ongoing matches (maps and stats), the live tracking only updates scores
         scheduler.add_job(
             run_async(update.update_ongoing_matches),
-            trigger=CronTrigger(minute="*"),
+            trigger=CronTrigger(minute="*/15"),
         )
         
         # --- Every 5 minutes ---
@@ -103,9 +149,14 @@ def init_scheduler(app):
         )
         
         # --- Hourly ---
+        # Only the changed leaderboard players are refreshed hourly, all players once a day
         scheduler.add_job(
             run_async(update.update_leaderboard),
-            trigger=CronTrigger(minute=0)
+            trigger=CronTrigger(hour="1-23", minute=0)
+        )
+        scheduler.add_job(
+            run_async(update.update_leaderboard, refresh_all=True),
+            trigger=CronTrigger(hour=0, minute=0)
         )
         scheduler.add_job(
             run_async(update.update_elo_leaderboard),
@@ -157,6 +208,9 @@ def init_scheduler(app):
     except Exception as e:
         scheduler_logger.error(f"[INIT] Error adding jobs: {e}", exc_info=True)
     
+    # Flush the webhook events that were still queued before the last restart
+    ingest_queue.restore()
+    
     # Store scheduler on app for optional later access
     app.scheduler = scheduler
     scheduler_logger.info("Scheduler initialized and jobs scheduled.")
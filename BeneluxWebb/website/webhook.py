@@ -6,10 +6,11 @@ import json
 import eventlet
 
 from .scheduler import run_async
+from .ingest_queue import ingest_queue
 from dotenv import load_dotenv
 from flask import Blueprint, request, jsonify, abort, Response
 from logs.update_logger import get_logger
-from update import update_matches, update_esea_teams_benelux, update_streamers
+from update import update_streamers
 from database.db_down_update import gather_teams_benelux_primary
 
 webhook_logger = get_logger("webhook")
@@ -80,13 +81,14 @@ def faceit_webhook():
         match_id = payload['payload'].get('id')
         
         if payload['event'] in ['match_status_ready', 'match_status_configuring']:
-            eventlet.spawn(run_async(update_matches, [match_id], [event_id]))
-            webhook_logger.info(f"Triggering match update for match ID: {match_id}")
+            # Queued and debounced, repeated events for the same match are batched into one update
+            ingest_queue.add_match(match_id, event_id)
+            webhook_logger.info(f"Queued match update for match ID: {match_id}")
         elif payload['event'] == 'match_status_finished':
-            eventlet.spawn(run_async(update_esea_teams_benelux, team_ids, [event_id]))
-            webhook_logger.info(f"Triggering ESEA team update for teams: {team_ids}")
+            ingest_queue.add_teams(team_ids, event_id)
+            webhook_logger.info(f"Queued ESEA team update for teams: {team_ids}")
 
-    return jsonify({"status": "Jobs triggered"}), 200
+    return jsonify({"status": "Jobs queued"}), 200
 
 # ========== Twitch Webhook ==========
 # Twitch Headers
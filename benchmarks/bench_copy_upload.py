@@ -0,0 +1,74 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+import time
+from psycopg2.extras import execute_values
+
+from database.db_manage import start_database, close_database
+from database.db_up import upload_data_query, copy_upload
+
+### -----------------------------------------------------------------
+### Benchmark: upload of players_stats rows, execute_values vs COPY + merge
+### -----------------------------------------------------------------
+# Both paths write into a TEMP table with the layout of the upload (half inserts, half updates),
+# so the benchmark can run against any database without touching its data.
+
+ROW_COUNTS = [1000, 10000, 100000, 300000]
+TABLE_NAME = "bench_players_stats"
+KEYS = ['player_id', 'match_id', 'match_round', 'team_id', 'kills', 'deaths', 'assists', 'adr', 'hltv', 'weapons']
+PRIMARY_KEYS = ['player_id', 'match_id', 'match_round']
+
+def create_table(cursor) -> None:
+    cursor.execute(f"""
+        DROP TABLE IF EXISTS {TABLE_NAME};
+        CREATE TEMP TABLE {TABLE_NAME} (
+            player_id TEXT, match_id TEXT, match_round INT, team_id TEXT,
+            kills INT, deaths INT, assists INT, adr DOUBLE PRECISION, hltv DOUBLE PRECISION, weapons JSONB,
+            PRIMARY KEY (player_id, match_id, match_round)
+        );
+    """)
+
+def generate_rows(n: int, seed: int, offset: int = 0) -> list[tuple]:
+    """ n unique rows, the row keys start at offset """
+    rng = random.Random(seed)
+    return [
+        (
+            f"player-{i % 10}", f"match-{i // 20}", 1 + (i // 10) % 2, f"team-{i % 300}",
+            rng.randint(0, 40), rng.randint(0, 40), rng.randint(0, 15),
+            round(rng.uniform(20, 150), 1), round(rng.uniform(0.2, 2.5), 2),
+            '{"ak47": %d, "awp": %d}' % (rng.randint(0, 20), rng.randint(0, 10)),
+        )
+        for i in range(offset, offset + n)
+    ]
+
+def run_execute_values(cursor, rows: list[tuple]) -> tuple[int, int]:
+    query = upload_data_query(TABLE_NAME, KEYS, PRIMARY_KEYS)
+    counts = execute_values(cursor, query, rows, fetch=True)
+    return sum(row[0] for row in counts), sum(row[1] for row in counts)
+
+def run_copy(cursor, rows: list[tuple]) -> tuple[int, int]:
+    return copy_upload(cursor, TABLE_NAME, KEYS, PRIMARY_KEYS, rows)
+
+def benchmark(cursor, func, n: int) -> float:
+    """ Uploads n rows into an empty table and then n rows of which half update existing ones """
+    create_table(cursor)
+    first, second = generate_rows(n, seed=1), generate_rows(n, seed=2, offset=n // 2)
+    start = time.perf_counter()
+    func(cursor, first)
+    func(cursor, second)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    db, cursor = start_database()
+    try:
+        print(f"{'rows':>8} | {'execute_values':>15} | {'COPY + merge':>13} | speedup")
+        for n in ROW_COUNTS:
+            t_values = benchmark(cursor, run_execute_values, n)
+            t_copy = benchmark(cursor, run_copy, n)
+            print(f"{n:>8} | {t_values:>14.2f}s | {t_copy:>12.2f}s | {t_values / t_copy:.1f}x")
+    finally:
+        db.rollback()
+        close_database(db)
@@ -0,0 +1,123 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+import time
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from database.db_manage import start_database, close_database
+from database.db_down_update import event_players_query
+
+### -----------------------------------------------------------------
+### Benchmark: gather_event_players, OR chain + pandas vs unnest + window functions
+### -----------------------------------------------------------------
+# The data is generated in TEMP tables that shadow the real tables for this session only,
+# so the benchmark can run against any database without touching its data.
+
+N_EVENTS = 12               # ESEA seasons
+N_TEAMS_PER_EVENT = 30      # Benelux teams per season
+N_MATCHES_PER_TEAM = 20
+N_MAPS_PER_MATCH = 2
+N_ROSTER = 7                # players that played at least once for a team
+
+def seed_temp_tables(cursor) -> tuple[list, list]:
+    """ Creates and fills the temp tables, returns the (event_ids, team_ids) pairs """
+    cursor.execute("""
+        CREATE TEMP TABLE events (event_id TEXT PRIMARY KEY, event_end BIGINT);
+        CREATE TEMP TABLE matches (match_id TEXT PRIMARY KEY, event_id TEXT);
+        CREATE TEMP TABLE players (player_id TEXT PRIMARY KEY, player_name TEXT);
+        CREATE TEMP TABLE players_stats (player_id TEXT, match_id TEXT, match_round INT, team_id TEXT, PRIMARY KEY (player_id, match_id, match_round));
+        CREATE INDEX ON matches (event_id);
+        CREATE INDEX ON players_stats (match_id);
+    """)
+    rng = random.Random(42)
+    events, matches, players, stats = [], [], {}, []
+    event_ids, team_ids = [], []
+    for e in range(N_EVENTS):
+        event_id = f"event-{e}"
+        events.append((event_id, 0))
+        for t in range(N_TEAMS_PER_EVENT):
+            team_id = f"team-{e}-{t}"
+            event_ids.append(event_id)
+            team_ids.append(team_id)
+            roster = [f"player-{t}-{p}" for p in range(N_ROSTER)]
+            for p in roster:
+                players[p] = (p, p.upper())
+            for m in range(N_MATCHES_PER_TEAM):
+                match_id = f"match-{e}-{t}-{m}"
+                matches.append((match_id, event_id))
+                for r in range(1, N_MAPS_PER_MATCH + 1):
+                    # The first five players play most maps, a sub stands in now and then
+                    lineup = roster[:5]
+                    if rng.random() < 0.2:
+                        lineup[rng.randrange(5)] = rng.choice(roster[5:])
+                    for p in lineup:
+                        stats.append((p, match_id, r, team_id))
+    execute_values(cursor, "INSERT INTO events VALUES %s", events)
+    execute_values(cursor, "INSERT INTO matches VALUES %s", matches)
+    execute_values(cursor, "INSERT INTO players VALUES %s", list(players.values()))
+    execute_values(cursor, "INSERT INTO players_stats VALUES %s", stats, page_size=10000)
+    cursor.execute("ANALYZE events; ANALYZE matches; ANALYZE players; ANALYZE players_stats;")
+    print(f"Seeded {len(stats):,} players_stats rows for {len(event_ids)} (event, team) pairs")
+    return event_ids, team_ids
+
+def legacy_event_players(cursor, event_ids, team_ids) -> pd.DataFrame:
+    """ The previous implementation: one OR clause per pair and a per-player loop in pandas """
+    query = """
+        SELECT ps.player_id, ps.team_id, ps.match_id, p.player_name, m.event_id, e.event_end
+        FROM players_stats ps
+        LEFT JOIN players p ON ps.player_id = p.player_id
+        LEFT JOIN matches m ON ps.match_id = m.match_id
+        LEFT JOIN events e ON m.event_id = e.event_id
+        WHERE 
+    """ + " OR ".join(["(m.event_id = %s AND ps.team_id = %s)"] * len(event_ids))
+    params = [v for pair in zip(event_ids, team_ids) for v in pair]
+    cursor.execute(query, params)
+    data = pd.DataFrame(cursor.fetchall(), columns=['player_id', 'team_id', 'match_id', 'player_name', 'event_id', 'event_end'])
+
+    event_players = []
+    for (event_id, team_id), group in data.groupby(['event_id', 'team_id']):
+        player_counts = group.groupby('player_id').size().sort_values(ascending=False)
+        main_ids = player_counts.head(5).index.tolist()
+        players_main, players_sub = [], []
+        for player_id in player_counts.index:
+            player_name = group[group['player_id'] == player_id]['player_name'].iloc[0]
+            player_data = {'player_id': player_id, 'player_name': player_name}
+            (players_main if player_id in main_ids else players_sub).append(player_data)
+        event_players.append({'event_id': event_id, 'team_id': team_id, 'players_main': players_main, 'players_sub': players_sub})
+    return pd.DataFrame(event_players)
+
+def set_based_event_players(cursor, event_ids, team_ids) -> pd.DataFrame:
+    cursor.execute(event_players_query(), (event_ids, team_ids))
+    return pd.DataFrame(cursor.fetchall(), columns=['event_id', 'team_id', 'players_main', 'players_sub'])
+
+def timed(func, *args, repeat: int = 3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+if __name__ == "__main__":
+    db, cursor = start_database()
+    try:
+        event_ids, team_ids = seed_temp_tables(cursor)
+
+        legacy_time, df_legacy = timed(legacy_event_players, cursor, event_ids, team_ids)
+        new_time, df_new = timed(set_based_event_players, cursor, event_ids, team_ids)
+
+        # Same pairs and the same main rosters (ties between equal counts may be ordered differently)
+        main_sets = lambda df: {(r.event_id, r.team_id): frozenset(p['player_id'] for p in r.players_main) for r in df.itertuples()}
+        assert len(df_legacy) == len(df_new)
+        mismatches = sum(main_sets(df_legacy)[k] != v for k, v in main_sets(df_new).items())
+
+        print(f"Legacy OR chain + pandas : {legacy_time:.3f}s")
+        print(f"unnest + window functions: {new_time:.3f}s ({legacy_time / new_time:.1f}x)")
+        print(f"Pairs with a different main roster (ties only): {mismatches}")
+    finally:
+        db.rollback()
+        close_database(db)
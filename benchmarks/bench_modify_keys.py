@@ -0,0 +1,67 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import re
+import timeit
+import pandas as pd
+
+from data_processing.dp_general import modify_keys, clean_key
+
+### -----------------------------------------------------------------
+### Benchmark: modify_keys with the memoized key translation table
+### -----------------------------------------------------------------
+
+# A representative set of FACEIT match stats keys
+STAT_KEYS = [
+    "Kills", "Deaths", "Assists", "Headshots", "Headshots %", "K/D Ratio", "K/R Ratio",
+    "MVPs", "Triple Kills", "Quadro Kills", "Penta Kills", "ADR", "Damage", "Double Kills",
+    "Utility Damage", "Flash Count", "Flash Successes", "Enemies Flashed", "Entry Count",
+    "Entry Wins", "1v1Count", "1v1Wins", "1v2Count", "1v2Wins", "Sniper Kills", "Pistol Kills",
+    "Knife Kills", "Zeus Kills", "Clutch Kills", "Result", "Final Score", "First Half Score",
+    "Second Half Score", "Overtime score", "Team Headshots", "Team Win",
+]
+
+def legacy_modify_keys(d):
+    """ The previous implementation: two regexes per key on every call """
+    def legacy_clean_key(key):
+        key = key.replace('%', 'percent')
+        key = re.sub(r'[^a-zA-Z0-9_]', '_', key)
+        if re.match(r'^\d', key):
+            key = '_' + key
+        return key
+
+    if isinstance(d, pd.DataFrame):
+        return d.rename(columns=lambda x: legacy_clean_key(x))
+    elif isinstance(d, dict):
+        return {legacy_clean_key(key): legacy_modify_keys(value) if isinstance(value, (dict, list)) else value for key, value in d.items()}
+    elif isinstance(d, list):
+        return [legacy_modify_keys(item) if isinstance(item, dict) else item for item in d]
+    return d
+
+def build_payload(n_rounds: int = 200) -> dict:
+    """ Builds a nested payload shaped like a /matches/{id}/stats response """
+    player = {key: "1" for key in STAT_KEYS}
+    team = {"team_id": "t", "team_stats": dict(player), "players": [{"player_id": "p", "player_stats": dict(player)} for _ in range(5)]}
+    return {"rounds": [{"round_stats": dict(player), "teams": [team, team]} for _ in range(n_rounds)]}
+
+if __name__ == "__main__":
+    payload = build_payload()
+    df = pd.DataFrame([{key: 1 for key in STAT_KEYS}] * 1000)
+    number = 20
+
+    assert legacy_modify_keys(payload) == modify_keys(payload)
+    assert list(legacy_modify_keys(df).columns) == list(modify_keys(df).columns)
+
+    legacy_dict = timeit.timeit(lambda: legacy_modify_keys(payload), number=number)
+    cached_dict = timeit.timeit(lambda: modify_keys(payload), number=number)
+    legacy_df = timeit.timeit(lambda: legacy_modify_keys(df), number=number * 10)
+    cached_df = timeit.timeit(lambda: modify_keys(df), number=number * 10)
+
+    n_keys = number * len(STAT_KEYS) * 200 * (1 + 2 * (1 + 5))
+    print(f"Nested payload ({n_keys:,} keys): legacy {legacy_dict:.3f}s, cached {cached_dict:.3f}s "
+          f"({legacy_dict / cached_dict:.1f}x), {1e9 * (legacy_dict - cached_dict) / n_keys:.0f} ns/key saved")
+    print(f"DataFrame rename ({number * 10} calls): legacy {legacy_df:.3f}s, cached {cached_df:.3f}s "
+          f"({legacy_df / cached_df:.1f}x)")
+    print(f"Key cache: {clean_key.cache_info()}")
@@ -0,0 +1,61 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import random
+import timeit
+import numpy as np
+import pandas as pd
+
+from database.db_up import prepare_rows, clean_row
+
+### -----------------------------------------------------------------
+### Benchmark: upload_data row preparation, to_dict('records') vs columnar
+### -----------------------------------------------------------------
+
+N_ROWS = 100000
+
+# Layout of a players_stats upload: text keys, integer and float stats with some NaN, a JSON column
+KEYS = ['player_id', 'match_id', 'match_round', 'team_id', 'kills', 'deaths', 'assists', 'adr', 'hltv', 'kast_approx', 'weapons', 'missing_column']
+
+def legacy_prepare_rows(df: pd.DataFrame, keys: list[str]) -> list[tuple]:
+    """ The previous implementation: a dict and two tuples per row, isinstance on every cell """
+    return [
+        clean_row(tuple(
+            json.dumps(val) if isinstance(val, (dict, list, tuple)) else val
+            for val in (d.get(col, None) for col in keys)
+        ))
+        for d in df.to_dict(orient='records')
+    ]
+
+def build_frame(n: int) -> pd.DataFrame:
+    rng = random.Random(42)
+    return pd.DataFrame({
+        'player_id': [f"player-{i % 5000}" for i in range(n)],
+        'match_id': [f"match-{i // 10}" for i in range(n)],
+        'match_round': [1 + i % 2 for i in range(n)],
+        'team_id': [f"team-{i % 300}" for i in range(n)],
+        'kills': [rng.randint(0, 40) for _ in range(n)],
+        'deaths': [rng.randint(0, 40) for _ in range(n)],
+        'assists': [rng.randint(0, 15) for _ in range(n)],
+        'adr': [rng.uniform(20, 150) for _ in range(n)],
+        'hltv': [rng.uniform(0.2, 2.5) if rng.random() > 0.05 else np.nan for _ in range(n)],
+        'kast_approx': [np.nan] * n,
+        'weapons': [{'ak47': rng.randint(0, 20)} if rng.random() > 0.1 else None for _ in range(n)],
+    })
+
+if __name__ == "__main__":
+    df = build_frame(N_ROWS)
+    number = 3
+
+    assert legacy_prepare_rows(df, KEYS) == prepare_rows(df, KEYS)
+
+    legacy = timeit.timeit(lambda: legacy_prepare_rows(df, KEYS), number=number) / number
+    columnar = timeit.timeit(lambda: prepare_rows(df, KEYS), number=number) / number
+
+    print(f"{N_ROWS:,} rows x {len(KEYS)} columns")
+    print(f"to_dict('records'): {N_ROWS / legacy:>12,.0f} rows/s ({legacy * 1000:.0f} ms)")
+    print(f"columnar          : {N_ROWS / columnar:>12,.0f} rows/s ({columnar * 1000:.0f} ms)")
+    print(f"speedup           : {legacy / columnar:.1f}x")
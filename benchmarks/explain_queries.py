@@ -0,0 +1,165 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import re
+import psycopg2.extensions
+from psycopg2 import sql
+
+### -----------------------------------------------------------------
+### Query plans of the website and update queries
+### -----------------------------------------------------------------
+# Runs the database functions of the website and the update jobs against a local copy of the database
+# (PG_* settings in .env) and runs EXPLAIN (ANALYZE, BUFFERS) before every SELECT they execute. Reports
+# the sequential scans in the plans and exits with status 1 if there are any, so it can guard a deploy.
+#
+# A seeded local database is usually small, and then the planner prefers sequential scans even where an
+# index exists. With DISABLE_SEQSCAN the plans are made with enable_seqscan off, so a sequential scan that
+# remains means that no index can serve the query.
+# Queries on a cursor class chosen by the function itself (RealDictCursor in get_upcoming_matches)
+# are not captured.
+
+DISABLE_SEQSCAN = True
+MIN_ROWS = 0                # Ignore sequential scans that read fewer rows
+IGNORED_RELATIONS = set()   # Relations that are small by design, e.g. {'seasons'}
+
+WRITE_STATEMENT = re.compile(r"\b(insert|update|delete|truncate|create|alter|drop)\b")
+
+class ExplainCursor(psycopg2.extensions.cursor):
+    """ Cursor that runs EXPLAIN (ANALYZE, BUFFERS) before every SELECT and keeps the plans """
+    label = None    # Name of the function being explained, nothing is explained while None
+    plans = []      # (label, query, plan) tuples
+
+    def execute(self, query, vars=None):
+        text = query.as_string(self) if isinstance(query, sql.Composable) else query
+        lowered = text.lstrip().lower()
+        if ExplainCursor.label and lowered.startswith(('select', 'with')) and not WRITE_STATEMENT.search(lowered):
+            if DISABLE_SEQSCAN:
+                super().execute("SET LOCAL enable_seqscan = off")
+            super().execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + text, vars)
+            ExplainCursor.plans.append((ExplainCursor.label, text, self.fetchone()[0][0]))
+        return super().execute(query, vars)
+
+def plan_nodes(node: dict):
+    """ Yields every node of a plan tree """
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+def sequential_scans(plan: dict) -> list[dict]:
+    """ Returns the sequential scans of an EXPLAIN (FORMAT JSON) plan """
+    scans = []
+    for node in plan_nodes(plan['Plan']):
+        if node['Node Type'] != 'Seq Scan' or node.get('Relation Name') in IGNORED_RELATIONS:
+            continue
+        loops = node.get('Actual Loops', 1)
+        rows_read = (node.get('Actual Rows', 0) + node.get('Rows Removed by Filter', 0)) * loops
+        if rows_read < MIN_ROWS:
+            continue
+        scans.append({
+            'relation': node.get('Relation Name'),
+            'filter': node.get('Filter'),
+            'rows_read': rows_read,
+            'blocks': node.get('Shared Hit Blocks', 0) + node.get('Shared Read Blocks', 0),
+        })
+    return scans
+
+def sample_arguments() -> dict:
+    """ Picks existing ids from the database to call the functions with """
+    from database.db_manage import start_database, close_database
+    db, cursor = start_database()
+    try:
+        cursor.execute("""
+            SELECT tb.team_id, tb.event_id, s.season_number
+            FROM teams_benelux tb
+            JOIN seasons s ON tb.event_id = s.event_id
+            ORDER BY s.season_number DESC
+            LIMIT 1
+        """)
+        team_id, event_id, season_number = cursor.fetchone() or (None, None, None)
+        cursor.execute("SELECT match_id FROM matches WHERE event_id = %s LIMIT 20", (event_id,))
+        match_ids = [row[0] for row in cursor.fetchall()]
+        return {'team_id': team_id, 'event_id': event_id, 'season_number': season_number, 'match_ids': match_ids}
+    finally:
+        close_database(db)
+
+def explained_functions(args: dict) -> list[tuple]:
+    """ (label, function, kwargs) of the database functions used by the website and the update jobs """
+    from database import db_down, db_down_update, db_down_website
+
+    team_id, event_id, szn = args['team_id'], args['event_id'], args['season_number']
+    return [
+        # Website
+        ("gather_current_streams", db_down_website.gather_current_streams, {}),
+        ("gather_esea_season_info", db_down_website.gather_esea_season_info, {}),
+        ("gather_esea_teams_benelux", db_down_website.gather_esea_teams_benelux, {'szn_number': szn}),
+        ("gather_teams_benelux", db_down_website.gather_teams_benelux, {'szn_number': szn}),
+        ("gather_esea_seasons_divisions", db_down_website.gather_esea_seasons_divisions, {}),
+        ("get_esea_player_of_the_week", db_down_website.get_esea_player_of_the_week, {}),
+        ("gather_esea_team_players", db_down_website.gather_esea_team_players, {'team_id': team_id, 'szn_number': szn}),
+        ("gather_esea_team_matches", db_down_website.gather_esea_team_matches, {'team_id': team_id, 'szn_number': szn}),
+        ("gather_esea_team_map_stats", db_down_website.gather_esea_team_map_stats, {'team_id': team_id, 'szn_number': szn}),
+        ("gather_esea_team_player_stats", db_down_website.gather_esea_team_player_stats, {'team_id': team_id, 'szn_number': szn}),
+        ("gather_filter_options", db_down_website.gather_filter_options, {}),
+        ("gather_filter_teams", db_down_website.gather_filter_teams, {}),
+        ("gather_elo_ranges", db_down_website.gather_elo_ranges, {}),
+        ("gather_elo_leaderboard", db_down_website.gather_elo_leaderboard, {}),
+        ("gather_player_stats_esea", db_down_website.gather_player_stats_esea, {'events': ['esea'], 'seasons': [szn]}),
+        ("gather_player_stats_esea (time range)", db_down_website.gather_player_stats_esea, {'timestamp': 'last month'}),
+
+        # Update jobs
+        ("gather_players", db_down.gather_players, {'benelux': True}),
+        ("gather_players_country", db_down.gather_players_country, {}),
+        ("gather_event_players", db_down_update.gather_event_players, {'event_ids': [event_id], 'team_ids': [team_id]}),
+        ("gather_event_teams", db_down_update.gather_event_teams, {'ONGOING': True, 'ESEA': True}),
+        ("gather_event_matches", db_down_update.gather_event_matches, {'event_ids': [event_id]}),
+        ("gather_new_match_ids", db_down_update.gather_new_match_ids, {'match_ids': args['match_ids'], 'event_ids': [event_id]}),
+        ("gather_event_high_water_mark", db_down_update.gather_event_high_water_mark, {'event_id': event_id}),
+        ("gather_internal_event_ids", db_down_update.gather_internal_event_ids, {'event_ids': [event_id]}),
+        ("gather_upcoming_matches", db_down_update.gather_upcoming_matches, {}),
+        ("gather_ongoing_matches", db_down_update.gather_ongoing_matches, {}),
+        ("gather_elo_snapshot", db_down_update.gather_elo_snapshot, {}),
+        ("gather_league_teams_merged", db_down_update.gather_league_teams_merged, {}),
+        ("gather_league_team_avatars", db_down_update.gather_league_team_avatars, {}),
+        ("gather_players_stats_hltv_chunk", db_down_update.gather_players_stats_hltv_chunk, {'limit': 1000}),
+        ("gather_streamers", db_down_update.gather_streamers, {}),
+        ("gather_live_streams", db_down_update.gather_live_streams, {}),
+    ]
+
+def explain_all() -> list[tuple]:
+    """ Runs every function with the explaining cursor, returns the flagged (label, query, scans, plan) tuples """
+    from database.db_manage import reset_pool
+    from database.db_meta import refresh_schema_cache
+
+    reset_pool(cursor_factory=ExplainCursor)
+    refresh_schema_cache(force=True)    # Catalog queries of the schema cache are not of interest
+    args = sample_arguments()
+
+    flagged = []
+    for label, func, kwargs in explained_functions(args):
+        ExplainCursor.label, ExplainCursor.plans = label, []
+        try:
+            func(**kwargs)
+        finally:
+            ExplainCursor.label = None
+
+        for _, query, plan in ExplainCursor.plans:
+            scans = sequential_scans(plan)
+            print(f"{label:<40} {plan['Execution Time']:>9.1f} ms  {len(scans)} seq scan(s)")
+            if scans:
+                flagged.append((label, query, scans, plan))
+    return flagged
+
+if __name__ == "__main__":
+    os.environ["USE_FAKE_DATA"] = "false"
+
+    flagged = explain_all()
+    for label, query, scans, plan in flagged:
+        print(f"\n=== {label} ===")
+        print(' '.join(query.split())[:300])
+        for scan in scans:
+            print(f"  Seq Scan on {scan['relation']}: {scan['rows_read']} rows read, {scan['blocks']} blocks, filter: {scan['filter']}")
+
+    print(f"\n{len(flagged)} queries with sequential scans.")
+    sys.exit(1 if flagged else 0)
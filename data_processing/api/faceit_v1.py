@@ -117,12 +117,14 @@ class FaceitData_v1:
         
         return await self.dispatcher.run(self._get, URL)
     
-    async def league_team_matches(self, team_id: str, championship_id: list[str] | str) -> dict | int:
+    async def league_team_matches(self, team_id: str, championship_id: list[str] | str, starting_item_position: int=0, return_items: int=20) -> dict | int:
         """
         Retrieve league matches for a team
 
         :param team_id: The ID of the team
         :param championship_id: The ID of the championship (list of IDs or a single ID)
+        :param starting_item_position: The starting item position. Default is 0
+        :param return_items: The number of items to return. Default is 20
         :return:
         """
 
@@ -132,8 +134,8 @@ class FaceitData_v1:
             "participantId" : team_id,
             "participantType" : "TEAM",
             "championshipId" : championship_id,
-            "limit" : "20",
-            "offset" : "0",
+            "limit" : str(return_items),
+            "offset" : str(starting_item_position),
             "sort" : "ASC"
         }
         
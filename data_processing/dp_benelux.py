@@ -9,6 +9,7 @@ import json
 import asyncio
 import re
 import math
+import itertools
 import pycountry
 
 # API imports
@@ -424,45 +425,104 @@ async def get_benelux_leaderboard_players(elo_cutoff=2000) -> pd.DataFrame:
         return pd.DataFrame()
     return df_leaderboard_players   
 
-async def fetch_country_leaderboard(country: str, elo_cutoff: int, faceit_data: FaceitData):
-    batch_start = 0
-    stop_fetching = False
+async def stream_country_leaderboard(country: str, elo_cutoff: int, faceit_data: FaceitData, batch_size: int = 100):
+    """
+    Async generator yielding the leaderboard of a country page by page (highest elo first).
+    The next page is already requested while the current page is processed, and no page is requested
+    once the elo cutoff or the end of the leaderboard is reached.
     
-    leaderboard_players = []
-    batch_size = 100  # Number of players to retrieve in each batch (max 100 and should be divisible by total_leaderboard_players)
+    Args:
+        country (str): Country code of the leaderboard
+        elo_cutoff (int): Lowest elo to include
+        faceit_data (FaceitData): FaceitData instance
+        batch_size (int): Number of players per page (max 100)
+    
+    Yields:
+        list[dict]: The players of a page with an elo of at least elo_cutoff
+    """
+    def fetch_page(batch_start: int) -> asyncio.Task:
+        return asyncio.create_task(faceit_data.game_global_ranking(
+            game_id='cs2', 
+            region='EU', 
+            country=country, 
+            starting_item_position=batch_start, 
+            return_items=batch_size
+        ))
     
+    batch_start = 0
+    next_page = fetch_page(batch_start)
     try:
-        while not stop_fetching:
-            # Fetch the leaderboard for the country
-            data = await faceit_data.game_global_ranking(
-                game_id='cs2', 
-                region='EU', 
-                country=country, 
-                starting_item_position=batch_start, 
-                return_items=batch_size
-            )
+        while next_page is not None:
+            data = await next_page
+            next_page = None
             
-            if isinstance(data, dict) and 'items' in data:
-                if isinstance(data['items'], list):
-                    for player in data['items']:
-                        player_elo = player.get('faceit_elo', 0)
-                        if player_elo >= elo_cutoff:
-                            leaderboard_players.append(player)
-                        else:
-                            stop_fetching = True
-                            break  # Stop fetching if we hit the elo cutoff
-            else:
+            if not isinstance(data, dict) or not isinstance(data.get('items'), list):
                 msg = f"Unexpected data format for country {country}: batch {batch_start} to {batch_start+batch_size}"
                 function_logger.warning(msg)
                 raise ValueError(msg)
             
-            batch_start += batch_size
+            # Prefetch the next page only when this page is full and still above the cutoff
+            items = data['items']
+            if len(items) == batch_size and items[-1].get('faceit_elo', 0) >= elo_cutoff:
+                batch_start += batch_size
+                next_page = fetch_page(batch_start)
+            
+            players = list(itertools.takewhile(lambda player: player.get('faceit_elo', 0) >= elo_cutoff, items))
+            if players:
+                yield players
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+async def fetch_country_leaderboard(country: str, elo_cutoff: int, faceit_data: FaceitData):
+    leaderboard_players = []
+    try:
+        async for players in stream_country_leaderboard(country, elo_cutoff, faceit_data):
+            leaderboard_players.extend(players)
     except Exception as e:
         function_logger.warning(f"Exception while loading leaderboard players for country {country}: {e}")
         raise
     
     return leaderboard_players
         
+def select_leaderboard_refresh(df_leaderboard: pd.DataFrame, df_players: pd.DataFrame, elo_cutoff: int = 2000) -> list[str]:
+    """
+    Selects the players whose details need to be refreshed after a leaderboard fetch:
+    new players, players whose elo or nickname changed, and Benelux players stored above the cutoff
+    that dropped off the leaderboard (their stored elo is outdated).
+    
+    Args:
+        df_leaderboard (pd.DataFrame): Leaderboard with player_id, player_name and faceit_elo
+        df_players (pd.DataFrame): Players table with player_id, player_name, country and faceit_elo
+        elo_cutoff (int): Elo cutoff used for the leaderboard
+    
+    Returns:
+        list[str]: Player IDs to refresh
+    """
+    df_leaderboard = df_leaderboard.drop_duplicates(subset='player_id')
+    df = df_leaderboard[['player_id', 'player_name', 'faceit_elo']].merge(
+        df_players[['player_id', 'player_name', 'faceit_elo']], 
+        on='player_id', how='left', suffixes=('', '_stored'), indicator=True
+    )
+    
+    elo = pd.to_numeric(df['faceit_elo'], errors='coerce')
+    elo_stored = pd.to_numeric(df['faceit_elo_stored'], errors='coerce')
+    new = df['_merge'] == 'left_only'
+    changed = (elo != elo_stored) | (df['player_name'] != df['player_name_stored'])
+    
+    dropped = (
+        df_players['country'].isin(['be', 'nl', 'lu'])
+        & (pd.to_numeric(df_players['faceit_elo'], errors='coerce') >= elo_cutoff)
+        & ~df_players['player_id'].isin(df_leaderboard['player_id'])
+    )
+    
+    player_ids = df.loc[new | changed, 'player_id'].tolist() + df_players.loc[dropped, 'player_id'].tolist()
+    function_logger.info(
+        f"Leaderboard refresh: {int(new.sum())} new, {int((changed & ~new).sum())} changed, "
+        f"{int(dropped.sum())} dropped of {len(df_leaderboard)} leaderboard players."
+    )
+    return player_ids
+
 def gather_players_country_json():
     """ Reads the players_country.json file and returns a DataFrame with the player country details """
     
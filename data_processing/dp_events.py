@@ -4,6 +4,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 import pandas as pd
+import asyncio
 from dateutil import parser
 from typing import List, Union
 
@@ -221,46 +222,25 @@ async def process_teams_benelux_esea(
         
         # If the players_main list of a team in df_teams_benelux is smaller than the players in df_event_players, replace it and the sub lists
         if not df_event_players.empty:
-            # Merge the dataframes on team_id and event_id
-            merged = df_teams_benelux.merge(df_event_players, on=["team_id", "event_id"], suffixes=("_df1", "_df2"), how="left")
+            keys = ['team_id', 'event_id']
+            df_long_api = rosters_to_long(df_teams_benelux, keys=keys)
+            df_long_played = rosters_to_long(df_event_players, keys=keys)
             
-            def choose_players(row):
-                try:
-                    list_main_1 = row["players_main_df1"]
-                    list_main_2 = row["players_main_df2"]
-                    list_sub_1 = row["players_sub_df1"]
-                    list_sub_2 = row["players_sub_df2"]
-
-                    # Case 1: list_main_2 missing or NaN
-                    if list_main_2 is None or (isinstance(list_main_2, float) and pd.isna(list_main_2)):
-                        return (list_main_1, list_sub_1)
-
-                    # Case 2: both are lists
-                    if isinstance(list_main_1, list) and isinstance(list_main_2, list):
-                        if not list_main_1:
-                            return (list_main_2, list_sub_2)
-                        if len(list_main_1) < len(list_main_2):    
-                            return (list_main_2, list_sub_2)
-                        else:
-                            return (list_main_1, list_sub_1)
-
-                    # Fallback: if list_main_1 is usable, take it; otherwise fallback to list_main_2
-                    if list_main_1 is not None and not (isinstance(list_main_1, float) and pd.isna(list_main_1)):
-                        return (list_main_1, list_sub_1)
-                    else:
-                        return (list_main_2, list_sub_2)
-
-                except Exception as e:
-                    function_logger.warning(f"Issue choosing players for team {row.get('team_name', 'Unknown')}: {e}")
-                    return (row.get("players_main_df1", []), row.get("players_sub_df1", []))
-
-            # Replace players_main where needed
-            merged[["players_main", "players_sub"]] = merged.apply(
-                lambda row: pd.Series(choose_players(row)), axis=1
-            )
+            # Number of main players per pair from both sources
+            pairs = pd.MultiIndex.from_frame(df_teams_benelux[keys].drop_duplicates())
+            n_main_api = df_long_api[df_long_api['role'] == 'main'].groupby(keys).size().reindex(pairs, fill_value=0)
+            n_main_played = df_long_played[df_long_played['role'] == 'main'].groupby(keys).size().reindex(pairs, fill_value=0)
+            use_played = pairs[n_main_api.values < n_main_played.values]
+            
+            df_long = pd.concat([
+                df_long_api[~pd.MultiIndex.from_frame(df_long_api[keys]).isin(use_played)],
+                df_long_played[pd.MultiIndex.from_frame(df_long_played[keys]).isin(use_played)],
+            ], ignore_index=True)
             
-            if not merged.empty:
-                df_teams_benelux = merged.drop(columns=[col for col in merged.columns if col.endswith('_df1') or col.endswith('_df2')])
+            df_rosters = long_to_rosters(df_long, keys=keys)
+            df_teams_benelux = df_teams_benelux.drop(columns=list(ROSTER_ROLES)).merge(df_rosters, on=keys, how='left')
+            for column in ROSTER_ROLES:
+                df_teams_benelux[column] = [roster if isinstance(roster, list) else [] for roster in df_teams_benelux[column]]
             
     except Exception as e:
         function_logger.warning(f"Issue gathering alternative event players: {e}")
@@ -277,6 +257,53 @@ async def process_teams_benelux_esea(
     return df_teams_benelux
 
 
+# Roster list columns and the role they get in the long roster table
+ROSTER_ROLES = {'players_main': 'main', 'players_sub': 'sub'}
+
+def rosters_to_long(df: pd.DataFrame, keys: list = ['team_id', 'event_id'], roster_columns: dict = ROSTER_ROLES) -> pd.DataFrame:
+    """
+    Turns the roster list columns (lists of {player_id, player_name}) into one long table
+    
+    Returns:
+        pd.DataFrame: keys + player_id, player_name, role and position (order within the roster)
+    """
+    columns = keys + ['player_id', 'player_name', 'role', 'position']
+    frames = []
+    for column, role in roster_columns.items():
+        if column not in df.columns:
+            continue
+        
+        rosters = df.set_index(keys)[column].explode().dropna()
+        if rosters.empty:
+            continue
+        
+        df_players = pd.DataFrame(rosters.tolist(), index=rosters.index).reindex(columns=['player_id', 'player_name'])
+        df_players['role'] = role
+        df_players['position'] = df_players.groupby(level=keys).cumcount()
+        frames.append(df_players.reset_index())
+    
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)[columns]
+
+def long_to_rosters(df_long: pd.DataFrame, keys: list = ['team_id', 'event_id'], roster_columns: dict = ROSTER_ROLES) -> pd.DataFrame:
+    """ Builds the roster list columns back from a long roster table (see rosters_to_long) """
+    if df_long.empty:
+        return pd.DataFrame(columns=keys + list(roster_columns))
+    
+    df_long = df_long.sort_values(keys + ['role', 'position'])
+    players = pd.Series(
+        [{'player_id': player_id, 'player_name': player_name} for player_id, player_name in zip(df_long['player_id'], df_long['player_name'])],
+        index=df_long.index
+    )
+    df_rosters = players.groupby([df_long[key] for key in keys] + [df_long['role']], sort=False).agg(list).unstack('role')
+    
+    for column, role in roster_columns.items():
+        values = df_rosters[role] if role in df_rosters.columns else pd.Series(index=df_rosters.index, dtype=object)
+        df_rosters[column] = [roster if isinstance(roster, list) else [] for roster in values]
+    
+    return df_rosters[list(roster_columns)].reset_index()
+
 async def process_league_team_season_standings(
     team_id, 
     faceit_data_v1: FaceitData_v1) -> list:
@@ -393,14 +420,14 @@ async def gather_esea_matches(
             function_logger.error(msg)
             raise ValueError(msg)
 
-        tasks = [
-            gather_esea_matches_team(team_id, event_id, faceit_data_v1)
-            for team_id, event_id in zip(team_ids, event_ids)
+        # The per-team match amount filter needs every (match, team) row, so only dedupe otherwise
+        dedupe = not (match_amount != "ALL" and match_amount_type == "TEAM")
+        
+        flat_list = [
+            match
+            async for team_matches in stream_esea_matches(team_ids, event_ids, faceit_data_v1, dedupe=dedupe)
+            for match in team_matches
         ]
-        results = await gather_with_progress(tasks, desc="Gathering ESEA matches", unit="teams")
-
-        # Flatten and create DataFrame
-        flat_list = [d for sublist in results for d in sublist]
         df = pd.DataFrame(flat_list)
         
         if df.empty:
@@ -423,11 +450,68 @@ async def gather_esea_matches(
         function_logger.error(f"Error gathering ESEA matches: {e}", exc_info=True)
         return pd.DataFrame()  # Return an empty DataFrame on error
 
+async def stream_esea_matches(
+    team_ids: list,
+    event_ids: list,
+    faceit_data_v1: FaceitData_v1,
+    dedupe: bool = True,
+    stats: dict = None):
+    """
+    Discovers the ESEA matches for (team, event) pairs and yields the matches of each team as soon as
+    its requests complete, so the caller can start processing them while other teams are still fetched.
+    
+    The pairs are grouped per team, so a team playing in several events is requested once for all
+    its events. With dedupe, every match is yielded only once, even when both teams are in the list.
+    
+    Args:
+        team_ids (list): List of Faceit team IDs
+        event_ids (list): Corresponding list of ESEA event IDs (or lists of event IDs)
+        faceit_data_v1 (FaceitData_v1): Data source for fetching matches
+        dedupe (bool): Yield every match_id only once
+        stats (dict): Optional dict that is filled with the discovery counters
+    
+    Yields:
+        list: The matches of one team (dicts with match_id, team_id, event_id and match_time), never empty
+    """
+    team_events = {}
+    for team_id, event_id in zip(team_ids, event_ids):
+        events = team_events.setdefault(team_id, [])
+        for eid in (event_id if isinstance(event_id, list) else [event_id]):
+            if eid not in events:
+                events.append(eid)
+    
+    stats = stats if stats is not None else {}
+    stats.update({'pairs': len(team_ids), 'requests': len(team_events), 'matches': 0, 'duplicates': 0})
+    
+    tasks = [asyncio.ensure_future(gather_esea_matches_team(team_id, events, faceit_data_v1)) for team_id, events in team_events.items()]
+    seen = set()
+    try:
+        for task in asyncio.as_completed(tasks):
+            team_matches = []
+            for match in await task:
+                if dedupe and match['match_id'] in seen:
+                    stats['duplicates'] += 1
+                    continue
+                seen.add(match['match_id'])
+                team_matches.append(match)
+            stats['matches'] += len(team_matches)
+            if team_matches:
+                yield team_matches
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    function_logger.info(
+        f"ESEA discovery: {stats['requests']} team requests for {stats['pairs']} (team, event) pairs, "
+        f"{stats['matches']} matches, {stats['duplicates']} duplicates dropped before ingestion."
+    )
+
 async def gather_esea_matches_team(
     team_id: str, 
     event_id: str | list[str], 
-    faceit_data_v1: FaceitData_v1) -> list:
-    """ Gathers the ESEA matches for a specific team and event(s)"""
+    faceit_data_v1: FaceitData_v1,
+    page_size: int = 20) -> list:
+    """ Gathers the ESEA matches for a specific team and event(s), page by page """
     try:
         # team_id checks
         if not isinstance(team_id, str):
@@ -449,45 +533,53 @@ async def gather_esea_matches_team(
         else:
             event_id = [event_id]      
         
-        data = await faceit_data_v1.league_team_matches(team_id, event_id)
+        match_list = []
+        offset = 0
+        while True:
+            data = await faceit_data_v1.league_team_matches(team_id, event_id, starting_item_position=offset, return_items=page_size)
 
-        if not isinstance(data, dict):
-            msg = f"Expected a dictionary for team {team_id}, got: {type(data)} - {data}"
-            function_logger.critical(msg)
-            raise TypeError(msg)
-        if not data.get('payload'):
-            msg = f"No payload found for team {team_id}: {data}"
-            function_logger.warning(msg)
-            raise ValueError(msg)
-        
-        if not data['payload'].get('items'):
-            msg = f"No matches found for team {team_id} in event(s) {event_id}: {data}"
-            function_logger.info(msg)
-            return []
-        else:
-            match_list = []
-            for match in data['payload']['items']:
-                    origin = match.get("origin", {})
-                    match_id = origin.get("id")
-                    
-                    if not match_id:
-                        function_logger.warning(f"Missing match ID for team {team_id}. Skipping.")
-                        continue
-                    if any(faction.get("id") == "bye" for faction in match.get("factions", [])):
-                        function_logger.info(f"Bye match {match_id} for team {team_id}. Skipping.")
-                        continue
-
-                    schedule = origin.get("schedule")
-                    match_time = int(schedule / 1000) if isinstance(schedule, (int, float)) else None
-
-                    match_list.append({
-                        "match_id": match_id,
-                        "team_id": team_id,
-                        "event_id": match.get("championshipId"),
-                        "match_time": match_time,
-                    })
+            if not isinstance(data, dict):
+                msg = f"Expected a dictionary for team {team_id}, got: {type(data)} - {data}"
+                function_logger.critical(msg)
+                raise TypeError(msg)
+            if not data.get('payload'):
+                msg = f"No payload found for team {team_id}: {data}"
+                function_logger.warning(msg)
+                raise ValueError(msg)
+            
+            items = data['payload'].get('items') or []
+            if not items and offset == 0:
+                msg = f"No matches found for team {team_id} in event(s) {event_id}: {data}"
+                function_logger.info(msg)
+                return []
+            
+            for match in items:
+                origin = match.get("origin", {})
+                match_id = origin.get("id")
+                
+                if not match_id:
+                    function_logger.warning(f"Missing match ID for team {team_id}. Skipping.")
+                    continue
+                if any(faction.get("id") == "bye" for faction in match.get("factions", [])):
+                    function_logger.info(f"Bye match {match_id} for team {team_id}. Skipping.")
+                    continue
+
+                schedule = origin.get("schedule")
+                match_time = int(schedule / 1000) if isinstance(schedule, (int, float)) else None
+
+                match_list.append({
+                    "match_id": match_id,
+                    "team_id": team_id,
+                    "event_id": match.get("championshipId"),
+                    "match_time": match_time,
+                })
+            
+            # A short page means there are no more matches
+            if len(items) < page_size:
+                break
+            offset += page_size
 
-            return match_list
+        return match_list
         
     except Exception as e:
         function_logger.error(f"Fatal error processing team {team_id}: {e}", exc_info=True)
@@ -592,37 +684,105 @@ def filter_esea_matches(
 ### -----------------------------------------------------------------
 ### Hub Data Processing
 ### -----------------------------------------------------------------
-async def gather_hub_matches(hub_id: str, faceit_data: FaceitData):
+async def gather_hub_matches(
+    hub_id: str, 
+    faceit_data: FaceitData, 
+    since: int = None, 
+    max_pages: int = 10, 
+    page_size: int = 100) -> pd.DataFrame:
     """
-    Gathers all the hub matches from a specific hub
+    Gathers the hub matches from a specific hub
+    
+    Without `since` the newest `max_pages` pages are fetched concurrently. With `since` (a high-water
+    mark match_time) the pages are fetched newest-first and paging stops at the first page that reaches
+    back past the mark, so the number of requests scales with the number of new matches.
     
     Args:
         hub_id (str): The ID of the hub to gather matches from
         faceit_data (FaceitData): The FaceitData object to use for API calls
+        since (int): Optional, only return matches with a match_time at or after this timestamp
+        max_pages (int): Maximum number of pages to fetch
+        page_size (int): Number of matches per page (max 100)
     
     Returns:
         df_hub_matches: DataFrame containing match data with columns:
             - match_id: The ID of the match
             - match_time: The time the match was configured
     """
-    tasks = [faceit_data.hub_matches(hub_id=hub_id, starting_item_position=i, return_items=100) for i in range(0, 1000, 100)]
-    results = await gather_with_progress(tasks, desc="Fetching hub matches", unit='matches')
-    extracted_matches = [match for result in results if isinstance(result, dict) and result['items'] for match in result['items']]
+    if since is None:
+        tasks = [faceit_data.hub_matches(hub_id=hub_id, starting_item_position=i, return_items=page_size) for i in range(0, max_pages * page_size, page_size)]
+        results = await gather_with_progress(tasks, desc="Fetching hub matches", unit='matches')
+        extracted_matches = [match for result in results if isinstance(result, dict) and result['items'] for match in result['items']]
+
+        df_hub_matches = pd.DataFrame(extract_hub_matches(extracted_matches))
+        return df_hub_matches
+    
+    pages = []
+    for page in range(max_pages):
+        df_page, item_count = await gather_hub_matches_page(hub_id, faceit_data, offset=page * page_size, limit=page_size)
+        if not df_page.empty:
+            match_time = pd.to_numeric(df_page['match_time'], errors='coerce')
+            pages.append(df_page[match_time.isna() | (match_time >= since)])
+            
+            # Reached the high-water mark, everything after this page is already known
+            if (match_time < since).any():
+                break
+        if item_count < page_size:
+            break
+    else:
+        function_logger.warning(f"Hub {hub_id}: high-water mark {since} not reached within {max_pages} pages.")
     
-    ## Getting df_hub_matches and df_hub_teams_matches
+    function_logger.debug(f"Hub {hub_id}: fetched {page + 1} page(s) since {since}.")
+    if not pages:
+        return pd.DataFrame(columns=['match_id', 'match_time'])
+    return pd.concat(pages, ignore_index=True)
+
+async def gather_hub_matches_page(
+    hub_id: str,
+    faceit_data: FaceitData,
+    offset: int = 0,
+    limit: int = 100,
+    type_of_match: str = "all") -> tuple[pd.DataFrame, int]:
+    """
+    Gathers a single page of hub matches, used by the resumable backfill
+
+    Args:
+        hub_id (str): The ID of the hub to gather matches from
+        faceit_data (FaceitData): The FaceitData object to use for API calls
+        offset (int): The starting item position of the page
+        limit (int): The number of items to request (max 100)
+        type_of_match (str): Kind of matches to return ('all', 'upcoming', 'ongoing' or 'past')
+
+    Returns:
+        tuple:
+            - df_hub_matches (pd.DataFrame): DataFrame with match_id and match_time of the non-cancelled matches
+            - item_count (int): Number of items returned by the API (including cancelled matches), 0 means the history is exhausted
+    """
+    result = await faceit_data.hub_matches(hub_id=hub_id, type_of_match=type_of_match, starting_item_position=offset, return_items=limit)
+
+    if not isinstance(result, dict):
+        msg = f"Unexpected response while fetching hub matches for {hub_id} at offset {offset}: {result}"
+        function_logger.error(msg)
+        raise ValueError(msg)
+
+    items = result.get('items') or []
+    df_hub_matches = pd.DataFrame(extract_hub_matches(items))
+    return df_hub_matches, len(items)
+
+def extract_hub_matches(matches: list) -> list[dict]:
+    """ Extracts the match_id and match_time of all non-cancelled matches from a list of hub match items """
     match_list = []
-    for match in extracted_matches:
+    for match in matches:
         if match.get('status') != "CANCELLED":
             match_id = match.get('match_id')
             # Create a dictionary for the match
             match_dict = {
                 "match_id": match_id,
-                "match_time": match.get('configured_at', None),        
+                "match_time": match.get('configured_at', None),
             }
             match_list.append(match_dict)
-                  
-    df_hub_matches = pd.DataFrame(match_list)
-    return df_hub_matches
+
+    return match_list
 
 if __name__ == "__main__":
     # Allow standalone execution
@@ -6,41 +6,63 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 import pandas as pd
 import numpy as np
 import re
+import time
+import asyncio
+from typing import Any, Callable
+from functools import lru_cache
 
 # API imports
 from data_processing.api.faceit_v4 import FaceitData
 from data_processing.api.faceit_v1 import FaceitData_v1
 from data_processing.api.async_progress import gather_with_progress
 
+from data_processing.dp_stats import add_derived_stats
+
 from logs.update_logger import get_logger
 
 function_logger = get_logger("functions")
 
+# Translation table for modify_keys. FACEIT uses a few hundred distinct keys, so a
+# bounded cache keeps every key we will ever see while capping memory if a payload
+# ever contains free-form keys.
+KEY_CACHE_SIZE = 4096
+_RE_NON_ALNUM = re.compile(r'[^a-zA-Z0-9_]')
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def clean_key(key):
+    """
+    Cleans a single key: '%' becomes 'percent', non-alphanumeric characters become
+    underscores and keys starting with a digit get a leading underscore. Results are memoized.
+    """
+    if not isinstance(key, str):
+        return key
+    
+    # Replace percent signs with 'percent'
+    key = key.replace('%', 'percent')
+    
+    # replace non-alphanumeric characters with underscores
+    key = _RE_NON_ALNUM.sub('_', key)
+    
+    # if starts with a digit
+    if key[:1].isdigit():
+        key = '_' + key
+        
+    return key
+
 def modify_keys(d) -> dict | pd.DataFrame | pd.Series | list:
     """
     Modifies the keys of a dataframe or a dictionary by replacing non-alphanumeric characters with underscores.
     """
     try:
-        def clean_key(key):
-            # Replace percent signs with 'percent'
-            key = key.replace('%', 'percent')
-            
-            # replace non-alphanumeric characters with underscores
-            key = re.sub(r'[^a-zA-Z0-9_]', '_', key)
-            
-            # if starts with a digit
-            if re.match(r'^\d', key):
-                key = '_' + key
-                
-            return key
         ## Check if the input is a dataframe
         if isinstance(d, pd.DataFrame):
-            d = d.rename(columns=lambda x: clean_key(x))
-            return d
+            # Build the mapping once per column instead of calling back per label
+            mapping = {col: clean_key(col) for col in d.columns if clean_key(col) != col}
+            return d.rename(columns=mapping) if mapping else d
         
         elif isinstance(d, pd.Series):
-            d = d.rename(lambda x: clean_key(x))
-            return d
+            mapping = {idx: clean_key(idx) for idx in d.index if clean_key(idx) != idx}
+            return d.rename(mapping) if mapping else d
         
         elif isinstance(d, dict):
             # Create a new dict with modified keys
@@ -211,6 +233,50 @@ async def process_match_details_batch(
     
     return df_matches, df_teams_matches
 
+def extract_match_score(match_details: dict) -> list[dict]:
+    """ Extracts the per-map score ({team_id: score, 'ongoing': bool} per map) from a match_details response """
+    score = []
+    if 'detailed_results' in match_details:
+        detailed_results = match_details['detailed_results']
+        if isinstance(detailed_results, list):
+            for map_result in detailed_results:
+                map_dict = {}
+                if 'winner' in map_result and map_result['winner']:
+                    map_dict['ongoing'] = False
+                else:
+                    map_dict['ongoing'] = True
+                
+                for faction, score_dict in map_result['factions'].items():
+                    team_id = match_details['teams'].get(faction, {}).get('faction_id', None)
+                    team_score = score_dict.get('score', 0)
+                    map_dict[team_id] = team_score
+                
+                score.append(map_dict)
+    return score
+
+async def process_match_live_state(match_id: str, faceit_data: FaceitData) -> dict:
+    """
+    Gathers only the live state of a match: its status and per-map score
+    
+    Returns:
+        dict: match_id, status and score, or an empty dict when the match details could not be fetched
+    """
+    try:
+        match_details = await faceit_data.match_details(match_id)
+        
+        if not isinstance(match_details, dict) or not match_details:
+            msg = f"match_details is not a dictionary: {match_details}"
+            raise TypeError(msg)
+        
+        return {
+            "match_id": match_id,
+            "status": match_details.get('status', None),
+            "score": extract_match_score(match_details),
+        }
+    except Exception as e:
+        function_logger.warning(f"Error gathering live state for match {match_id}: {e}")
+        return {}
+
 async def process_match_details(match_id: str, event_id, faceit_data: FaceitData) -> tuple[dict,list]:
     """ Processes match details for a given match ID. Works with Scheduled, Cancelled, Finished and Ongoing and Ready matches"""
     try:
@@ -249,23 +315,7 @@ async def process_match_details(match_id: str, event_id, faceit_data: FaceitData
             winning_id = match_details['teams'].get(winning_fac, {}).get('faction_id', None)
         
         # Get score for match
-        score = []
-        if 'detailed_results' in match_details:
-            detailed_results = match_details['detailed_results']
-            if isinstance(detailed_results, list):
-                for map_result in detailed_results:
-                    map_dict = {}
-                    if 'winner' in map_result and map_result['winner']:
-                        map_dict['ongoing'] = False
-                    else:
-                        map_dict['ongoing'] = True
-                    
-                    for faction, score_dict in map_result['factions'].items():
-                        team_id = match_details['teams'].get(faction, {}).get('faction_id', None)
-                        team_score = score_dict.get('score', 0)
-                        map_dict[team_id] = team_score
-                    
-                    score.append(map_dict)
+        score = extract_match_score(match_details)
 
         # Get match veto
         map_veto = []
@@ -355,9 +405,11 @@ async def process_match_stats_batch(match_ids, faceit_data: FaceitData) -> tuple
         if not isinstance(df_players_stats, pd.DataFrame):
             df_players_stats = pd.DataFrame(df_players_stats)
         
-        # Add HLTV rating to player stats
+        # Add HLTV rating and the derived stats to player stats
         if not df_players_stats.empty and not df_maps.empty:
             df_players_stats = calculate_hltv(df_players_stats, df_maps)
+            if {'match_id', 'match_round', 'rounds'}.issubset(df_maps.columns):
+                df_players_stats = add_derived_stats(df_players_stats, lookup_map_rounds(df_players_stats, df_maps))
         
         return df_maps, df_teams_maps, df_players_stats
     except Exception as e:
@@ -442,6 +494,55 @@ async def process_match_stats(match_id: str, faceit_data: FaceitData) -> tuple[l
         function_logger.error(f"Error processing match stats for match ID {match_id}: {e}", exc_info=True)
         return [], [], []
 
+# --- Constants for HLTV rating ---
+HLTV_AVG_KPR = 0.679 # avg kill per round
+HLTV_AVG_SPR = 0.317 # avg survived rounds per round
+HLTV_AVG_RMK = 1.277 # avg value calculated from rounds with multi-kills
+
+def hltv_kernel(
+    kills: np.ndarray, 
+    deaths: np.ndarray, 
+    rounds: np.ndarray, 
+    double_kills: np.ndarray, 
+    triple_kills: np.ndarray, 
+    quadro_kills: np.ndarray, 
+    penta_kills: np.ndarray) -> np.ndarray:
+    """
+    Calculates the HLTV 1.0 rating from column arrays of equal length.
+    
+    Rows without a positive number of rounds (or with missing stats) get NaN.
+    
+    Returns:
+        np.ndarray: The HLTV ratings rounded to 2 decimals
+    """
+    kills, deaths, rounds = (np.asarray(a, dtype=np.float64) for a in (kills, deaths, rounds))
+    double_kills, triple_kills, quadro_kills, penta_kills = (
+        np.asarray(a, dtype=np.float64) for a in (double_kills, triple_kills, quadro_kills, penta_kills)
+    )
+    
+    # Calculate number of single kills
+    single_kills = kills - (2 * double_kills + 3 * triple_kills + 4 * quadro_kills + 5 * penta_kills)
+    
+    # Avoid division by zero
+    rounds = np.where(rounds > 0, rounds, np.nan)
+    
+    kill_rating = kills / rounds / HLTV_AVG_KPR
+    survival_rating = (rounds - deaths) / rounds / HLTV_AVG_SPR
+    multi_kill_rating = (
+        single_kills + 4 * double_kills + 9 * triple_kills + 16 * quadro_kills + 25 * penta_kills
+    ) / rounds / HLTV_AVG_RMK
+    
+    return np.round((kill_rating + 0.7 * survival_rating + multi_kill_rating) / 2.7, 2)
+
+def lookup_map_rounds(df_players_stats: pd.DataFrame, df_maps: pd.DataFrame) -> np.ndarray:
+    """ Returns the number of rounds of the map of every df_players_stats row (NaN when the map is unknown) """
+    map_rounds = df_maps.drop_duplicates(subset=['match_id', 'match_round']).set_index(['match_id', 'match_round'])['rounds']
+    positions = map_rounds.index.get_indexer(pd.MultiIndex.from_frame(df_players_stats[['match_id', 'match_round']]))
+    rounds = pd.to_numeric(map_rounds, errors='coerce').to_numpy(dtype=np.float64)
+    if not len(rounds):
+        return np.full(len(positions), np.nan)
+    return np.where(positions >= 0, rounds[positions], np.nan)
+
 def calculate_hltv(df_players_stats: pd.DataFrame, df_maps: pd.DataFrame) -> pd.DataFrame:
     """
     Calculate HLTV rating for players based on their stats.
@@ -451,7 +552,7 @@ def calculate_hltv(df_players_stats: pd.DataFrame, df_maps: pd.DataFrame) -> pd.
         df_maps (pd.DataFrame): DataFrame containing map details
     
     Returns:
-        df_players_stats (pd.DataFrame): DataFrame with added HLTV rating
+        df_players_stats (pd.DataFrame): df_players_stats with the hltv column added
     """
     try:
         # --- Validate inputs ---
@@ -481,53 +582,24 @@ def calculate_hltv(df_players_stats: pd.DataFrame, df_maps: pd.DataFrame) -> pd.
         if missing_maps:
             raise ValueError(f"Missing required columns in df_maps: {missing_maps}")
         
-        # --- Merge dataframes ---
-        df = df_players_stats.copy()
-        df = df.merge(df_maps[['match_id', 'match_round', 'rounds']], on=['match_id', 'match_round'], how='left')
-        
-        # Drop rows where 'rounds' is missing
-        df = df.dropna(subset=['rounds'])
-        df['rounds'] = df['rounds'].astype(int)
-        
-        # --- Constants for HLTV rating ---
-        avg_kpr = 0.679 # avg kill per round
-        avg_spr = 0.317 # avg survived rounds per round
-        avg_rmk = 1.277 # avg value calculated from rounds with multi-kills
+        rounds = lookup_map_rounds(df_players_stats, df_maps)
         
-        # --- Compute intermediate stats ---
+        column = lambda name: pd.to_numeric(df_players_stats[name], errors='coerce').to_numpy(dtype=np.float64)
         try:
-            # Calculate number of single kills
-            df['single_kills'] = df['kills'] - (
-                2 * df['double_kills'] +
-                3 * df['triple_kills'] +
-                4 * df['quadro_kills'] +
-                5 * df['penta_kills']
+            df_players_stats['hltv'] = hltv_kernel(
+                kills=column('kills'),
+                deaths=column('deaths'),
+                rounds=rounds,
+                double_kills=column('double_kills'),
+                triple_kills=column('triple_kills'),
+                quadro_kills=column('quadro_kills'),
+                penta_kills=column('penta_kills'),
             )
-
-            # Avoid division by zero
-            df['rounds'] = df['rounds'].replace(0, np.nan)
-
-            # Compute ratings
-            df['kill_rating'] = df['kills'] / df['rounds'] / avg_kpr
-            df['survival_rating'] = (df['rounds'] - df['deaths']) / df['rounds'] / avg_spr
-            df['multi_kill_rating'] = (
-                df['single_kills'] +
-                4 * df['double_kills'] +
-                9 * df['triple_kills'] +
-                16 * df['quadro_kills'] +
-                25 * df['penta_kills']
-            ) / df['rounds'] / avg_rmk
-
-            # Final HLTV rating
-            df['hltv'] = (df['kill_rating'] + 0.7 * df['survival_rating'] + df['multi_kill_rating']) / 2.7
-            df['hltv'] = df['hltv'].round(2)
-        
         except Exception as e:
             function_logger.error(f"Error in HLTV calculation: {e}", exc_info=True)
-            df['hltv'] = None
+            df_players_stats['hltv'] = None
         
-        # Drop intermediate columns
-        return df_players_stats.join(df['hltv'])
+        return df_players_stats
     
     except Exception as e:
         function_logger.error(f"Error calculating HLTV rating: {e}", exc_info=True)
@@ -547,13 +619,31 @@ def string_to_number(value):
 ### Player details functions
 ### -----------------------------------------------------------------
 
-async def process_player_details_batch(player_ids: list[str], faceit_data_v1: FaceitData_v1) -> pd.DataFrame:
+# Adaptive chunking for player_details_batch: the chunk size grows additively while the API answers
+# fast and without errors, and is halved when a wave gets slow or chunks fail (AIMD)
+PLAYER_BATCH_MIN = 5
+PLAYER_BATCH_START = 15
+PLAYER_BATCH_MAX = 100
+PLAYER_BATCH_STEP = 5
+PLAYER_BATCH_TARGET_LATENCY = 2.0   # seconds per chunk request
+PLAYER_BATCH_PARALLEL = 5           # chunks requested concurrently per wave
+
+async def process_player_details_batch(
+    player_ids: list[str], 
+    faceit_data_v1: FaceitData_v1,
+    on_chunk: Callable[[pd.DataFrame], Any] | None = None) -> pd.DataFrame:
     """
     Processes player details for a batch of player IDs.
     
+    The IDs are requested in waves of PLAYER_BATCH_PARALLEL chunks. After every wave the chunk
+    size is tuned on the observed latency and error rate, and the IDs of failed chunks are retried
+    once in the next wave.
+    
     Args:
         player_ids (list): List of player IDs to process
         faceit_data_v1 (FaceitData_v1): FaceitData_v1 object for API calls
+        on_chunk (callable): Optional (async) callback that receives the DataFrame of every finished wave,
+            e.g. to upload it right away. When given, the waves are not kept and an empty DataFrame is returned.
         
     Returns:
         df_players (pd.DataFrame): DataFrame containing player details
@@ -564,36 +654,80 @@ async def process_player_details_batch(player_ids: list[str], faceit_data_v1: Fa
             msg = "No player IDs provided for processing."
             raise ValueError(msg)
         
-        batch_size = 15  # Adjust the batch size as needed
-        tasks = [
-            process_player_details(list(player_ids[i:i + batch_size]), faceit_data_v1=faceit_data_v1)
-            for i in range(0, len(player_ids), batch_size)
-        ]
-        results = await gather_with_progress(tasks, desc="Processing player details", unit="players")
-
-        # Flatten the list of lists into a single list
-        player_list = [player for sublist in results for player in sublist if player is not None]
-        
-        df_players = pd.DataFrame(player_list)
-        
-        # Modify the faceit_elo and faceit_level columns to be integers
-        if 'faceit_elo' in df_players.columns:
-            df_players['faceit_elo'] = pd.to_numeric(df_players['faceit_elo'], errors='coerce').fillna(0).astype(int)
-        if 'faceit_level' in df_players.columns:
-            df_players['faceit_level'] = pd.to_numeric(df_players['faceit_level'], errors='coerce').fillna(0).astype(int)
+        pending = list(dict.fromkeys(player_ids))
+        retried = set()
+        batch_size = PLAYER_BATCH_START
+        frames = []
+        n_players, n_failed = 0, 0
         
-        ## Modify the keys to work with the database
-        df_players = modify_keys(df_players)
+        while pending:
+            chunks = [pending[i:i + batch_size] for i in range(0, min(len(pending), batch_size * PLAYER_BATCH_PARALLEL), batch_size)]
+            pending = pending[sum(len(chunk) for chunk in chunks):]
+            
+            start = time.monotonic()
+            results = await asyncio.gather(*(process_player_details(chunk, faceit_data_v1=faceit_data_v1) for chunk in chunks))
+            latency = (time.monotonic() - start)
+            
+            # Chunks that returned nothing are retried once
+            failed = [chunk for chunk, result in zip(chunks, results) if not result]
+            for chunk in failed:
+                retry_ids = [player_id for player_id in chunk if player_id not in retried]
+                retried.update(retry_ids)
+                pending.extend(retry_ids)
+                n_failed += len(chunk) - len(retry_ids)
+            
+            # Tune the chunk size for the next wave
+            if failed or latency > PLAYER_BATCH_TARGET_LATENCY:
+                batch_size = max(PLAYER_BATCH_MIN, batch_size // 2)
+            else:
+                batch_size = min(PLAYER_BATCH_MAX, batch_size + PLAYER_BATCH_STEP)
+            
+            player_list = [player for sublist in results for player in sublist if player is not None]
+            if not player_list:
+                continue
+            
+            df_chunk = clean_player_details(player_list)
+            n_players += len(df_chunk)
+            if on_chunk is None:
+                frames.append(df_chunk)
+            else:
+                res = on_chunk(df_chunk)
+                if asyncio.iscoroutine(res):
+                    await res
+            
+            function_logger.debug(
+                f"Player details wave: {len(df_chunk)} players, {len(failed)}/{len(chunks)} chunks failed, "
+                f"{latency:.2f}s, next batch size {batch_size}"
+            )
         
-        if not isinstance(df_players, pd.DataFrame):
-            df_players = pd.DataFrame(df_players)
+        function_logger.info(f"Processed player details for {n_players}/{len(player_ids)} players ({n_failed} failed).")
         
-        return df_players
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
     
     except Exception as e:
         function_logger.warning(f"Error processing player details batch for {player_ids}: {e}", exc_info=True)
         return pd.DataFrame()
 
+def clean_player_details(player_list: list[dict]) -> pd.DataFrame:
+    """ Turns a list of player dicts into the DataFrame layout of the players table """
+    df_players = pd.DataFrame(player_list)
+    
+    # Modify the faceit_elo and faceit_level columns to be integers
+    if 'faceit_elo' in df_players.columns:
+        df_players['faceit_elo'] = pd.to_numeric(df_players['faceit_elo'], errors='coerce').fillna(0).astype(int)
+    if 'faceit_level' in df_players.columns:
+        df_players['faceit_level'] = pd.to_numeric(df_players['faceit_level'], errors='coerce').fillna(0).astype(int)
+    
+    ## Modify the keys to work with the database
+    df_players = modify_keys(df_players)
+    
+    if not isinstance(df_players, pd.DataFrame):
+        df_players = pd.DataFrame(df_players)
+    
+    return df_players
+
 async def process_player_details(player_ids: list[str] | str, faceit_data_v1: FaceitData_v1) -> list[dict]:
     try:
         if not isinstance(player_ids, list):
@@ -642,13 +776,61 @@ async def process_player_details(player_ids: list[str] | str, faceit_data_v1: Fa
 ### Team details functions
 ### -----------------------------------------------------------------
 
-async def process_team_details_batch(team_ids: list[str], faceit_data: FaceitData) -> pd.DataFrame:
+# Team profiles (name, nickname, avatar) rarely change, so they are kept in memory for
+# TEAM_PROFILE_TTL seconds: {team_id: (fetched_at, team_dict)}
+TEAM_PROFILE_TTL = 6 * 60 * 60
+_TEAM_PROFILE_CACHE: dict[str, tuple[float, dict]] = {}
+
+def get_cached_team_profiles(team_ids: list[str], max_age: float = TEAM_PROFILE_TTL) -> tuple[dict[str, dict], list[str]]:
+    """
+    Looks up team profiles in the cache.
+    
+    Returns:
+        tuple:
+            - hits (dict): {team_id: team_dict} for the teams fetched less than max_age seconds ago
+            - misses (list): Team IDs that are not cached or expired
+    """
+    now = time.time()
+    hits, misses = {}, []
+    for team_id in dict.fromkeys(team_ids):
+        cached = _TEAM_PROFILE_CACHE.get(team_id)
+        if cached and now - cached[0] < max_age:
+            hits[team_id] = cached[1]
+        else:
+            misses.append(team_id)
+    return hits, misses
+
+async def refresh_team_profiles(team_ids: list[str], faceit_data: FaceitData) -> dict[str, dict]:
+    """
+    Fetches the team profiles for all given team IDs concurrently and stores them in the cache.
+    
+    Returns:
+        dict: {team_id: team_dict} for the teams that were fetched successfully
+    """
+    team_ids = list(dict.fromkeys(team_ids))
+    if not team_ids:
+        return {}
+    
+    tasks = [process_team_details(team_id, faceit_data=faceit_data) for team_id in team_ids]
+    results = await gather_with_progress(tasks, desc="Processing team details", unit="teams")
+    
+    now = time.time()
+    teams = {}
+    for team in results:
+        if team and isinstance(team, dict) and team.get('team_id'):
+            _TEAM_PROFILE_CACHE[team['team_id']] = (now, team)
+            teams[team['team_id']] = team
+    return teams
+
+async def process_team_details_batch(team_ids: list[str], faceit_data: FaceitData, max_age: float = TEAM_PROFILE_TTL) -> pd.DataFrame:
     """
-    Processes team details for a batch of team IDs.
+    Processes team details for a batch of team IDs. Only teams that are not in the profile cache
+    (or older than max_age seconds) are requested from the API.
     
     Args:
         team_ids (list): List of team IDs to process
         faceit_data (FaceitData): FaceitData object for API calls
+        max_age (float): Maximum age in seconds of a cached profile, 0 forces a refresh of all teams
         
     Returns:
         df_teams (pd.DataFrame): DataFrame containing team details
@@ -658,17 +840,13 @@ async def process_team_details_batch(team_ids: list[str], faceit_data: FaceitDat
             msg = "No team IDs provided for processing."
             raise ValueError(msg)
         
-        tasks = [process_team_details(team_id, faceit_data=faceit_data) for team_id in team_ids]
-        results = await gather_with_progress(tasks, desc="Processing team details", unit="teams")
+        hits, misses = get_cached_team_profiles(team_ids, max_age=max_age)
+        if misses:
+            hits.update(await refresh_team_profiles(misses, faceit_data=faceit_data))
+        function_logger.debug(f"Team details: {len(team_ids) - len(misses)} cached, {len(misses)} fetched")
 
         # Remove empty results
-        team_list = [
-            team 
-            for team in results 
-            if team 
-            and isinstance(team, dict) 
-            and team.get('team_id')
-        ]
+        team_list = [hits[team_id] for team_id in dict.fromkeys(team_ids) if team_id in hits]
         if not team_list:
             msg = "No valid team details found in batch"
             raise ValueError(msg)
@@ -0,0 +1,124 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pandas as pd
+import numpy as np
+from typing import Callable
+
+from logs.update_logger import get_logger
+function_logger = get_logger("functions")
+
+### -----------------------------------------------------------------
+### Derived per-map player stats
+### -----------------------------------------------------------------
+# Every derived stat is a vectorized function over the column arrays of players_stats (plus the
+# 'rounds' of the map) and is stored as a DOUBLE PRECISION column with the same name.
+# Adding a stat is registering a function here and running database/db_schema.py to add the column.
+
+DERIVED_STATS: dict[str, dict] = {}
+
+def derived_stat(name: str, requires: tuple[str, ...]):
+    """ Registers a derived stat. The function gets one float64 array per required column. """
+    def register(func: Callable[..., np.ndarray]) -> Callable[..., np.ndarray]:
+        DERIVED_STATS[name] = {'requires': requires, 'func': func}
+        return func
+    return register
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """ numerator / denominator, NaN where the denominator is not positive """
+    return numerator / np.where(denominator > 0, denominator, np.nan)
+
+@derived_stat("kpr", requires=("kills", "rounds"))
+def kills_per_round(kills, rounds):
+    return _ratio(kills, rounds)
+
+@derived_stat("dpr", requires=("deaths", "rounds"))
+def deaths_per_round(deaths, rounds):
+    return _ratio(deaths, rounds)
+
+@derived_stat("apr", requires=("assists", "rounds"))
+def assists_per_round(assists, rounds):
+    return _ratio(assists, rounds)
+
+@derived_stat("multi_kill_rate", requires=("double_kills", "triple_kills", "quadro_kills", "penta_kills", "rounds"))
+def multi_kill_rate(double_kills, triple_kills, quadro_kills, penta_kills, rounds):
+    """ Share of rounds with 2 or more kills """
+    return _ratio(double_kills + triple_kills + quadro_kills + penta_kills, rounds)
+
+@derived_stat("kast_approx", requires=("kills", "assists", "deaths", "double_kills", "triple_kills", "quadro_kills", "penta_kills", "rounds"))
+def kast_approx(kills, assists, deaths, double_kills, triple_kills, quadro_kills, penta_kills, rounds):
+    """
+    Approximated KAST (trades are not available). The rounds with a kill are exact from the multi-kill
+    counts; rounds with a kill or assist are assumed to be spread evenly over the rounds the player
+    survived and died, so KAST = (survived + deaths * contribution rate) / rounds.
+    """
+    rounds_with_kill = kills - (double_kills + 2 * triple_kills + 3 * quadro_kills + 4 * penta_kills)
+    contribution_rate = np.minimum(1.0, _ratio(rounds_with_kill + assists, rounds))
+    survived = np.maximum(rounds - deaths, 0)
+    return np.clip(_ratio(survived + deaths * contribution_rate, rounds), 0.0, 1.0)
+
+@derived_stat("first_kills_per_round", requires=("first_kills", "rounds"))
+def first_kills_per_round(first_kills, rounds):
+    return _ratio(first_kills, rounds)
+
+@derived_stat("entry_success_rate", requires=("entry_wins", "entry_count"))
+def entry_success_rate(entry_wins, entry_count):
+    """ Share of opening duels won """
+    return _ratio(entry_wins, entry_count)
+
+@derived_stat("clutch_1v1_rate", requires=("_1v1wins", "_1v1count"))
+def clutch_1v1_rate(wins, count):
+    return _ratio(wins, count)
+
+@derived_stat("clutch_1v2_rate", requires=("_1v2wins", "_1v2count"))
+def clutch_1v2_rate(wins, count):
+    return _ratio(wins, count)
+
+@derived_stat("flash_success_rate", requires=("flash_successes", "flash_count"))
+def flash_success_rate(flash_successes, flash_count):
+    return _ratio(flash_successes, flash_count)
+
+@derived_stat("utility_damage_per_round", requires=("utility_damage", "rounds"))
+def utility_damage_per_round(utility_damage, rounds):
+    return _ratio(utility_damage, rounds)
+
+def add_derived_stats(df_players_stats: pd.DataFrame, rounds: np.ndarray, decimals: int = 4) -> pd.DataFrame:
+    """
+    Computes all registered derived stats and adds them as columns to df_players_stats.
+    Stats whose source columns are missing (e.g. older match stats payloads) are skipped.
+
+    Args:
+        df_players_stats (pd.DataFrame): DataFrame containing player stats per map
+        rounds (np.ndarray): Number of rounds of the map of every row
+        decimals (int): Number of decimals to round to
+
+    Returns:
+        df_players_stats (pd.DataFrame): df_players_stats with the derived stat columns added
+    """
+    columns = {'rounds': np.asarray(rounds, dtype=np.float64)}
+    for name, stat in DERIVED_STATS.items():
+        try:
+            missing = [col for col in stat['requires'] if col not in columns and col not in df_players_stats.columns]
+            if missing:
+                function_logger.debug(f"Skipping derived stat {name}, missing columns: {missing}")
+                continue
+
+            for col in stat['requires']:
+                if col not in columns:
+                    columns[col] = pd.to_numeric(df_players_stats[col], errors='coerce').to_numpy(dtype=np.float64)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = stat['func'](*(columns[col] for col in stat['requires']))
+            df_players_stats[name] = np.round(values, decimals)
+        except Exception as e:
+            function_logger.error(f"Error computing derived stat {name}: {e}", exc_info=True)
+
+    return df_players_stats
+
+if __name__ == "__main__":
+    # Allow standalone execution
+    import sys
+    import os
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
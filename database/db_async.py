@@ -0,0 +1,55 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database.db_manage import DB_POOL_MAX
+
+### -----------------------------------------------------------------
+### Async access to the (synchronous) database functions
+### -----------------------------------------------------------------
+# The update jobs are coroutines, calling a psycopg2 function directly blocks their event loop (and
+# with it the API dispatcher) for the duration of the query. run_db runs the function in a dedicated
+# thread pool instead, so API requests and database work of a job can overlap. The executor is kept
+# smaller than the connection pool, so the website keeps connections available during big updates.
+#
+# In the web process eventlet turns the pool threads into green threads. The queries only overlap there
+# because psycopg2 yields to the eventlet hub while it waits, see db_manage.enable_green_psycopg().
+
+DB_EXECUTOR_WORKERS = max(1, DB_POOL_MAX // 2)
+
+_EXECUTOR = None
+_EXECUTOR_PID = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """ Returns the database thread pool of this process """
+    global _EXECUTOR, _EXECUTOR_PID
+    if _EXECUTOR is None or _EXECUTOR_PID != os.getpid():
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None or _EXECUTOR_PID != os.getpid():
+                _EXECUTOR = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+                _EXECUTOR_PID = os.getpid()
+    return _EXECUTOR
+
+async def run_db(func, *args, **kwargs):
+    """
+    Runs a synchronous database function in the database thread pool and awaits its result.
+
+    Example:
+        df_players = await run_db(gather_players, benelux=True)
+        await run_db(upload_data, 'players', df_players)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+if __name__ == "__main__":
+    # Allow standalone execution
+    import sys
+    import os
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
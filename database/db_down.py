@@ -284,6 +284,8 @@ def gather_season_numbers_from_event_ids(event_ids: list = []) -> list:
     except Exception as e:
         print(f"Error gathering season numbers from event IDs: {e}")
         return []
+    finally:
+        close_database(db)
         
 
 if __name__ == "__main__":
@@ -13,80 +13,74 @@ from logs.update_logger import get_logger
 function_logger = get_logger("functions")
 
 
+def event_players_query(PAST: bool = False) -> str:
+    """
+    Builds the roster query used by gather_event_players. It takes two equal-length text arrays
+    (event_ids, team_ids) and returns one row per pair with the players_main (top 5 by maps played) 
+    and players_sub rosters as JSON.
+    """
+    return f"""
+        WITH pairs AS (
+            SELECT DISTINCT event_id, team_id
+            FROM unnest(%s::text[], %s::text[]) AS pr(event_id, team_id)
+        ),
+        player_counts AS (
+            SELECT
+                m.event_id,
+                ps.team_id,
+                ps.player_id,
+                MAX(p.player_name) AS player_name,
+                COUNT(*) AS maps_played
+            FROM pairs pr
+            JOIN matches m ON m.event_id = pr.event_id
+            JOIN players_stats ps ON ps.match_id = m.match_id AND ps.team_id = pr.team_id
+            LEFT JOIN players p ON ps.player_id = p.player_id
+            {"JOIN events e ON m.event_id = e.event_id AND e.event_end < extract(epoch from now())" if PAST else ""}
+            GROUP BY m.event_id, ps.team_id, ps.player_id
+        ),
+        ranked AS (
+            SELECT
+                *,
+                ROW_NUMBER() OVER (PARTITION BY event_id, team_id ORDER BY maps_played DESC, player_id) AS player_rank
+            FROM player_counts
+        )
+        SELECT
+            event_id,
+            team_id,
+            COALESCE(
+                json_agg(json_build_object('player_id', player_id, 'player_name', player_name) ORDER BY player_rank)
+                FILTER (WHERE player_rank <= 5), '[]'::json
+            ) AS players_main,
+            COALESCE(
+                json_agg(json_build_object('player_id', player_id, 'player_name', player_name) ORDER BY player_rank)
+                FILTER (WHERE player_rank > 5), '[]'::json
+            ) AS players_sub
+        FROM ranked
+        GROUP BY event_id, team_id
+    """
+
 def gather_event_players(event_ids: list, team_ids: list, PAST: bool = False) -> pd.DataFrame:
     """
     Gathers players for each (event_id, team_id) pair.
     Assumes event_ids and team_ids are equal-length lists, where each index defines a pair.
+    
+    Returns:
+        pd.DataFrame: event_id, team_id, players_main and players_sub (lists of {player_id, player_name}),
+        the 5 players with the most maps played are the main players
     """
     if len(event_ids) != len(team_ids):
         raise ValueError("event_ids and team_ids must be the same length.")
+    
+    if not event_ids:
+        return pd.DataFrame()
 
     db, cursor = start_database()
     
     try:
-        base_query = """
-            SELECT
-                ps.player_id,
-                ps.team_id,
-                ps.match_id,
-                p.player_name,
-                m.event_id,
-                e.event_end
-            FROM players_stats ps
-            LEFT JOIN players p ON ps.player_id = p.player_id
-            LEFT JOIN matches m ON ps.match_id = m.match_id
-            LEFT JOIN events e ON m.event_id = e.event_id
-        """
-
-        filters = []
-        params = []
-
-        # Create OR conditions for (event_id, team_id) pairs
-        pair_clauses = []
-        for ev_id, tm_id in zip(event_ids, team_ids):
-            pair_clauses.append("(m.event_id = %s AND ps.team_id = %s)")
-            params.extend([ev_id, tm_id])
-        filters.append(" OR ".join(pair_clauses))
-
-        if PAST:
-            filters.append("e.event_end < extract(epoch from now())")
-
-        if filters:
-            base_query += " WHERE " + " AND ".join(f"({f})" for f in filters)
-
-        cursor.execute(base_query, params)
+        cursor.execute(event_players_query(PAST=PAST), (list(event_ids), list(team_ids)))
         res = cursor.fetchall()
-        columns = ['player_id', 'team_id', 'match_id', 'player_name', 'event_id', 'event_end']
-        data = pd.DataFrame(res, columns=columns)
-
-        event_players = []
-        for (event_id, team_id), group in data.groupby(['event_id', 'team_id']):
-            # Get player match counts, sorted descending
-            player_counts = group.groupby('player_id').size().sort_values(ascending=False)
-
-            # Split into top 5 and the rest
-            main_ids = player_counts.head(5).index.tolist()
-
-            players_main, players_sub = [], []
-            for player_id in player_counts.index:
-                player_name = group[group['player_id'] == player_id]['player_name'].iloc[0]
-                player_data = {
-                    'player_id': player_id,
-                    'player_name': player_name
-                }
-                if player_id in main_ids:
-                    players_main.append(player_data)
-                else:
-                    players_sub.append(player_data)
-
-            event_players.append({
-                'event_id': event_id,
-                'team_id': team_id,
-                'players_main': players_main,
-                'players_sub': players_sub
-            })
-
-        return pd.DataFrame(event_players)
+        
+        return pd.DataFrame(res, columns=['event_id', 'team_id', 'players_main', 'players_sub'])
 
     except PostgresError as e:
         function_logger.error(f"Error gathering event players: {e}")
@@ -138,9 +132,11 @@ def gather_event_teams(event_ids: list = [], ONGOING: bool = False, ESEA: bool =
     except Exception as e:
         function_logger.error(f"Error gathering event teams: {e}")
         return pd.DataFrame()
+    finally:
+        close_database(db)
 
 def gather_event_matches(event_ids: list) -> list:
-    """ Gathers all matches for each (event_id, team_id) pair"""
+    """ Gathers all match ids for the given events """
     db, cursor = start_database()
     try:
         query_base = """
@@ -162,6 +158,75 @@ def gather_event_matches(event_ids: list) -> list:
     finally:
         close_database(db)
 
+def gather_new_match_ids(match_ids: list, event_ids: list = None) -> list:
+    """ 
+    Returns the candidate match ids that are not stored in the matches table yet.
+    
+    The candidates are sent as one array parameter and anti-joined against matches on its primary key,
+    so the cost depends on the number of candidates and not on the size of the table.
+    
+    Args:
+        match_ids (list): Candidate match IDs
+        event_ids (list): Optional, only count a match as stored when it belongs to one of these events
+    
+    Returns:
+        list: The unseen match IDs, in the order of the candidates
+    
+    Raises:
+        Exception: Database errors are raised, an empty list always means that no match is new
+    """
+    match_ids = [match_id for match_id in dict.fromkeys(match_ids) if match_id]
+    if not match_ids:
+        return []
+    
+    db, cursor = start_database()
+    try:
+        query = """
+            SELECT c.match_id
+            FROM unnest(%s::text[]) WITH ORDINALITY AS c(match_id, ord)
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM matches m
+                WHERE m.match_id = c.match_id
+                {}
+            )
+            ORDER BY c.ord
+        """
+        params = [match_ids]
+        if event_ids:
+            query = query.format("AND m.event_id = ANY(%s::text[])")
+            params.append(list(dict.fromkeys(event_ids)))
+        else:
+            query = query.format("")
+        cursor.execute(query, params)
+        return [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        function_logger.error(f"Error gathering new match ids: {e}")
+        raise
+    finally:
+        close_database(db)
+
+def gather_event_high_water_mark(event_id: str) -> int | None:
+    """ 
+    Gathers the match_time of the newest finished match stored for an event, 
+    or None when the event has no finished matches yet 
+    """
+    db, cursor = start_database()
+    try:
+        query = """
+            SELECT MAX(match_time)
+            FROM matches
+            WHERE event_id = %s AND status = 'FINISHED'
+        """
+        cursor.execute(query, (event_id,))
+        row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+    except Exception as e:
+        function_logger.error(f"Error gathering high-water mark for event {event_id}: {e}")
+        return None
+    finally:
+        close_database(db)
+
 def gather_internal_event_ids(event_ids: list) -> pd.DataFrame:
     db, cursor = start_database()
     try:
@@ -181,6 +246,8 @@ def gather_internal_event_ids(event_ids: list) -> pd.DataFrame:
     except Exception as e:
         function_logger.error(f"Error gathering internal event IDs: {e}")
         return pd.DataFrame()
+    finally:
+        close_database(db)
 
 def gather_upcoming_matches() -> pd.DataFrame:
     db, cursor = start_database()
@@ -368,6 +435,80 @@ def gather_ongoing_matches() -> pd.DataFrame:
     
     return df_ongoing
 
+def gather_backfill_checkpoint(source: str) -> dict:
+    """
+    Gathers the stored backfill checkpoint for a source, or an empty dict when there is none
+    
+    Raises:
+        Exception: Database errors, so a backfill never restarts from offset 0 over its saved progress
+    """
+    db, cursor = start_database()
+    try:
+        query = """
+            SELECT
+                source,
+                page_offset,
+                last_match_id,
+                processed_matches,
+                finished,
+                updated_at
+            FROM backfill_checkpoints
+            WHERE source = %s
+        """
+        cursor.execute(query, (source,))
+        row = cursor.fetchone()
+        if not row:
+            return {}
+
+        return dict(zip([desc[0] for desc in cursor.description], row))
+    except Exception as e:
+        function_logger.error(f"Error gathering backfill checkpoint for {source}: {e}")
+        raise
+    finally:
+        close_database(db)
+
+def gather_players_stats_hltv_chunk(after_key: tuple = None, limit: int = 50000) -> pd.DataFrame:
+    """
+    Gathers a chunk of players_stats rows with the stats needed for the HLTV rating, in primary key order.
+    
+    Args:
+        after_key (tuple): (player_id, match_id, match_round) of the last row of the previous chunk, None for the first chunk
+        limit (int): Maximum number of rows in the chunk
+    
+    Raises:
+        Exception: Database errors, an empty DataFrame always means the end of the table
+    """
+    db, cursor = start_database()
+    try:
+        query = f"""
+            SELECT
+                ps.player_id,
+                ps.match_id,
+                ps.match_round,
+                ps.kills,
+                ps.deaths,
+                ps.double_kills,
+                ps.triple_kills,
+                ps.quadro_kills,
+                ps.penta_kills,
+                ps.hltv,
+                mp.rounds
+            FROM players_stats ps
+            LEFT JOIN maps mp ON ps.match_id = mp.match_id AND ps.match_round = mp.match_round
+            {"WHERE (ps.player_id, ps.match_id, ps.match_round) > (%s, %s, %s)" if after_key else ""}
+            ORDER BY ps.player_id, ps.match_id, ps.match_round
+            LIMIT %s
+        """
+        params = [*after_key, limit] if after_key else [limit]
+        cursor.execute(query, params)
+        res = cursor.fetchall()
+        return pd.DataFrame(res, columns=[desc[0] for desc in cursor.description])
+    except Exception as e:
+        function_logger.error(f"Error gathering players_stats chunk for HLTV: {e}")
+        raise
+    finally:
+        close_database(db)
+
 def gather_teams_benelux_primary():
     db, cursor = start_database()
     try:
@@ -13,6 +13,7 @@ from psycopg2.extras import RealDictCursor
 import base64
 
 from database.db_manage import start_database, close_database
+from database.db_meta import get_table_schema, players_stats_stat_columns, summary_stat_columns
 from database.db_down import get_player_aliases
 
 from logs.update_logger import get_logger
@@ -53,6 +54,16 @@ def gather_columns_mapping():
         'headshots_percent':    {'name': 'HS %',        'round': 0},
         'hltv':                 {'name': 'HLTV',    'round': 2, 'good': 1.05, 'bad': 0.95},
         'maps_played':          {'name': 'Maps Played', 'round': 0},
+        
+        # Derived per map at ingest, see data_processing/dp_stats.py
+        'kpr':                  {'name': 'KPR',         'round': 2},
+        'dpr':                  {'name': 'DPR',         'round': 2},
+        'apr':                  {'name': 'APR',         'round': 2},
+        'kast_approx':          {'name': 'KAST',        'round': 2},
+        'multi_kill_rate':      {'name': 'Multi-kill Rate', 'round': 2},
+        'first_kills_per_round': {'name': 'First Kills/Round', 'round': 2},
+        'entry_success_rate':   {'name': 'Entry Success', 'round': 2},
+        'utility_damage_per_round': {'name': 'Utility Damage/Round', 'round': 1},
     }
     
     return columns_mapping
@@ -680,11 +691,12 @@ def get_esea_player_of_the_week() -> list:
             "adr": "ADR",
             "knife_kills": "Knife Kills",
             "penta_kills": "Aces",
-            "zeus_kills": "Zeus Kills"
+            "zeus_kills": "Zeus Kills",
+            "kast_approx": "KAST"
         }
         
         # Get average stats for the week
-        avg_columns = ",\n    ".join([f"AVG(ps.{key})::numeric AS {key}" for key in stats_to_check.keys()])
+        avg_columns = ",\n    ".join([f"COALESCE(AVG(ps.{key}), 0)::numeric AS {key}" for key in stats_to_check.keys()])
         query_avg = f"""
             SELECT
                 {avg_columns}
@@ -718,7 +730,9 @@ def get_esea_player_of_the_week() -> list:
                 ROUND(AVG(ps.adr)::numeric, 0) AS adr,
                 SUM(ps.knife_kills) AS knife_kills,
                 SUM(ps.penta_kills) AS penta_kills,
-                SUM(ps.zeus_kills) AS zeus_kills
+                SUM(ps.zeus_kills) AS zeus_kills,
+                -- Derived per map at ingest, the approximation can not be rebuilt from the summed stats
+                COALESCE(ROUND(AVG(ps.kast_approx)::numeric, 2), 0) AS kast_approx
 
             FROM maps m
             JOIN matches ma ON m.match_id = ma.match_id
@@ -757,11 +771,15 @@ def get_esea_player_of_the_week() -> list:
             for index, row in df_sorted.iterrows():
                 value = row[stat]
                 if value > 0 and row['player_id'] not in player_set and value >= avg_dict.get(stat, 0):
+                    if stat == "headshots_percent":
+                        value = f"{int(value)} %"
+                    elif stat == "kast_approx":
+                        value = f"{int(value * 100)} %"
                     top_stats.append(
                         {
                             "stat": stat,
                             "description": desc,
-                            "value": f"{int(value)} %" if stat == "headshots_percent" else value,
+                            "value": value,
                             "player": row.to_dict()
                         }
                     )
@@ -964,37 +982,42 @@ def gather_esea_team_map_stats(team_id, szn_number) -> list:
                 except Exception:
                     continue
                 
-        # Gather team map stats
-        cursor.execute("""
-            SELECT
-                tm.team_id,
-                tm.team_win,
-                ma.map
-            FROM teams_maps tm
-            LEFT JOIN maps ma ON ma.match_id = tm.match_id AND ma.match_round = tm.match_round
-            LEFT JOIN matches m ON tm.match_id = m.match_id
-            INNER JOIN seasons s ON m.event_id = s.event_id
-            WHERE tm.team_id = %s AND s.season_number = %s
-        """, (team_id, szn_number))
-
-        map_rows = cursor.fetchall()
-        df_team_maps = pd.DataFrame(map_rows, columns=[desc[0] for desc in cursor.description])
+        # Gather the maps played and won per map, from the summary table when it exists
+        if get_table_schema('teams_maps_summary', cursor=cursor) is not None:
+            cursor.execute("""
+                SELECT
+                    tms.map,
+                    SUM(tms.played)::bigint AS played,
+                    SUM(tms.won)::bigint AS won
+                FROM teams_maps_summary tms
+                INNER JOIN seasons s ON tms.event_id = s.event_id
+                WHERE tms.team_id = %s AND s.season_number = %s AND tms.map <> ''
+                GROUP BY tms.map
+            """, (team_id, szn_number))
+        else:
+            cursor.execute("""
+                SELECT
+                    ma.map,
+                    COUNT(*) AS played,
+                    COALESCE(SUM(tm.team_win), 0) AS won
+                FROM teams_maps tm
+                LEFT JOIN maps ma ON ma.match_id = tm.match_id AND ma.match_round = tm.match_round
+                LEFT JOIN matches m ON tm.match_id = m.match_id
+                INNER JOIN seasons s ON m.event_id = s.event_id
+                WHERE tm.team_id = %s AND s.season_number = %s AND ma.map IS NOT NULL
+                GROUP BY ma.map
+            """, (team_id, szn_number))
                 
         # Calculate stats per map
         map_stats_dict = {}
-        if not df_team_maps.empty:
-            df_team_maps = df_team_maps[df_team_maps["map"].notna()]  # drop nulls just in case
-            map_group = df_team_maps.groupby("map")
-            for map_name, group in map_group:
-                played = len(group)
-                won = group["team_win"].sum()
-                winrate = round((won / played) * 100, 1) if played > 0 else 0
-                map_stats_dict[map_name] = {
-                    "map_name": map_name,
-                    "played": played,
-                    "won": int(won),
-                    "winrate": winrate
-                }
+        for map_name, played, won in cursor.fetchall():
+            winrate = round((float(won) / played) * 100, 1) if played > 0 else 0
+            map_stats_dict[map_name] = {
+                "map_name": map_name,
+                "played": int(played),
+                "won": int(won),
+                "winrate": winrate
+            }
 
         # Ensure all maps from pool exist in final output
         final_map_stats = []
@@ -1017,45 +1040,85 @@ def gather_esea_team_map_stats(team_id, szn_number) -> list:
 
 def gather_esea_team_player_stats(team_id, szn_number) -> list:
     db, cursor = start_database()
-    try:          
-        cursor.execute("""
-            SELECT
-                ps.player_id,
-                p.player_name,
-                p.avatar,
-                COALESCE(pc.country, p.country) AS country,
-
-                COUNT(DISTINCT CONCAT(ps.match_id, '-', ps.match_round)) AS maps_played,
-
-                ROUND(SUM(ps.kills)::numeric * 1.0 / NULLIF(SUM(ps.deaths), 0), 2) AS k_d_ratio,
-                ROUND(AVG(ps.hltv)::numeric, 2) AS hltv,
-                ROUND(SUM(ps.headshots)::numeric * 100.0 / NULLIF(SUM(ps.kills), 0), 0) AS headshots_percent,
-                ROUND(AVG(ps.adr)::numeric, 0) AS adr,
-                SUM(ps.knife_kills) AS knife_kills,
-                SUM(ps.penta_kills) AS penta_kills,
-                SUM(ps.zeus_kills) AS zeus_kills
+    try:
+        _, summary_complete = summary_stat_columns(cursor=cursor)
+        if summary_complete:
+            cursor.execute("""
+                SELECT
+                    ps.player_id,
+                    p.player_name,
+                    p.avatar,
+                    COALESCE(pc.country, p.country) AS country,
+
+                    SUM(ps.maps_played)::bigint AS maps_played,
+
+                    ROUND(SUM(ps.kills_sum)::numeric * 1.0 / NULLIF(SUM(ps.deaths_sum), 0), 2) AS k_d_ratio,
+                    ROUND((SUM(ps.hltv_sum) / NULLIF(SUM(ps.hltv_n), 0))::numeric, 2) AS hltv,
+                    ROUND(SUM(ps.headshots_sum)::numeric * 100.0 / NULLIF(SUM(ps.kills_sum), 0), 0) AS headshots_percent,
+                    ROUND((SUM(ps.adr_sum) / NULLIF(SUM(ps.adr_n), 0))::numeric, 0) AS adr,
+                    SUM(ps.knife_kills_sum)::bigint AS knife_kills,
+                    SUM(ps.penta_kills_sum)::bigint AS penta_kills,
+                    SUM(ps.zeus_kills_sum)::bigint AS zeus_kills
+
+                FROM players_stats_summary ps
+                LEFT JOIN players p ON ps.player_id = p.player_id
+                LEFT JOIN players_country pc ON p.player_id = pc.player_id
+                JOIN teams_benelux tb ON ps.team_id = tb.team_id AND ps.event_id = tb.event_id
+                JOIN seasons s ON ps.event_id = s.event_id
+
+                WHERE tb.team_id = %s AND s.season_number = %s
+
+                GROUP BY
+                    ps.player_id,
+                    p.player_name,
+                    p.avatar,
+                    COALESCE(pc.country, p.country)
+
+                ORDER BY
+                    maps_played DESC,
+                    hltv DESC,
+                    headshots_percent DESC,
+                    adr DESC
+            """, (team_id, szn_number))
+        else:
+            cursor.execute("""
+                SELECT
+                    ps.player_id,
+                    p.player_name,
+                    p.avatar,
+                    COALESCE(pc.country, p.country) AS country,
+
+                    COUNT(DISTINCT CONCAT(ps.match_id, '-', ps.match_round)) AS maps_played,
+
+                    ROUND(SUM(ps.kills)::numeric * 1.0 / NULLIF(SUM(ps.deaths), 0), 2) AS k_d_ratio,
+                    ROUND(AVG(ps.hltv)::numeric, 2) AS hltv,
+                    ROUND(SUM(ps.headshots)::numeric * 100.0 / NULLIF(SUM(ps.kills), 0), 0) AS headshots_percent,
+                    ROUND(AVG(ps.adr)::numeric, 0) AS adr,
+                    SUM(ps.knife_kills) AS knife_kills,
+                    SUM(ps.penta_kills) AS penta_kills,
+                    SUM(ps.zeus_kills) AS zeus_kills
+
+                FROM players_stats ps
+                JOIN matches m ON ps.match_id = m.match_id
+                LEFT JOIN players p ON ps.player_id = p.player_id
+                LEFT JOIN players_country pc ON p.player_id = pc.player_id
+                JOIN teams_benelux tb ON ps.team_id = tb.team_id AND m.event_id = tb.event_id
+                JOIN seasons s ON m.event_id = s.event_id
 
-            FROM players_stats ps
-            JOIN matches m ON ps.match_id = m.match_id
-            LEFT JOIN players p ON ps.player_id = p.player_id
-            LEFT JOIN players_country pc ON p.player_id = pc.player_id
-            JOIN teams_benelux tb ON ps.team_id = tb.team_id AND m.event_id = tb.event_id
-            JOIN seasons s ON m.event_id = s.event_id
+                WHERE tb.team_id = %s AND s.season_number = %s
 
-            WHERE tb.team_id = %s AND s.season_number = %s
+                GROUP BY
+                    ps.player_id,
+                    p.player_name,
+                    p.avatar,
+                    COALESCE(pc.country, p.country)
 
-            GROUP BY
-                ps.player_id,
-                p.player_name,
-                p.avatar,
-                COALESCE(pc.country, p.country)
-
-            ORDER BY
-                maps_played DESC,
-                hltv DESC,
-                headshots_percent DESC,
-                adr DESC
-        """, (team_id, szn_number))
+                ORDER BY
+                    maps_played DESC,
+                    hltv DESC,
+                    headshots_percent DESC,
+                    adr DESC
+            """, (team_id, szn_number))
         
         rows = cursor.fetchall()
         columns = [desc[0] for desc in cursor.description]
@@ -1326,26 +1389,13 @@ def gather_elo_leaderboard(
 # =============================
 #       Stats Player Page
 # =============================     
-def gather_stat_table_columns():
-    db, cursor = start_database()
-    
+def gather_stat_table_columns(cursor=None):
     try:
-        # Get stat columns and build AVG expressions
-        non_stat_cols = {'player_id', 'player_name', 'team_id', 'match_id', 'match_round'}
-        cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'players_stats'
-        """)
-        all_columns = [row[0] for row in cursor.fetchall()]
-        stat_columns = [col for col in all_columns if col not in non_stat_cols]
-        
-        return stat_columns
+        # Stat columns from the schema metadata cache
+        return players_stats_stat_columns(cursor=cursor)
     except Exception as e:
         function_logger.error(f"Error gathering stat table columns: {e}", exc_info=True)
         return []
-    finally:
-        close_database(db)
 
 def gather_player_stats_esea(
     events=[],
@@ -1369,30 +1419,12 @@ def gather_player_stats_esea(
     
     db, cursor = start_database()
     try:
-        # === Get valid (player_id, team_id, event_id) combos ===
-        valid_combos = set()
-        if events:
-            if 'hub' in events:
-                cursor.execute(""" 
-                    SELECT ps.player_id, ps.team_id, e.event_id
-                    FROM players_stats ps
-                    JOIN matches m ON ps.match_id = m.match_id
-                    JOIN events e ON m.event_id = e.event_id
-                    WHERE e.event_type = 'hub'
-                """)
-                valid_combos.update(cursor.fetchall())
-            elif 'esea' in events:
-                cursor.execute("""
-                    SELECT ps.player_id, ps.team_id, m.event_id
-                    FROM players_stats ps
-                    LEFT JOIN matches m ON ps.match_id = m.match_id
-                    WHERE (ps.team_id, m.event_id) IN (
-                        SELECT tb.team_id, tb.event_id
-                        FROM teams_benelux tb
-                    )
-                """)
-                valid_combos.update(cursor.fetchall())
-            
+        # The summary table holds the stats per (player, team, event, map), it can answer every filter
+        # except a time range, which needs the match times of the raw rows
+        summary_columns, summary_complete = summary_stat_columns(cursor=cursor)
+        use_summary = summary_complete and not timestamp
+        event_col = "ps.event_id" if use_summary else "m.event_id"
+        
         # Build WHERE clause and parameters
         conditions = []
         params = []
@@ -1402,7 +1434,7 @@ def gather_player_stats_esea(
                 # Both selected, so get all from both queries above
                 pass
             elif 'esea' in events:
-                conditions.append("(ps.team_id, m.event_id) IN (SELECT tb.team_id, tb.event_id FROM teams_benelux tb)")
+                conditions.append(f"(ps.team_id, {event_col}) IN (SELECT tb.team_id, tb.event_id FROM teams_benelux tb)")
             elif 'hub' in events:
                 conditions.append("e.event_type = 'hub'")
         
@@ -1442,41 +1474,73 @@ def gather_player_stats_esea(
             print(params, teams)
 
         where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
-        stat_columns = gather_stat_table_columns()
-        avg_expressions = [f'AVG(ps."{col}") AS "{col}"' for col in stat_columns]
-
-
-        query = f"""
-            SELECT
-               ps.player_id,
-               COALESCE(pc.country, p.country) AS country,
-               COUNT(DISTINCT ps.match_id || '-' || ps.match_round) AS maps_played,
-               ROUND(
-                    CASE 
-                        WHEN COUNT(DISTINCT ps.match_id || '-' || ps.match_round) > 0 
-                        THEN (SUM(tm.team_win) * 100.0 / COUNT(DISTINCT ps.match_id || '-' || ps.match_round))
-                        ELSE 0
-                    END, 1
-                ) AS map_win_pct,
-               {', '.join(avg_expressions)}
-            
-            FROM players_stats ps
-            
-            JOIN matches m ON ps.match_id = m.match_id
-            JOIN teams_maps tm ON ps.match_id = tm.match_id AND ps.match_round = tm.match_round AND ps.team_id = tm.team_id
-            JOIN events e ON m.event_id = e.event_id
-            LEFT JOIN seasons s ON m.event_id = s.event_id
-            
-            LEFT JOIN teams_benelux tb ON ps.team_id = tb.team_id AND m.event_id = tb.event_id
-            LEFT JOIN players p ON ps.player_id = p.player_id
-            LEFT JOIN players_country pc ON p.player_id = pc.player_id
-            
-            {where_clause}
-            
-            GROUP BY 
-                ps.player_id, 
-                COALESCE(pc.country, p.country)    
-        """
+        
+        if use_summary:
+            stat_columns = summary_columns
+            avg_expressions = [f'SUM(ps."{col}_sum") / NULLIF(SUM(ps."{col}_n"), 0) AS "{col}"' for col in stat_columns]
+            query = f"""
+                SELECT
+                   ps.player_id,
+                   COALESCE(pc.country, p.country) AS country,
+                   SUM(ps.maps_played) AS maps_played,
+                   ROUND(
+                        CASE 
+                            WHEN SUM(ps.maps_played) > 0 
+                            THEN (SUM(ps.maps_won) * 100.0 / SUM(ps.maps_played))
+                            ELSE 0
+                        END, 1
+                    ) AS map_win_pct,
+                   {', '.join(avg_expressions)}
+                
+                FROM players_stats_summary ps
+                
+                JOIN events e ON ps.event_id = e.event_id
+                LEFT JOIN seasons s ON ps.event_id = s.event_id
+                
+                LEFT JOIN teams_benelux tb ON ps.team_id = tb.team_id AND ps.event_id = tb.event_id
+                LEFT JOIN players p ON ps.player_id = p.player_id
+                LEFT JOIN players_country pc ON p.player_id = pc.player_id
+                
+                {where_clause}
+                
+                GROUP BY 
+                    ps.player_id, 
+                    COALESCE(pc.country, p.country)    
+            """
+        else:
+            stat_columns = gather_stat_table_columns(cursor=cursor)
+            avg_expressions = [f'AVG(ps."{col}") AS "{col}"' for col in stat_columns]
+            query = f"""
+                SELECT
+                   ps.player_id,
+                   COALESCE(pc.country, p.country) AS country,
+                   COUNT(DISTINCT ps.match_id || '-' || ps.match_round) AS maps_played,
+                   ROUND(
+                        CASE 
+                            WHEN COUNT(DISTINCT ps.match_id || '-' || ps.match_round) > 0 
+                            THEN (SUM(tm.team_win) * 100.0 / COUNT(DISTINCT ps.match_id || '-' || ps.match_round))
+                            ELSE 0
+                        END, 1
+                    ) AS map_win_pct,
+                   {', '.join(avg_expressions)}
+                
+                FROM players_stats ps
+                
+                JOIN matches m ON ps.match_id = m.match_id
+                JOIN teams_maps tm ON ps.match_id = tm.match_id AND ps.match_round = tm.match_round AND ps.team_id = tm.team_id
+                JOIN events e ON m.event_id = e.event_id
+                LEFT JOIN seasons s ON m.event_id = s.event_id
+                
+                LEFT JOIN teams_benelux tb ON ps.team_id = tb.team_id AND m.event_id = tb.event_id
+                LEFT JOIN players p ON ps.player_id = p.player_id
+                LEFT JOIN players_country pc ON p.player_id = pc.player_id
+                
+                {where_clause}
+                
+                GROUP BY 
+                    ps.player_id, 
+                    COALESCE(pc.country, p.country)    
+            """
         
         cursor.execute(query, params)
         rows = cursor.fetchall()
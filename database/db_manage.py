@@ -3,41 +3,235 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import time
+import atexit
+import threading
+import collections
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from logs.update_logger import get_logger
+function_logger = get_logger("functions")
 
 # Load api keys from .env file
 from dotenv import load_dotenv
 load_dotenv()
 
+# Pool settings
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))                  # Connections kept open when idle
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))                 # Maximum number of open connections
+DB_POOL_MAX_LIFETIME = int(os.getenv('DB_POOL_MAX_LIFETIME', 1800))  # Seconds before a connection is recycled
+DB_POOL_HEALTH_CHECK = int(os.getenv('DB_POOL_HEALTH_CHECK', 30))    # Idle seconds after which a connection is pinged before use
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))         # Seconds to wait for a free connection
+
+class ConnectionPool:
+    """
+    Process-wide pool of psycopg2 connections.
+
+    Connections are handed out LIFO, so idle connections beyond DB_POOL_MIN age out. A connection is
+    recycled after max_lifetime seconds, pinged before use when it has been idle for health_check
+    seconds, and rolled back when it is returned. The locks are green-thread safe when eventlet
+    monkey patches threading (website_main.py).
+    """
+    def __init__(self, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX, max_lifetime: int = DB_POOL_MAX_LIFETIME,
+                 health_check: int = DB_POOL_HEALTH_CHECK, timeout: int = DB_POOL_TIMEOUT, cursor_factory=None):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check
+        self.timeout = timeout
+        self.cursor_factory = cursor_factory    # Optional psycopg2 cursor class of the connections (tooling)
+
+        self._idle = collections.deque()    # (connection, created_at, last_used)
+        self._in_use = {}                   # id(connection) -> created_at
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._metrics = collections.Counter()
+
+    def _connect(self) -> psycopg2.extensions.connection:
+        self._metrics['created'] += 1
+        return psycopg2.connect(
+            host=os.getenv('PG_HOST'),
+            port=os.getenv('PG_PORT'),
+            user=os.getenv('PG_USER'),
+            database=os.getenv('PG_DATABASE'),
+            password=os.getenv('PG_PASSWORD'),
+            cursor_factory=self.cursor_factory
+        )
+
+    @staticmethod
+    def _discard(db: psycopg2.extensions.connection):
+        try:
+            db.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_healthy(db: psycopg2.extensions.connection) -> bool:
+        """ Pings the connection """
+        try:
+            with db.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            db.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self) -> psycopg2.extensions.connection:
+        """ Takes a connection from the pool, blocks up to timeout seconds when all connections are in use """
+        start = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            self._metrics['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                self._metrics['timeouts'] += 1
+                function_logger.error(f"Database pool exhausted: {self.stats()}")
+                raise psycopg2.pool.PoolError(f"No database connection available after {self.timeout}s ({self.maxconn} in use)")
+
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+
+                if entry is None:
+                    db, created_at = self._connect(), time.monotonic()
+                    break
+
+                db, created_at, last_used = entry
+                now = time.monotonic()
+                if db.closed or now - created_at > self.max_lifetime:
+                    self._metrics['recycled'] += 1
+                    self._discard(db)
+                    continue
+                if now - last_used > self.health_check and not self._is_healthy(db):
+                    self._metrics['unhealthy'] += 1
+                    function_logger.warning("Discarding unhealthy database connection from the pool.")
+                    self._discard(db)
+                    continue
+                break
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._in_use[id(db)] = created_at
+        self._metrics['checkouts'] += 1
+        self._metrics['wait_ms'] += int((time.monotonic() - start) * 1000)
+        return db
+
+    def putconn(self, db: psycopg2.extensions.connection):
+        """ Returns a connection to the pool, open transactions are rolled back """
+        with self._lock:
+            created_at = self._in_use.pop(id(db), None)
+            returned_twice = created_at is None and any(entry[0] is db for entry in self._idle)
+        if created_at is None:
+            # Not handed out by this pool
+            if not returned_twice and not db.closed:
+                self._discard(db)
+            return
+
+        try:
+            if not db.closed and db.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                db.rollback()
+
+            now = time.monotonic()
+            if db.closed or now - created_at > self.max_lifetime:
+                self._metrics['recycled'] += 1
+                self._discard(db)
+            else:
+                with self._lock:
+                    self._idle.append((db, created_at, now))
+                    # Close the least recently used connections beyond minconn
+                    while len(self._idle) > self.minconn and now - self._idle[0][2] > self.health_check:
+                        self._discard(self._idle.popleft()[0])
+        except Exception:
+            self._metrics['unhealthy'] += 1
+            self._discard(db)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        """ Closes all idle connections """
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def stats(self) -> dict:
+        """ Pool metrics: open/idle/in use connections and counters since start """
+        with self._lock:
+            in_use, idle = len(self._in_use), len(self._idle)
+        return {'in_use': in_use, 'idle': idle, 'max': self.maxconn, **self._metrics}
+
+# One pool per process (a forked worker creates its own)
+_POOL = None
+_POOL_PID = None
+_POOL_LOCK = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """ Returns the connection pool of this process """
+    global _POOL, _POOL_PID
+    if _POOL is None or _POOL_PID != os.getpid():
+        with _POOL_LOCK:
+            if _POOL is None or _POOL_PID != os.getpid():
+                _POOL, _POOL_PID = ConnectionPool(), os.getpid()
+    return _POOL
+
+def reset_pool(**kwargs) -> ConnectionPool:
+    """ Closes the idle connections of the pool of this process and replaces it, kwargs are passed to ConnectionPool """
+    global _POOL, _POOL_PID
+    with _POOL_LOCK:
+        if _POOL is not None and _POOL_PID == os.getpid():
+            _POOL.closeall()
+        _POOL, _POOL_PID = ConnectionPool(**kwargs), os.getpid()
+    return _POOL
+
+def pool_stats() -> dict:
+    """ Metrics of the connection pool of this process """
+    return get_pool().stats()
+
 def start_database() -> tuple:
     """
-    Creates both a psycopg2 connection/cursor and an SQLAlchemy engine.
-    
+    Takes a psycopg2 connection from the connection pool and opens a cursor.
+
     Returns:
-        tuple: (db_connection, cursor, sqlalchemy_engine)
+        tuple: (db_connection, cursor)
     """
-    # Create PostgreSQL connection
-    db = psycopg2.connect(
-        host=os.getenv('PG_HOST'),
-        port=os.getenv('PG_PORT'),
-        user=os.getenv('PG_USER'),
-        database=os.getenv('PG_DATABASE'),
-        password=os.getenv('PG_PASSWORD')
-    )
-    
+    db = get_pool().getconn()
     cursor = db.cursor()
-    
+
     return db, cursor
 
 def close_database(db: psycopg2.extensions.connection):
-    """Closing the database connection"""
-    db.close()
-     
+    """Returning the database connection to the pool"""
+    get_pool().putconn(db)
+
+def enable_green_psycopg() -> None:
+    """
+    Makes psycopg2 cooperative under eventlet by registering eventlet's wait callback (what psycogreen's
+    patch_psycopg does, eventlet.monkey_patch() also does it unless psycopg=False). Without it every query
+    blocks the eventlet hub, and with it the website and all update jobs of the web process. COPY is not
+    available on green connections (see db_up.copy_upload).
+    """
+    if is_green_psycopg():
+        return
+    from eventlet.support import psycopg2_patcher
+    psycopg2_patcher.make_psycopg_green()
+
+def is_green_psycopg() -> bool:
+    """ Whether psycopg2 runs cooperatively, see enable_green_psycopg() """
+    return psycopg2.extensions.get_wait_callback() is not None
+
+@atexit.register
+def _close_pool():
+    if _POOL is not None and _POOL_PID == os.getpid():
+        _POOL.closeall()
+
 if __name__ == "__main__":
     # Allow standalone execution
     import sys
     import os
     sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-    
+
     db, cursor = start_database()
-    close_database(db)
\ No newline at end of file
+    close_database(db)
+    print(pool_stats())
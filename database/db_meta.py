@@ -0,0 +1,191 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+import threading
+
+from database.db_manage import start_database, close_database
+
+from logs.update_logger import get_logger
+function_logger = get_logger("functions")
+
+### -----------------------------------------------------------------
+### Schema metadata cache
+### -----------------------------------------------------------------
+# Columns, primary keys and foreign keys of all tables in the public schema, loaded in one go.
+# The schema only changes on deploys, so the cache is kept until invalidate_schema_cache() is called
+# or the schema fingerprint changes (checked at most every SCHEMA_CHECK_INTERVAL seconds).
+
+SCHEMA_CHECK_INTERVAL = 300
+SCHEMA_MISS_RECHECK = 10    # Minimum seconds between reloads caused by a table missing from the cache
+
+_SCHEMA_CACHE = {'version': None, 'tables': {}, 'checked_at': 0.0, 'generation': 0}
+_SCHEMA_LOCK = threading.Lock()
+
+SCHEMA_FINGERPRINT_QUERY = """
+    SELECT md5(COALESCE(string_agg(item, ',' ORDER BY item), ''))
+    FROM (
+        SELECT c.relname || '.' || a.attname || ':' || a.atttypid::text || ':' || a.attnum::text AS item
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') AND a.attnum > 0 AND NOT a.attisdropped
+        UNION ALL
+        SELECT con.conname || ':' || con.contype::text || ':' || con.conrelid::regclass::text
+        FROM pg_constraint con
+        JOIN pg_namespace n ON n.oid = con.connamespace
+        WHERE n.nspname = 'public' AND con.contype IN ('p', 'f')
+    ) items
+"""
+
+SCHEMA_COLUMNS_QUERY = """
+    SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod)
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') AND a.attnum > 0 AND NOT a.attisdropped
+    ORDER BY c.relname, a.attnum
+"""
+
+SCHEMA_PRIMARY_KEYS_QUERY = """
+    SELECT c.relname, a.attname
+    FROM pg_constraint con
+    JOIN pg_class c ON c.oid = con.conrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    CROSS JOIN LATERAL unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+    JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+    WHERE n.nspname = 'public' AND con.contype = 'p'
+    ORDER BY c.relname, k.ord
+"""
+
+SCHEMA_FOREIGN_KEYS_QUERY = """
+    SELECT c.relname, con.conname, la.attname, rc.relname, ra.attname
+    FROM pg_constraint con
+    JOIN pg_class c ON c.oid = con.conrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_class rc ON rc.oid = con.confrelid
+    CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(local_attnum, ref_attnum, ord)
+    JOIN pg_attribute la ON la.attrelid = con.conrelid AND la.attnum = k.local_attnum
+    JOIN pg_attribute ra ON ra.attrelid = con.confrelid AND ra.attnum = k.ref_attnum
+    WHERE n.nspname = 'public' AND con.contype = 'f'
+    ORDER BY c.relname, con.conname, k.ord
+"""
+
+def _fetch_schema_version(cursor) -> str:
+    cursor.execute(SCHEMA_FINGERPRINT_QUERY)
+    return cursor.fetchone()[0]
+
+def _load_schema(cursor) -> dict:
+    """ Loads the metadata of all tables in the public schema """
+    tables = {}
+    def table(name):
+        return tables.setdefault(name, {'columns': [], 'types': {}, 'primary_keys': [], 'foreign_keys': {}})
+
+    cursor.execute(SCHEMA_COLUMNS_QUERY)
+    for table_name, column, column_type in cursor.fetchall():
+        table(table_name)['columns'].append(column)
+        table(table_name)['types'][column] = column_type
+
+    cursor.execute(SCHEMA_PRIMARY_KEYS_QUERY)
+    for table_name, column in cursor.fetchall():
+        table(table_name)['primary_keys'].append(column)
+
+    cursor.execute(SCHEMA_FOREIGN_KEYS_QUERY)
+    for table_name, constraint_name, local_column, ref_table, ref_column in cursor.fetchall():
+        fk = table(table_name)['foreign_keys'].setdefault(
+            constraint_name, {'columns': [], 'ref_table': ref_table, 'ref_columns': []}
+        )
+        fk['columns'].append(local_column)
+        fk['ref_columns'].append(ref_column)
+
+    return tables
+
+def refresh_schema_cache(force: bool = False, cursor=None) -> str:
+    """
+    Reloads the schema metadata when the fingerprint changed (or always with force=True).
+    Pass the cursor of a connection the caller already holds, so no second pool connection is taken.
+
+    Returns:
+        str: The current schema version
+    """
+    if cursor is None:
+        db, cursor = start_database()
+        try:
+            return refresh_schema_cache(force=force, cursor=cursor)
+        finally:
+            close_database(db)
+
+    # Loaded without holding the lock, only the swap of the cache is locked
+    generation = _SCHEMA_CACHE['generation']
+    version = _fetch_schema_version(cursor)
+    tables = _load_schema(cursor) if force or version != _SCHEMA_CACHE['version'] else None
+    with _SCHEMA_LOCK:
+        if _SCHEMA_CACHE['generation'] != generation:
+            # Invalidated while loading, the loaded metadata might predate the change
+            return version
+        if tables is not None:
+            _SCHEMA_CACHE.update(version=version, tables=tables)
+            function_logger.debug(f"Loaded schema metadata for {len(tables)} tables (version {version}).")
+        _SCHEMA_CACHE['checked_at'] = time.monotonic()
+    return version
+
+def invalidate_schema_cache() -> None:
+    """ Drops the cached schema metadata, call after changing the schema """
+    with _SCHEMA_LOCK:
+        _SCHEMA_CACHE.update(version=None, tables={}, checked_at=0.0, generation=_SCHEMA_CACHE['generation'] + 1)
+
+def schema_version(cursor=None) -> str | None:
+    """ Returns the fingerprint of the cached schema, (re)loading it when it is due for a check """
+    if _SCHEMA_CACHE['version'] is None or time.monotonic() - _SCHEMA_CACHE['checked_at'] > SCHEMA_CHECK_INTERVAL:
+        refresh_schema_cache(cursor=cursor)
+    return _SCHEMA_CACHE['version']
+
+def get_table_schema(table_name: str, cursor=None) -> dict | None:
+    """
+    Returns the cached metadata of a table. Pass the cursor of a connection the caller holds, so a
+    reload of the cache does not take a second pool connection.
+
+    Returns:
+        dict | None: {'columns': [...], 'types': {column: type}, 'primary_keys': [...],
+                      'foreign_keys': {constraint_name: {'columns': [...], 'ref_table': str, 'ref_columns': [...]}}}
+                     or None if the table does not exist
+    """
+    schema_version(cursor=cursor)
+    if table_name not in _SCHEMA_CACHE['tables'] and time.monotonic() - _SCHEMA_CACHE['checked_at'] > SCHEMA_MISS_RECHECK:
+        # The table might have been created after the cache was loaded
+        refresh_schema_cache(cursor=cursor)
+    return _SCHEMA_CACHE['tables'].get(table_name)
+
+# Key columns of players_stats, every other column is a stat of the player on the map
+PLAYERS_STATS_KEY_COLUMNS = ('player_id', 'player_name', 'team_id', 'match_id', 'match_round')
+
+def players_stats_stat_columns(cursor=None) -> list[str]:
+    """ Returns the stat columns of players_stats """
+    table_schema = get_table_schema('players_stats', cursor=cursor)
+    if table_schema is None:
+        return []
+    return [col for col in table_schema['columns'] if col not in PLAYERS_STATS_KEY_COLUMNS]
+
+def summary_stat_columns(cursor=None) -> tuple[list[str], bool]:
+    """
+    Returns the stat columns that have a sum and count column in players_stats_summary, and whether
+    that covers every stat of players_stats (False when the summary table does not exist or is outdated).
+    """
+    table_schema = get_table_schema('players_stats_summary', cursor=cursor)
+    stat_columns = players_stats_stat_columns(cursor=cursor)
+    if table_schema is None or not stat_columns:
+        return [], False
+    
+    summary_columns = set(table_schema['columns'])
+    columns = [col for col in stat_columns if f"{col}_sum" in summary_columns and f"{col}_n" in summary_columns]
+    return columns, len(columns) == len(stat_columns)
+
+if __name__ == "__main__":
+    # Allow standalone execution
+    import sys
+    import os
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+    print(schema_version())
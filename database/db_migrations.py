@@ -0,0 +1,238 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import time
+
+from database.db_manage import start_database, close_database
+from database.db_meta import get_table_schema, invalidate_schema_cache, summary_stat_columns
+from database.db_schema import ensure_backfill_checkpoints_table, ensure_derived_stat_columns, ensure_stats_summary_tables
+
+from logs.update_logger import get_logger
+function_logger = get_logger("functions")
+
+### -----------------------------------------------------------------
+### Versioned schema migrations
+### -----------------------------------------------------------------
+# Every schema change made from code is a numbered migration, applied once and in order. The applied
+# versions are stored in schema_migrations, so running migrate() on every deploy only applies the new
+# ones. The deploy workflow runs this file before restarting the service, the service itself only
+# warns about pending migrations and missing indexes. Migrations are never edited or renumbered after they are released: add a new one instead.
+# Schema that follows the code (the derived stat columns and their summary columns) is synced by the
+# repeatable migrations, which are idempotent and run on every migrate().
+
+SCHEMA_MIGRATIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version     INTEGER PRIMARY KEY,
+        name        TEXT NOT NULL,
+        applied_at  BIGINT NOT NULL
+    )
+"""
+
+# Held while migrating, so two processes deploying at the same time do not apply a migration twice
+MIGRATION_LOCK_ID = 4917350
+
+# Indexes for the predicates and joins of the website and update queries: (index name, table, columns).
+# A required index is also satisfied by any other valid index (or primary key) starting with its columns.
+HOT_QUERY_INDEXES = [
+    ("matches_match_time_idx", "matches", ["match_time"]),
+    ("matches_status_idx", "matches", ["status"]),
+    ("matches_event_status_time_idx", "matches", ["event_id", "status", "match_time"]),
+    ("players_stats_team_match_idx", "players_stats", ["team_id", "match_id"]),
+    ("players_stats_match_idx", "players_stats", ["match_id", "match_round"]),
+    ("teams_maps_match_idx", "teams_maps", ["match_id", "match_round"]),
+    ("teams_benelux_team_event_idx", "teams_benelux", ["team_id", "event_id"]),
+    ("elo_leaderboard_daily_date_player_idx", "elo_leaderboard_daily", ["date", "player_id"]),
+    ("streams_live_game_idx", "streams", ["live", "game"]),
+]
+
+INDEX_COLUMNS_QUERY = """
+    SELECT ic.relname, ix.indisvalid, array_agg(a.attname::text ORDER BY k.ord)
+    FROM pg_index ix
+    JOIN pg_class c ON c.oid = ix.indrelid
+    JOIN pg_class ic ON ic.oid = ix.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    CROSS JOIN LATERAL unnest(ix.indkey) WITH ORDINALITY AS k(attnum, ord)
+    JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = k.attnum
+    WHERE n.nspname = 'public' AND c.relname = %s
+    GROUP BY ic.relname, ix.indisvalid
+"""
+
+def missing_indexes(cursor, indexes: list[tuple] = HOT_QUERY_INDEXES) -> list[tuple]:
+    """
+    Returns the required indexes that are not covered by a valid index, tables that do not exist are skipped.
+
+    Returns:
+        list: (index name, table, columns, invalid) tuples, invalid is True when an index with that name
+              exists but is invalid (a failed concurrent build)
+    """
+    missing = []
+    for name, table, columns in indexes:
+        if get_table_schema(table, cursor=cursor) is None:
+            function_logger.warning(f"Table {table} does not exist, skipping index {name}.")
+            continue
+
+        cursor.execute(INDEX_COLUMNS_QUERY, (table,))
+        existing = cursor.fetchall()
+        covered = any(valid and list(index_columns[:len(columns)]) == columns for _, valid, index_columns in existing)
+        if not covered:
+            invalid = any(index_name == name and not valid for index_name, valid, _ in existing)
+            missing.append((name, table, columns, invalid))
+    return missing
+
+def ensure_indexes(indexes: list[tuple] = HOT_QUERY_INDEXES) -> list[str]:
+    """
+    Creates the required indexes that are missing. The indexes are built CONCURRENTLY, so the update jobs
+    and the website can keep writing and reading the tables while they are built.
+
+    Indexes on tables that do not exist yet are skipped, they are created by a later migrate() (the
+    hot_query_indexes repeatable migration) once their table exists.
+
+    Returns:
+        list: Names of the created indexes
+    """
+    created = []
+    db, cursor = start_database()
+    try:
+        # CREATE INDEX CONCURRENTLY can not run inside a transaction
+        db.autocommit = True
+        for name, table, columns, invalid in missing_indexes(cursor, indexes):
+            if invalid:
+                cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+            column_list = ', '.join(f'"{col}"' for col in columns)
+            start = time.perf_counter()
+            cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table}" ({column_list})')
+            function_logger.info(f"Created index {name} on {table} ({column_list}) in {time.perf_counter() - start:.1f}s.")
+            created.append(name)
+        return created
+    except Exception as e:
+        function_logger.error(f"Error creating indexes: {e}")
+        raise
+    finally:
+        db.autocommit = False
+        close_database(db)
+
+def verify_indexes(indexes: list[tuple] = HOT_QUERY_INDEXES) -> list[tuple]:
+    """ Logs and returns the required indexes that are missing, see missing_indexes() """
+    db, cursor = start_database()
+    try:
+        missing = missing_indexes(cursor, indexes)
+        for name, table, columns, invalid in missing:
+            state = "invalid" if invalid else "missing"
+            function_logger.warning(f"Index {name} on {table} ({', '.join(columns)}) is {state}.")
+        return missing
+    finally:
+        close_database(db)
+
+def sync_stats_summary_tables() -> None:
+    """ Creates the stats summary tables or adds their missing stat columns, and rebuilds them when they changed """
+    from database.db_up import refresh_stats_summaries
+    _, complete = summary_stat_columns()
+    if complete:
+        return
+    ensure_stats_summary_tables()
+    refresh_stats_summaries()
+
+def rebuild_stats_summaries() -> None:
+    """ Rebuilds the stats summary tables from scratch, for changes to how their rows are computed """
+    from database.db_up import refresh_stats_summaries
+    refresh_stats_summaries()
+
+# (version, name, function), append only
+MIGRATIONS = [
+    (1, "backfill_checkpoints", ensure_backfill_checkpoints_table),
+    (2, "hot_query_indexes", ensure_indexes),
+    (3, "summaries_count_decided_maps", rebuild_stats_summaries),
+]
+
+# (name, function), run in this order after the versioned migrations. The indexes come last, so a
+# failed index build does not hold back the other schema changes.
+REPEATABLE_MIGRATIONS = [
+    ("derived_stat_columns", ensure_derived_stat_columns),
+    ("stats_summary_tables", sync_stats_summary_tables),
+    ("hot_query_indexes", ensure_indexes),
+]
+
+def applied_migrations() -> dict:
+    """ Returns {version: applied_at} of the applied migrations """
+    db, cursor = start_database()
+    try:
+        cursor.execute(SCHEMA_MIGRATIONS_DDL)
+        cursor.execute("SELECT version, applied_at FROM schema_migrations")
+        applied = dict(cursor.fetchall())
+        db.commit()
+        return applied
+    finally:
+        close_database(db)
+
+def pending_migrations() -> list[int]:
+    """ Returns the versions of the migrations that were not applied yet """
+    applied = applied_migrations()
+    return [version for version, _, _ in MIGRATIONS if version not in applied]
+
+def migrate(target: int = None) -> list[int]:
+    """
+    Applies the migrations that were not applied yet, in order, followed by the repeatable migrations.
+
+    Args:
+        target (int): Optional, stop after this version
+
+    Returns:
+        list: Versions applied by this call
+    """
+    applied_now = []
+    db, cursor = start_database()
+    try:
+        cursor.execute(SCHEMA_MIGRATIONS_DDL)
+        db.commit()
+
+        # Session level lock, kept until it is released below even though the migrations commit
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            cursor.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cursor.fetchall()}
+            db.commit()
+
+            for version, name, apply in MIGRATIONS:
+                if version in applied or (target is not None and version > target):
+                    continue
+
+                function_logger.info(f"Applying migration {version} ({name}).")
+                start = time.perf_counter()
+                apply()
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                    (version, name, int(time.time()))
+                )
+                db.commit()
+                applied_now.append(version)
+                function_logger.info(f"Applied migration {version} ({name}) in {time.perf_counter() - start:.1f}s.")
+
+            for name, apply in REPEATABLE_MIGRATIONS:
+                apply()
+        finally:
+            db.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            db.commit()
+
+        invalidate_schema_cache()
+        return applied_now
+    except Exception as e:
+        function_logger.error(f"Error applying migrations: {e}")
+        db.rollback()
+        raise
+    finally:
+        close_database(db)
+
+if __name__ == "__main__":
+    # Allow standalone execution
+    import sys
+    import os
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+    applied = migrate()
+    print(f"Applied migrations: {applied or 'none'}")
+
+    missing = verify_indexes()
+    print(f"Missing indexes: {[name for name, *_ in missing] or 'none'}")
@@ -0,0 +1,109 @@
+# Allow standalone execution
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db_manage import start_database, close_database
+from database.db_meta import invalidate_schema_cache, players_stats_stat_columns
+from data_processing.dp_stats import DERIVED_STATS
+
+from logs.update_logger import get_logger
+function_logger = get_logger("functions")
+
+### -----------------------------------------------------------------
+### Table definitions for tables managed from code
+### -----------------------------------------------------------------
+
+BACKFILL_CHECKPOINTS_DDL = """
+    CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+        source              TEXT PRIMARY KEY,
+        page_offset         INTEGER NOT NULL DEFAULT 0,
+        last_match_id       TEXT,
+        processed_matches   INTEGER NOT NULL DEFAULT 0,
+        finished            BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at          BIGINT
+    )
+"""
+
+def ensure_backfill_checkpoints_table() -> None:
+    """ Creates the backfill_checkpoints table if it does not exist yet """
+    db, cursor = start_database()
+    try:
+        cursor.execute(BACKFILL_CHECKPOINTS_DDL)
+        db.commit()
+        invalidate_schema_cache()
+    except Exception as e:
+        function_logger.error(f"Error creating backfill_checkpoints table: {e}")
+        db.rollback()
+        raise
+    finally:
+        close_database(db)
+
+def ensure_derived_stat_columns() -> None:
+    """ Adds a DOUBLE PRECISION column to players_stats for every registered derived stat that is missing """
+    db, cursor = start_database()
+    try:
+        for name in DERIVED_STATS:
+            cursor.execute(f'ALTER TABLE players_stats ADD COLUMN IF NOT EXISTS "{name}" DOUBLE PRECISION')
+        db.commit()
+        invalidate_schema_cache()
+    except Exception as e:
+        function_logger.error(f"Error adding derived stat columns to players_stats: {e}")
+        db.rollback()
+        raise
+    finally:
+        close_database(db)
+
+STATS_SUMMARY_DDL = """
+    CREATE TABLE IF NOT EXISTS players_stats_summary (
+        player_id   TEXT NOT NULL,
+        team_id     TEXT NOT NULL,
+        event_id    TEXT NOT NULL,
+        map         TEXT NOT NULL DEFAULT '',
+        maps_played INTEGER NOT NULL DEFAULT 0,
+        maps_won    INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (player_id, team_id, event_id, map)
+    );
+    CREATE INDEX IF NOT EXISTS players_stats_summary_event_team_idx ON players_stats_summary (event_id, team_id);
+    
+    CREATE TABLE IF NOT EXISTS teams_maps_summary (
+        team_id     TEXT NOT NULL,
+        event_id    TEXT NOT NULL,
+        map         TEXT NOT NULL DEFAULT '',
+        played      INTEGER NOT NULL DEFAULT 0,
+        won         INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (team_id, event_id, map)
+    );
+"""
+
+def ensure_stats_summary_tables() -> None:
+    """
+    Creates the players_stats_summary and teams_maps_summary tables and adds a sum and count column to
+    players_stats_summary for every stat column of players_stats that is missing.
+    Run database.db_up.refresh_stats_summaries() afterwards to (re)build their content.
+    """
+    stat_columns = players_stats_stat_columns()
+    db, cursor = start_database()
+    try:
+        cursor.execute(STATS_SUMMARY_DDL)
+        for col in stat_columns:
+            cursor.execute(f'ALTER TABLE players_stats_summary ADD COLUMN IF NOT EXISTS "{col}_sum" DOUBLE PRECISION')
+            cursor.execute(f'ALTER TABLE players_stats_summary ADD COLUMN IF NOT EXISTS "{col}_n" INTEGER NOT NULL DEFAULT 0')
+        db.commit()
+        invalidate_schema_cache()
+    except Exception as e:
+        function_logger.error(f"Error creating the stats summary tables: {e}")
+        db.rollback()
+        raise
+    finally:
+        close_database(db)
+
+if __name__ == "__main__":
+    # Allow standalone execution
+    import sys
+    import os
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+    # The tables are created through the versioned migrations
+    from database.db_migrations import migrate
+    migrate()
@@ -3,25 +3,49 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import psycopg2
+import psycopg2.errors
 from psycopg2 import sql
 from psycopg2.extras import execute_values
 
 
 import datetime
 import pandas as pd
+import numpy as np
 import json
 import math
+import hashlib
+import io
+import time
 
-from database.db_manage import start_database, close_database
+from database.db_manage import start_database, close_database, is_green_psycopg
+from database.db_meta import get_table_schema, schema_version, invalidate_schema_cache, summary_stat_columns
 
 from logs.update_logger import get_logger
 function_logger = get_logger("functions")
 
+# Content hashes of the rows last written per table: {table_name: {primary key tuple: hash}}.
+# Used by upload_data(diff=True) to skip rows that did not change since the previous upload
+# from this process.
+_ROW_HASH_CACHE: dict[str, dict[tuple, bytes]] = {}
+
+# Rows prepared and committed per chunk by upload_data, and the retries of a chunk on transient errors
+UPLOAD_CHUNK_SIZE = 20000
+UPLOAD_RETRIES = 3
+UPLOAD_RETRY_DELAY = 0.5
+TRANSIENT_ERRORS = (psycopg2.errors.SerializationFailure, psycopg2.errors.DeadlockDetected)
+
+# Inferred dtypes of object columns that can not hold dicts, lists or tuples
+JSON_FREE_DTYPES = {'string', 'bytes', 'empty', 'integer', 'floating', 'decimal', 'boolean', 'datetime', 'date', 'time', 'timedelta'}
+
+# Upload queries per (table, preserve_existing, returning, schema version): (query, keys, primary keys)
+_UPLOAD_QUERY_CACHE: dict[tuple, tuple[str, list[str], list[str]]] = {}
+
 ### -----------------------------------------------------------------
 ### General Functions
 ### -----------------------------------------------------------------
 
-def upload_data(table_name, df: pd.DataFrame, clear=False, preserve_existing=False) -> None:
+def upload_data(table_name, df: pd.DataFrame, clear=False, preserve_existing=False, diff=False, sample=0, chunk_size=UPLOAD_CHUNK_SIZE) -> dict:
     """ 
     Upload data from the provided dictionaries to their corresponding database tables
 
@@ -29,8 +53,21 @@ def upload_data(table_name, df: pd.DataFrame, clear=False, preserve_existing=Fal
         table_name (str)    : Name of the table to upload data to
         table_config (list) : List of keys for the table
         df (pd.DataFrame)   : DataFrame containing the data to upload
+        diff (bool)         : If True, only send rows whose content changed since they were last uploaded
+                              by this process.
+        sample (int)        : Debugging, if > 0 the written rows are returned by the database and the first
+                              `sample` rows are logged.
+        chunk_size (int)    : Number of rows prepared, sent and committed at once. Committed chunks are kept
+                              when a later chunk fails. None uploads the DataFrame in one transaction.
+    
+    Returns:
+        dict: Upload statistics {'inserted': int, 'updated': int, 'skipped': int}, counted by the database
+    
+    Raises:
+        Exception: When a chunk could not be uploaded, the chunks committed before it are kept
     """
     # print(f" --- Uploading data to {table_name} table --- ")
+    stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
     
     db, cursor = start_database()
     try:
@@ -38,93 +75,214 @@ def upload_data(table_name, df: pd.DataFrame, clear=False, preserve_existing=Fal
             # Safely construct DELETE query
             cursor.execute(f'DELETE FROM "{table_name}"')
             db.commit()
+            clear_row_hash_cache(table_name)
             function_logger.info(f"Cleared data from {table_name} table.")
         
         if df.empty:
             function_logger.info(f"No data to upload for table {table_name}. DataFrame is empty.")
-            return
+            return stats
            
-        keys, primary_keys = gather_keys(table_name)
-        if not keys or not primary_keys:
+        cached_query = get_upload_query(table_name, preserve_existing=preserve_existing, returning=sample > 0, cursor=cursor)
+        if cached_query is None:
             function_logger.info(f"No keys found for table {table_name}. Skipping upload.")
-            return
-        
-        sql = upload_data_query(table_name, keys, primary_keys, preserve_existing=preserve_existing)
-        
-        df = clean_invalid_foreign_keys(df, table_name)
+            return stats
+        sql, keys, primary_keys = cached_query
+        pk_idx = [keys.index(pk) for pk in primary_keys]
         
+        chunk_size = chunk_size or len(df)
+        sent = 0
+        for start in range(0, len(df), chunk_size):
+            df_chunk = clean_invalid_foreign_keys(df.iloc[start:start + chunk_size], table_name, cursor=cursor)
+            
+            ## Preparing the data as tuples with None for the missing keys in the database
+            data = prepare_rows(df_chunk, keys)
+            
+            ## A single INSERT can not touch the same row twice, keep the last row per primary key
+            data = dedupe_rows(data, pk_idx)
+            
+            ## Dropping the rows that did not change since the last upload
+            hashes = {}
+            if diff:
+                # After a clear nothing is stored yet, so every row is sent but its hash is still remembered
+                data, hashes, skipped = filter_unchanged_rows(table_name, data, pk_idx)
+                stats['skipped'] += skipped
+            
+            if not data:
+                continue
+            
+            ## Uploading the chunk to the database
+            inserted, updated = execute_upload(db, cursor, table_name, sql, keys, primary_keys, data, preserve_existing=preserve_existing, sample=sample)
+            stats['inserted'] += inserted
+            stats['updated'] += updated
+            sent += len(data)
+            
+            update_row_hash_cache(table_name, data, pk_idx, hashes)
         
-        ## Preparing the data as tuples with None for the missing keys in the database
-        data = [
-            clean_row(tuple(
-                json.dumps(val) if isinstance(val, (dict, list, tuple)) else val
-                for val in (d.get(col, None) for col in keys)
-            ))
-            for d in df.to_dict(orient='records')
-        ]
-        
-        ## Uploading the data to the database 
-        if not data:
+        if stats['skipped']:
+            function_logger.info(f"Skipped {stats['skipped']}/{stats['skipped'] + sent} unchanged rows for {table_name} table.")
+        if not sent:
             function_logger.info(f"No data to upload for table {table_name}. Skipping upload.")
-        else:  
-            # Start the database connection and cursor
-            execute_values(cursor, sql, data)
-            updated_rows = cursor.fetchall()
-            function_logger.info(f"Successfully uploaded {len(updated_rows)}/{len(data)} rows to {table_name} table.")
+        else:
+            function_logger.info(
+                f"Successfully uploaded {stats['inserted'] + stats['updated']}/{sent} rows to {table_name} table "
+                f"({stats['inserted']} inserted, {stats['updated']} updated)."
+            )
       
     except Exception as e:
         function_logger.error(f"Error while uploading data to {table_name}: {e}")
         db.rollback()
+        if isinstance(e, psycopg2.ProgrammingError):
+            # Most likely a column or table that changed since the schema metadata was cached
+            invalidate_schema_cache()
+        raise
     
     finally:
-        # Commit the transaction and close the database connection
-        db.commit()
         close_database(db)
+    
+    return stats
 
-def gather_keys(table_name: str) -> tuple[list[str], list[str]]:
+def prepare_rows(df: pd.DataFrame, keys: list[str]) -> list[tuple]:
     """
-    Gather all column names and primary key column names from the specified PostgreSQL table.
+    Turns a DataFrame into tuples in the column order of keys, with None for the missing keys and NaN values.
+    Works per column: dicts, lists and tuples are JSON encoded only in object columns that contain them.
+    """
+    df = df.reindex(columns=keys)
+    
+    columns = []
+    for col in keys:
+        series = df[col]
+        values = series.to_numpy(dtype=object, copy=True)
+        
+        if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in JSON_FREE_DTYPES:
+            is_container = np.fromiter((isinstance(val, (dict, list, tuple)) for val in values), dtype=bool, count=len(values))
+            if is_container.any():
+                values[is_container] = [json.dumps(val) for val in values[is_container]]
+        
+        values[series.isna().to_numpy()] = None
+        columns.append(values)
+    
+    return list(zip(*columns))
+
+def dedupe_rows(data: list[tuple], pk_idx: list[int]) -> list[tuple]:
+    """ Keeps the last row per primary key, in the order of their first occurrence """
+    deduped = {tuple(row[i] for i in pk_idx): row for row in data}
+    return data if len(deduped) == len(data) else list(deduped.values())
+
+def execute_upload(db, cursor, table_name: str, sql: str, keys: list[str], primary_keys: list[str], data: list[tuple], preserve_existing: bool = False, sample: int = 0) -> tuple[int, int]:
     """
-    all_keys = []
-    primary_keys = []
+    Writes and commits one chunk of prepared rows. Serialization failures and deadlocks are retried
+    UPLOAD_RETRIES times with a growing delay, other errors are raised.
 
-    db, cursor = start_database()
-    try:
-        # Fetch all column names
-        cursor.execute(sql.SQL("""
-            SELECT column_name
-            FROM information_schema.columns
-            WHERE table_schema = 'public' AND table_name = %s
-            ORDER BY ordinal_position
-        """), (table_name,))
-        all_keys = [row[0] for row in cursor.fetchall()]
-
-        # Fetch primary key column names
-        cursor.execute(sql.SQL("""
-            SELECT a.attname
-            FROM pg_index i
-            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
-            WHERE i.indrelid = %s::regclass AND i.indisprimary
-        """), (table_name,))
-        primary_keys = [row[0] for row in cursor.fetchall()]
+    Returns:
+        tuple: (inserted rows, updated rows)
+    """
+    for attempt in range(1, UPLOAD_RETRIES + 1):
+        try:
+            if sample > 0:
+                # The written rows, each followed by whether it was inserted
+                rows = execute_values(cursor, sql, data, fetch=True)
+                inserted = sum(1 for row in rows if row[-1])
+                updated = len(rows) - inserted
+                function_logger.debug(f"Sample of the rows written to {table_name}: {rows[:sample]}")
+            elif len(data) >= COPY_THRESHOLD and not is_green_psycopg():
+                inserted, updated = copy_upload(cursor, table_name, keys, primary_keys, data, preserve_existing=preserve_existing)
+            else:
+                # One (inserted, updated) count row per page of execute_values
+                counts = execute_values(cursor, sql, data, fetch=True)
+                inserted, updated = sum(row[0] for row in counts), sum(row[1] for row in counts)
+            db.commit()
+            return inserted, updated
+        
+        except TRANSIENT_ERRORS as e:
+            db.rollback()
+            if attempt == UPLOAD_RETRIES:
+                raise
+            function_logger.warning(f"Transient error while uploading to {table_name} (attempt {attempt}/{UPLOAD_RETRIES}), retrying: {e}")
+            time.sleep(UPLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+
+def row_hash(row: tuple) -> bytes:
+    """ Returns a content hash of a prepared row """
+    return hashlib.blake2b(repr(row).encode(), digest_size=16).digest()
+
+def filter_unchanged_rows(table_name: str, data: list[tuple], pk_idx: list[int]) -> tuple[list[tuple], dict, int]:
+    """
+    Removes the rows whose content hash equals the hash stored for their primary key.
 
+    Returns:
+        tuple: (changed rows, {primary key: hash} of the changed rows, number of skipped rows)
+    """
+    cached = _ROW_HASH_CACHE.get(table_name, {})
+    changed, hashes = [], {}
+    for row in data:
+        pk = tuple(row[i] for i in pk_idx)
+        h = row_hash(row)
+        if cached.get(pk) != h:
+            changed.append(row)
+            hashes[pk] = h
+    return changed, hashes, len(data) - len(changed)
+
+def update_row_hash_cache(table_name: str, data: list[tuple], pk_idx: list[int], hashes: dict) -> None:
+    """
+    Keeps the row hash cache in line with what was written to the table. Rows uploaded in diff mode
+    store their hash, rows uploaded without it are removed from the cache so they are resent next time.
+    """
+    if hashes:
+        _ROW_HASH_CACHE.setdefault(table_name, {}).update(hashes)
+    elif table_name in _ROW_HASH_CACHE:
+        cached = _ROW_HASH_CACHE[table_name]
+        for row in data:
+            cached.pop(tuple(row[i] for i in pk_idx), None)
+
+def clear_row_hash_cache(table_name: str = None) -> None:
+    """ Clears the row hash cache for one table, or for all tables """
+    if table_name:
+        _ROW_HASH_CACHE.pop(table_name, None)
+    else:
+        _ROW_HASH_CACHE.clear()
+
+def gather_keys(table_name: str, cursor=None) -> tuple[list[str], list[str]]:
+    """
+    Gather all column names and primary key column names from the specified PostgreSQL table.
+    """
+    try:
+        table_schema = get_table_schema(table_name, cursor=cursor)
     except Exception as e:
         print(f"Error while gathering keys for table {table_name}: {e}")
         return [], []
-    finally:
-        close_database(db)
+    
+    if table_schema is None:
+        return [], []
+    return list(table_schema['columns']), list(table_schema['primary_keys'])
 
-    return all_keys, primary_keys
+def get_upload_query(table_name: str, preserve_existing: bool = False, returning: bool = False, cursor=None) -> tuple[str, list[str], list[str]] | None:
+    """
+    Returns the cached upload query of a table, built once per schema version.
+    cursor is used to reload the schema metadata, when the caller already holds a connection.
 
-def upload_data_query(table_name: str, keys: list[str], primary_keys: list[str], preserve_existing: bool = False) -> str:
+    Returns:
+        tuple | None: (query, keys, primary keys), or None if the table has no columns or primary key
+    """
+    cache_key = (table_name, preserve_existing, returning, schema_version(cursor=cursor))
+    if cache_key not in _UPLOAD_QUERY_CACHE:
+        keys, primary_keys = gather_keys(table_name, cursor=cursor)
+        if not keys or not primary_keys:
+            return None
+        query = upload_data_query(table_name, keys, primary_keys, preserve_existing=preserve_existing, returning=returning)
+        _UPLOAD_QUERY_CACHE[cache_key] = (query, keys, primary_keys)
+    return _UPLOAD_QUERY_CACHE[cache_key]
+
+def upload_data_query(table_name: str, keys: list[str], primary_keys: list[str], preserve_existing: bool = False, returning: bool = False) -> str:
     """
     Create the SQL insert (with optional upsert) query for PostgreSQL using execute_values.
+    The query returns one row with the number of inserted and updated rows (xmax = 0 only holds for
+    freshly inserted rows), so the written rows are not sent back.
 
     Args:
         table_name (str)    : Name of the table
         keys (list)         : List of all column keys
         primary_keys (list) : List of primary key columns
         preserve_existing (bool) : If True, keep existing DB values for columns when EXCLUDED value is NULL
+        returning (bool)    : If True, return the written rows followed by an inserted flag instead of the counts (debugging)
 
     Returns:
         str : SQL query string compatible with psycopg2.extras.execute_values()
@@ -133,83 +291,197 @@ def upload_data_query(table_name: str, keys: list[str], primary_keys: list[str],
     if not keys or not primary_keys:
         raise ValueError(f"Cannot build upload query without keys or primary keys for table {table_name}")
 
-    # Sanitize/quote identifiers
-    escaped_keys = [f'"{key.replace("\"", "\"\"")}"' for key in keys]
-    escaped_pks = [f'"{pk.replace("\"", "\"\"")}"' for pk in primary_keys]
+    escaped_keys = [quote_identifier(key) for key in keys]
 
     if all(k in primary_keys for k in keys):
-        # No upsert, just INSERT
+        # Only key columns, existing rows are left as they are
         query = f"""
             INSERT INTO "{table_name}" ({', '.join(escaped_keys)})
-            VALUES %s;
+            VALUES %s
+            ON CONFLICT DO NOTHING
         """
     else:
-        # Build ON CONFLICT DO UPDATE clause
-        if preserve_existing:
-            update_clause = ', '.join([
-                f'{key} = COALESCE(EXCLUDED.{key}, "{table_name}".{key})'
-                for key in escaped_keys if key not in escaped_pks
-            ])
-        else:
-            update_clause = ', '.join([
-                f'{key} = EXCLUDED.{key}'
-                for key in escaped_keys if key not in escaped_pks
-            ])
-
         query = f"""
             INSERT INTO "{table_name}" ({', '.join(escaped_keys)})
             VALUES %s
-            ON CONFLICT ({', '.join(escaped_pks)})
-            DO UPDATE SET {update_clause}
-            RETURNING {', '.join(escaped_keys)};
+            {upsert_clause(table_name, keys, primary_keys, preserve_existing)}
         """
-    return query.strip()
+    
+    if returning:
+        return f"{query.strip()}\nRETURNING {', '.join(escaped_keys)}, (xmax = 0) AS inserted;"
+    return upsert_counts_query(query)
+
+def quote_identifier(name: str) -> str:
+    """ Sanitize/quote an identifier """
+    return '"' + name.replace('"', '""') + '"'
+
+def upsert_counts_query(insert_query: str) -> str:
+    """ Wraps an INSERT statement so it returns a single (inserted, updated) row """
+    return f"""
+        WITH upserted AS (
+            {insert_query.strip()}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT 
+            COUNT(*) FILTER (WHERE inserted), 
+            COUNT(*) FILTER (WHERE NOT inserted)
+        FROM upserted;
+    """.strip()
+
+def upsert_clause(table_name: str, keys: list[str], primary_keys: list[str], preserve_existing: bool = False) -> str:
+    """ Builds the ON CONFLICT DO UPDATE clause for the non primary key columns """
+    escaped_keys = [quote_identifier(key) for key in keys]
+    escaped_pks = [quote_identifier(pk) for pk in primary_keys]
+    
+    if preserve_existing:
+        update_clause = ', '.join([
+            f'{key} = COALESCE(EXCLUDED.{key}, "{table_name}".{key})'
+            for key in escaped_keys if key not in escaped_pks
+        ])
+    else:
+        update_clause = ', '.join([
+            f'{key} = EXCLUDED.{key}'
+            for key in escaped_keys if key not in escaped_pks
+        ])
+    
+    return f"ON CONFLICT ({', '.join(escaped_pks)}) DO UPDATE SET {update_clause}"
 
-def clean_invalid_foreign_keys(df: pd.DataFrame, table_name: str) -> pd.DataFrame:
+### -----------------------------------------------------------------
+### Bulk upload (COPY)
+### -----------------------------------------------------------------
+# Uploads of at least COPY_THRESHOLD rows are streamed with COPY into a temporary staging table
+# and merged into the target table with a single INSERT ... SELECT ... ON CONFLICT. psycopg2 does not
+# support COPY on green connections, so the web process (eventlet) always uses execute_values.
+
+COPY_THRESHOLD = 5000
+COPY_CHUNK_SIZE = 50000
+INTEGER_TYPES = {'smallint', 'integer', 'bigint'}
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+def copy_value(val) -> str:
+    """ Formats a value for the COPY text format """
+    if val is None:
+        return '\\N'
+    if isinstance(val, bool):
+        return 't' if val else 'f'
+    return str(val).translate(_COPY_ESCAPES)
+
+def copy_upload(cursor, table_name: str, keys: list[str], primary_keys: list[str], data: list[tuple], preserve_existing: bool = False) -> tuple[int, int]:
     """
-    Removes rows from a DataFrame that would violate foreign key constraints in PostgreSQL.
+    Uploads prepared rows with COPY into a staging table and merges them into table_name.
+    The staging table is a TEMP table (not WAL-logged, private to the connection) dropped on commit.
+    Its integer columns are numeric, so values like 1.0 (an integer column with NaN becomes float64 in
+    pandas) are cast on the merge exactly like the execute_values path casts them.
+
+    Args:
+        cursor              : Cursor of the upload transaction
+        table_name (str)    : Name of the table
+        keys (list)         : Columns of the rows
+        primary_keys (list) : Primary key columns
+        data (list)         : Prepared rows (as built by upload_data), unique per primary key
+        preserve_existing (bool) : If True, keep existing DB values for columns when the new value is NULL
+
+    Returns:
+        tuple: (inserted rows, updated rows)
     """
-    db, cursor = start_database()
+    staging_table = quote_identifier(f"_staging_{table_name}")
+    escaped_keys = ', '.join(quote_identifier(key) for key in keys)
 
-    try:
-        # Get foreign key relationships from PostgreSQL catalog
-        query = """
-        SELECT
-            tc.constraint_name,
-            kcu.column_name AS local_column,
-            ccu.table_name AS ref_table,
-            ccu.column_name AS ref_column
-        FROM 
-            information_schema.table_constraints AS tc
-        JOIN 
-            information_schema.key_column_usage AS kcu
-            ON tc.constraint_name = kcu.constraint_name
-           AND tc.table_schema = kcu.table_schema
-        JOIN 
-            information_schema.constraint_column_usage AS ccu
-            ON ccu.constraint_name = tc.constraint_name
-           AND ccu.table_schema = tc.table_schema
-        WHERE 
-            tc.constraint_type = 'FOREIGN KEY'
-            AND tc.table_name = %s
-        """
-        cursor.execute(query, (table_name,))
-        fk_info = cursor.fetchall()
+    cursor.execute(f'DROP TABLE IF EXISTS {staging_table}')
+    cursor.execute(f'CREATE TEMP TABLE {staging_table} (LIKE "{table_name}" INCLUDING DEFAULTS) ON COMMIT DROP')
+    
+    table_schema = get_table_schema(table_name, cursor=cursor)
+    column_types = table_schema['types'] if table_schema else {}
+    integer_keys = [key for key in keys if column_types.get(key) in INTEGER_TYPES]
+    if integer_keys:
+        cursor.execute(f'ALTER TABLE {staging_table} ' + ', '.join(
+            f'ALTER COLUMN {quote_identifier(key)} TYPE numeric' for key in integer_keys
+        ))
+
+    for start in range(0, len(data), COPY_CHUNK_SIZE):
+        buffer = io.StringIO()
+        buffer.writelines(
+            '\t'.join(copy_value(val) for val in row) + '\n'
+            for row in data[start:start + COPY_CHUNK_SIZE]
+        )
+        buffer.seek(0)
+        cursor.copy_expert(f'COPY {staging_table} ({escaped_keys}) FROM STDIN', buffer)
 
-        if not fk_info:
-            function_logger.debug(f"No foreign keys found for table {table_name}. Skipping foreign key validation.")
-            return df
+    if all(k in primary_keys for k in keys):
+        conflict_clause = "ON CONFLICT DO NOTHING"  # Same as the execute_values path
+    else:
+        conflict_clause = upsert_clause(table_name, keys, primary_keys, preserve_existing)
 
-        # Build a DataFrame from the results
-        fk_df = pd.DataFrame(fk_info, columns=["constraint_name", "local_column", "ref_table", "ref_column"])
+    cursor.execute(upsert_counts_query(f"""
+        INSERT INTO "{table_name}" ({escaped_keys})
+        SELECT {escaped_keys} FROM {staging_table}
+        {conflict_clause}
+    """))
+    inserted, updated = cursor.fetchone()
+    return inserted, updated
 
-        original_df = df.copy()
-        valid_mask = pd.Series([True] * len(df), index=df.index)
+def missing_foreign_keys_query(ref_table: str, ref_cols: list[str], ref_types: list[str]) -> str:
+    """
+    Query returning the positions of the keys that do not exist in the referenced table.
+    The batch keys are sent as one array per column (cast to the referenced column type, so the
+    lookup uses the primary key index of the referenced table).
+    """
+    key_cols = [f"k{i}" for i in range(len(ref_cols))]
+    arrays = ', '.join(f"%s::{ref_type}[]" for ref_type in ref_types)
+    conditions = ' AND '.join(f'r."{ref_col}" = k.{key_col}' for ref_col, key_col in zip(ref_cols, key_cols))
+    return f"""
+        SELECT k.idx
+        FROM unnest({arrays}) WITH ORDINALITY AS k({', '.join(key_cols)}, idx)
+        WHERE NOT EXISTS (SELECT 1 FROM "{ref_table}" r WHERE {conditions})
+    """
 
-        for constraint_name, fk_group in fk_df.groupby("constraint_name"):
-            local_cols = fk_group['local_column'].tolist()
-            ref_table = fk_group['ref_table'].iloc[0]
-            ref_cols = fk_group['ref_column'].tolist()
+def foreign_key_array(values: pd.Series, ref_type: str) -> list:
+    """ Converts a key column to a list psycopg2 can send as an array of the referenced column type """
+    if ref_type in ('integer', 'bigint', 'smallint'):
+        return [int(val) for val in values]
+    if ref_type in ('text', 'character varying') or ref_type.startswith('character'):
+        return [str(val) for val in values]
+    return values.tolist()
+
+def clean_invalid_foreign_keys(df: pd.DataFrame, table_name: str, cursor=None) -> pd.DataFrame:
+    """
+    Removes rows from a DataFrame that would violate foreign key constraints in PostgreSQL.
+    Only the distinct keys of the batch are checked against the referenced tables, rows with a
+    missing (NULL) foreign key value are removed as well.
+    
+    Pass the cursor of the upload, so the check does not take a second pool connection. The
+    transaction of that cursor must not hold uncommitted writes, it is rolled back when a check fails.
+    """
+    # Foreign key relationships from the schema metadata cache
+    try:
+        table_schema = get_table_schema(table_name, cursor=cursor)
+        foreign_keys = table_schema['foreign_keys'] if table_schema else {}
+        ref_types = {
+            constraint_name: [get_table_schema(fk['ref_table'], cursor=cursor)['types'][col] for col in fk['ref_columns']]
+            for constraint_name, fk in foreign_keys.items()
+        }
+    except Exception as e:
+        function_logger.error(f"Unexpected error gathering FKs for table {table_name}: {e}")
+        return df
+    
+    if not foreign_keys:
+        function_logger.debug(f"No foreign keys found for table {table_name}. Skipping foreign key validation.")
+        return df
+
+    own_connection = cursor is None
+    if own_connection:
+        db, cursor = start_database()
+    else:
+        db = cursor.connection
+
+    try:
+        valid_mask = pd.Series(True, index=df.index)
+
+        for constraint_name, fk in foreign_keys.items():
+            local_cols = fk['columns']
+            ref_table = fk['ref_table']
+            ref_cols = fk['ref_columns']
 
             # Skip if missing required local columns
             missing_cols = [col for col in local_cols if col not in df.columns]
@@ -218,16 +490,23 @@ def clean_invalid_foreign_keys(df: pd.DataFrame, table_name: str) -> pd.DataFram
                 continue
 
             try:
-                # Get valid referenced values
-                ref_query = f'SELECT {", ".join(ref_cols)} FROM "{ref_table}";'
-                cursor.execute(ref_query)
-                rows = cursor.fetchall()
-                valid_tuples = pd.DataFrame(rows, columns=ref_cols)
-
-                valid_set = set([tuple(map(str, row)) for row in valid_tuples.itertuples(index=False, name=None)])
-                df_tuples = df[local_cols].astype(str).apply(lambda row: tuple(row), axis=1)
-
-                this_valid_mask = df_tuples.isin(valid_set)
+                df_keys = df[local_cols]
+                null_mask = df_keys.isna().any(axis=1)
+                
+                # Send the distinct keys of the batch and get back the ones that do not exist
+                distinct_keys = df_keys[~null_mask].drop_duplicates()
+                invalid_keys = distinct_keys.iloc[0:0]
+                if not distinct_keys.empty:
+                    cursor.execute(
+                        missing_foreign_keys_query(ref_table, ref_cols, ref_types[constraint_name]),
+                        [foreign_key_array(distinct_keys[col], ref_type) for col, ref_type in zip(local_cols, ref_types[constraint_name])]
+                    )
+                    missing_idx = [row[0] - 1 for row in cursor.fetchall()]
+                    invalid_keys = distinct_keys.iloc[missing_idx]
+                
+                this_valid_mask = ~null_mask
+                if not invalid_keys.empty:
+                    this_valid_mask &= ~pd.MultiIndex.from_frame(df_keys).isin(pd.MultiIndex.from_frame(invalid_keys))
                 removed_rows = df[valid_mask & ~this_valid_mask]
 
                 if not removed_rows.empty:
@@ -241,14 +520,206 @@ def clean_invalid_foreign_keys(df: pd.DataFrame, table_name: str) -> pd.DataFram
 
             except Exception as e:
                 function_logger.error(f"Error validating FK {constraint_name} for table {table_name}: {e}")
+                db.rollback()
                 return df
 
-        return original_df[valid_mask].copy()
+        return df[valid_mask].copy()
 
     except Exception as e:
         function_logger.error(f"Unexpected error gathering FKs for table {table_name}: {e}")
         return df
 
+    finally:
+        if own_connection:
+            close_database(db)
+
+def update_match_scores(scores: dict) -> None:
+    """
+    Updates only the score column of existing matches, used by the live match tracking
+    
+    Args:
+        scores (dict): {match_id: score list}
+    """
+    if not scores:
+        return
+    
+    db, cursor = start_database()
+    try:
+        for match_id, score in scores.items():
+            cursor.execute('UPDATE matches SET score = %s WHERE match_id = %s', (json.dumps(score), match_id))
+        db.commit()
+    except Exception as e:
+        function_logger.error(f"Error updating live match scores: {e}")
+        db.rollback()
+    finally:
+        close_database(db)
+
+def update_match_statuses(statuses: dict) -> None:
+    """
+    Updates only the status column of existing matches, used by the live match tracking for the
+    statuses that the full match ingest does not store (CANCELLED)
+    
+    Args:
+        statuses (dict): {match_id: status}
+    """
+    if not statuses:
+        return
+    
+    db, cursor = start_database()
+    try:
+        for match_id, status in statuses.items():
+            cursor.execute('UPDATE matches SET status = %s WHERE match_id = %s', (status, match_id))
+        db.commit()
+    except Exception as e:
+        function_logger.error(f"Error updating live match statuses: {e}")
+        db.rollback()
+    finally:
+        close_database(db)
+
+def update_players_stats_hltv(rows: list[tuple]) -> int:
+    """
+    Rewrites the hltv column of existing players_stats rows in one statement.
+    
+    Args:
+        rows (list): (player_id, match_id, match_round, hltv) tuples
+    
+    Returns:
+        int: Number of rows whose rating changed
+    """
+    if not rows:
+        return 0
+    
+    db, cursor = start_database()
+    try:
+        query = """
+            UPDATE players_stats ps
+            SET hltv = v.hltv
+            FROM (VALUES %s) AS v(player_id, match_id, match_round, hltv)
+            WHERE ps.player_id = v.player_id
+              AND ps.match_id = v.match_id
+              AND ps.match_round = v.match_round
+              AND ps.hltv IS DISTINCT FROM v.hltv
+        """
+        # One statement for all rows, the rowcount of a paged execute_values only covers its last page
+        execute_values(cursor, query, rows, template="(%s, %s, %s, %s::double precision)", page_size=len(rows))
+        updated = cursor.rowcount
+        db.commit()
+        return updated
+    except Exception as e:
+        function_logger.error(f"Error updating players_stats hltv: {e}")
+        db.rollback()
+        raise
+    finally:
+        close_database(db)
+
+### -----------------------------------------------------------------
+### Stats summary tables
+### -----------------------------------------------------------------
+# players_stats_summary and teams_maps_summary hold the per (player, team, event, map) and (team, event, map)
+# aggregates read by the website. Every stat is stored as a sum and a count of its non-null values, so
+# averages over any combination of summary rows equal the averages over the raw rows.
+
+# Transaction level lock held by every refresh. Refreshes that touch the same keys would otherwise both
+# delete before either inserts, and the second insert fails on the primary key.
+STATS_SUMMARY_LOCK_ID = 4917351
+
+def players_stats_summary_query(stat_columns: list[str], where: str = "") -> str:
+    """
+    INSERT ... SELECT of the players_stats_summary rows, optionally restricted by a WHERE clause.
+    Like the raw players_stats readers, only the maps with a teams_maps result are counted.
+    """
+    sum_columns = ''.join(f', {quote_identifier(col + "_sum")}, {quote_identifier(col + "_n")}' for col in stat_columns)
+    sum_expressions = ''.join(f', SUM(ps.{quote_identifier(col)}), COUNT(ps.{quote_identifier(col)})' for col in stat_columns)
+    return f"""
+        INSERT INTO players_stats_summary (player_id, team_id, event_id, map, maps_played, maps_won{sum_columns})
+        SELECT
+            ps.player_id, ps.team_id, m.event_id, COALESCE(ma.map, ''),
+            COUNT(*), SUM(COALESCE(tm.team_win, 0)){sum_expressions}
+        FROM players_stats ps
+        JOIN matches m ON ps.match_id = m.match_id
+        LEFT JOIN maps ma ON ps.match_id = ma.match_id AND ps.match_round = ma.match_round
+        JOIN teams_maps tm ON ps.match_id = tm.match_id AND ps.match_round = tm.match_round AND ps.team_id = tm.team_id
+        WHERE ps.team_id IS NOT NULL AND m.event_id IS NOT NULL {where}
+        GROUP BY ps.player_id, ps.team_id, m.event_id, COALESCE(ma.map, '')
+    """
+
+def teams_maps_summary_query(where: str = "") -> str:
+    """ INSERT ... SELECT of the teams_maps_summary rows, optionally restricted by a WHERE clause """
+    return f"""
+        INSERT INTO teams_maps_summary (team_id, event_id, map, played, won)
+        SELECT tm.team_id, m.event_id, COALESCE(ma.map, ''), COUNT(*), SUM(COALESCE(tm.team_win, 0))
+        FROM teams_maps tm
+        JOIN matches m ON tm.match_id = m.match_id
+        LEFT JOIN maps ma ON tm.match_id = ma.match_id AND tm.match_round = ma.match_round
+        WHERE tm.team_id IS NOT NULL AND m.event_id IS NOT NULL {where}
+        GROUP BY tm.team_id, m.event_id, COALESCE(ma.map, '')
+    """
+
+def refresh_stats_summaries(match_ids: list[str] | None = None) -> None:
+    """
+    Recomputes the stats summary tables in one transaction.
+    
+    Args:
+        match_ids (list): Matches that were uploaded or changed, only the (player, team, event) and (team, event)
+                          keys that played in them are recomputed. None rebuilds the tables from scratch.
+    
+    Raises:
+        Exception: When the refresh fails, the summaries are left as they were
+    """
+    if match_ids is not None and len(match_ids) == 0:
+        return
+    
+    stat_columns, complete = summary_stat_columns()
+    if get_table_schema('players_stats_summary') is None or get_table_schema('teams_maps_summary') is None:
+        function_logger.warning("Stats summary tables do not exist, run database/db_migrations.py.")
+        return
+    if not complete:
+        function_logger.warning("players_stats_summary is missing stat columns, run database/db_migrations.py.")
+    
+    db, cursor = start_database()
+    try:
+        start = time.perf_counter()
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (STATS_SUMMARY_LOCK_ID,))
+        if match_ids is None:
+            cursor.execute("TRUNCATE players_stats_summary, teams_maps_summary")
+            cursor.execute(players_stats_summary_query(stat_columns))
+            cursor.execute(teams_maps_summary_query())
+        else:
+            # Keys touched by the matches, each of them is recomputed over all its matches
+            cursor.execute("""
+                CREATE TEMP TABLE summary_player_keys ON COMMIT DROP AS
+                SELECT DISTINCT ps.player_id, ps.team_id, m.event_id
+                FROM players_stats ps
+                JOIN matches m ON ps.match_id = m.match_id
+                WHERE ps.match_id = ANY(%s);
+                
+                CREATE TEMP TABLE summary_team_keys ON COMMIT DROP AS
+                SELECT DISTINCT tm.team_id, m.event_id
+                FROM teams_maps tm
+                JOIN matches m ON tm.match_id = m.match_id
+                WHERE tm.match_id = ANY(%s);
+                
+                DELETE FROM players_stats_summary s
+                USING summary_player_keys k
+                WHERE s.player_id = k.player_id AND s.team_id = k.team_id AND s.event_id = k.event_id;
+                
+                DELETE FROM teams_maps_summary s
+                USING summary_team_keys k
+                WHERE s.team_id = k.team_id AND s.event_id = k.event_id;
+            """, (list(match_ids), list(match_ids)))
+            cursor.execute(players_stats_summary_query(
+                stat_columns, "AND (ps.player_id, ps.team_id, m.event_id) IN (SELECT player_id, team_id, event_id FROM summary_player_keys)"
+            ))
+            cursor.execute(teams_maps_summary_query(
+                "AND (tm.team_id, m.event_id) IN (SELECT team_id, event_id FROM summary_team_keys)"
+            ))
+        db.commit()
+        scope = "all matches" if match_ids is None else f"{len(match_ids)} matches"
+        function_logger.info(f"Refreshed stats summaries for {scope} in {time.perf_counter() - start:.2f}s.")
+    except Exception as e:
+        function_logger.error(f"Error refreshing the stats summaries: {e}")
+        db.rollback()
+        raise
     finally:
         close_database(db)
 
@@ -1,17 +1,21 @@
 ## Imports
 from database.db_down import gather_players
-from database.db_down_update import gather_upcoming_matches, gather_event_players, gather_event_teams, gather_event_matches, gather_internal_event_ids, gather_elo_snapshot, gather_league_teams_merged, gather_league_team_avatars, gather_league_teams, gather_ongoing_matches
-from database.db_up import upload_data
+from database.db_down_update import gather_upcoming_matches, gather_event_players, gather_event_teams, gather_internal_event_ids, gather_elo_snapshot, gather_league_teams_merged, gather_league_team_avatars, gather_league_teams, gather_ongoing_matches, gather_backfill_checkpoint, gather_event_high_water_mark, gather_new_match_ids, gather_players_stats_hltv_chunk
+from database.db_up import upload_data, update_players_stats_hltv, update_match_scores, update_match_statuses, refresh_stats_summaries
+from database.db_async import run_db
 from data_processing.api.sliding_window import RequestDispatcher
 from data_processing.api.faceit_v4 import FaceitData
 from data_processing.api.faceit_v1 import FaceitData_v1
-from data_processing.dp_general import process_matches, process_team_details_batch, process_player_details_batch, gather_event_details
-from data_processing.dp_events import process_teams_benelux_esea, gather_esea_matches, gather_hub_matches, process_esea_season_data, modify_keys
-from data_processing.dp_benelux import get_benelux_leaderboard_players
+from data_processing.dp_general import process_matches, process_team_details_batch, process_player_details_batch, gather_event_details, hltv_kernel, process_match_live_state
+from data_processing.dp_events import process_teams_benelux_esea, gather_esea_matches, stream_esea_matches, gather_hub_matches, gather_hub_matches_page, process_esea_season_data, modify_keys, rosters_to_long
+from data_processing.dp_benelux import get_benelux_leaderboard_players, select_leaderboard_refresh
 
 from BeneluxWebb.website import socketio
 
 import pandas as pd
+import numpy as np
+import asyncio
+import time
 import requests
 from pathlib import Path
 from io import BytesIO
@@ -28,55 +32,87 @@ FACEIT_TOKEN = os.getenv("FACEIT_TOKEN")
 
 update_logger = get_logger("update_logger")
 
-# === General functions ===
-async def update_matches(match_ids: list, event_ids: list):
-    update_logger.info(f"[START] Updating matches: {len(match_ids)} matches to process.")
-    try:
-        async with RequestDispatcher(request_limit=100, interval=10, concurrency=5) as dispatcher:
-            async with FaceitData(FACEIT_TOKEN, dispatcher) as faceit_data, FaceitData_v1(dispatcher) as faceit_data_v1:
-                df_matches, df_teams_matches, df_teams, df_maps, df_teams_maps, df_players_stats, df_players = await process_matches(match_ids, event_ids, faceit_data, faceit_data_v1)
+# Last seen live state of the ongoing matches: {match_id: {'status': ..., 'score': [...]}}
+_LIVE_MATCH_STATE: dict[str, dict] = {}
 
-    except Exception as e:
-        update_logger.error(f"Error while fetching match details: {e}")
-        return 
+# Seconds before the newest stored hub match from which the hub is checked for new matches
+HUB_HIGH_WATER_MARK_MARGIN = 6 * 60 * 60
+
+# === General functions ===
+async def ingest_match_batch(match_ids: list, event_ids: list, faceit_data: FaceitData, faceit_data_v1: FaceitData_v1, notify: bool = False) -> int:
+    """
+    Processes the given matches, uploads all resulting dataframes and refreshes their stats summaries.
     
-    if not isinstance(df_matches, pd.DataFrame) or df_matches.empty:
-        update_logger.info("No match details found for matches.")
-        return
+    Requested matches that are missing from the processed output are looked up again. Cancelled matches
+    are never stored and are skipped, any other missing match raises after the rest has been uploaded.
     
-    event_ids = df_matches['event_id'].unique().tolist()
-    if event_ids and isinstance(event_ids, list):
-        df_events = gather_internal_event_ids(event_ids=event_ids)
-        df_matches = df_matches.merge(
-            df_events[['event_id', 'internal_event_id']],
-            on='event_id',
-            how='left'
-        )
+    Args:
+        match_ids (list): Match IDs to ingest
+        event_ids (list): Event ID of every match
+        notify (bool): Emit a socketio match_update for the uploaded matches
     
-    dataframes = {
-        "matches": df_matches,
-        "teams_matches": df_teams_matches,
-        "teams": df_teams,
-        "maps": df_maps,
-        "teams_maps": df_teams_maps,
-        "players_stats": df_players_stats,
-        "players": df_players,
-    }
+    Returns:
+        int: Number of matches uploaded
     
-    for name, df in dataframes.items():
-        if not df.empty:
-            upload_data(name, df)
-            
-            if name == "matches":
-                try:
-                    socketio.emit('match_update', {'match_ids': match_ids})
-                except Exception:
-                    pass
-            
-        else:
-            update_logger.debug(f"No data to upload for {name}.")
+    Raises:
+        ValueError: When requested matches could not be processed (e.g. API timeouts or rate limits)
+    """
+    df_matches, df_teams_matches, df_teams, df_maps, df_teams_maps, df_players_stats, df_players = await process_matches(match_ids, event_ids, faceit_data, faceit_data_v1)
     
-    update_logger.info(f"[END] Updated matches: {len(match_ids)} matches processed.")
+    if not df_matches.empty:
+        df_events = await run_db(gather_internal_event_ids, event_ids=df_matches['event_id'].unique().tolist())
+        if not df_events.empty:
+            df_matches = df_matches.merge(
+                df_events[['event_id', 'internal_event_id']],
+                on='event_id',
+                how='left'
+            )
+        
+        dataframes = {
+            "matches": df_matches,
+            "teams_matches": df_teams_matches,
+            "teams": df_teams,
+            "maps": df_maps,
+            "teams_maps": df_teams_maps,
+            "players_stats": df_players_stats,
+            "players": df_players,
+        }
+        
+        for name, df in dataframes.items():
+            if not df.empty:
+                await run_db(upload_data, name, df)
+            else:
+                update_logger.debug(f"No data to upload for {name}.")
+        
+        if notify:
+            try:
+                socketio.emit('match_update', {'match_ids': df_matches['match_id'].tolist()})
+            except Exception:
+                pass
+        
+        await run_db(refresh_stats_summaries, df_matches['match_id'].tolist())
+    
+    uploaded = set(df_matches['match_id']) if not df_matches.empty else set()
+    missing = [match_id for match_id in dict.fromkeys(match_ids) if match_id not in uploaded]
+    if missing:
+        states = await asyncio.gather(*(process_match_live_state(match_id, faceit_data) for match_id in missing))
+        cancelled = {state['match_id'] for state in states if state and state['status'] == 'CANCELLED'}
+        failed = [match_id for match_id in missing if match_id not in cancelled]
+        if cancelled:
+            update_logger.info(f"Skipped {len(cancelled)} cancelled matches.")
+        if failed:
+            msg = f"{len(failed)}/{len(match_ids)} matches could not be processed: {failed[:10]}"
+            update_logger.error(msg)
+            raise ValueError(msg)
+    
+    return len(df_matches)
+
+async def update_matches(match_ids: list, event_ids: list):
+    update_logger.info(f"[START] Updating matches: {len(match_ids)} matches to process.")
+    async with RequestDispatcher(request_limit=100, interval=10, concurrency=5) as dispatcher:
+        async with FaceitData(FACEIT_TOKEN, dispatcher) as faceit_data, FaceitData_v1(dispatcher) as faceit_data_v1:
+            uploaded = await ingest_match_batch(match_ids, event_ids, faceit_data, faceit_data_v1, notify=True)
+    update_logger.info(f"[END] Updated matches: {uploaded}/{len(match_ids)} matches uploaded.")
 
 async def update_streamers(streamer_ids: list = [], streamer_names: list = []):
     from data_processing.api.twitch import get_twitch_streamer_info, get_twitch_stream_info
@@ -86,10 +122,10 @@ async def update_streamers(streamer_ids: list = [], streamer_names: list = []):
     update_logger.info("[START] Updating streamer information.")
     
     # Gather streamers
-    df_streamers = gather_streamers(streamer_ids=streamer_ids, streamer_names=streamer_names)
+    df_streamers = await run_db(gather_streamers, streamer_ids=streamer_ids, streamer_names=streamer_names)
     
     # Gather players
-    df_players = gather_players(benelux=True)
+    df_players = await run_db(gather_players, benelux=True)
     
     info_streams = get_twitch_stream_info(streamer_ids=streamer_ids, streamer_names=streamer_names)
     
@@ -177,7 +213,7 @@ async def update_streamers(streamer_ids: list = [], streamer_names: list = []):
         
     if streamers:
         df_streamers = pd.DataFrame(streamers)
-        upload_data('streams', df_streamers, preserve_existing=True)
+        await run_db(upload_data, 'streams', df_streamers, preserve_existing=True)
         
         try:
             socketio.emit('streamer_update', {'streamer_ids': streamer_ids, 'streamer_names': streamer_names})
@@ -191,7 +227,7 @@ async def update_streamers(streamer_ids: list = [], streamer_names: list = []):
 # === Minute update interval ===
 async def update_ongoing_matches():
     try:
-        df_ongoing = gather_ongoing_matches()
+        df_ongoing = await run_db(gather_ongoing_matches)
         
         if df_ongoing.empty:
             return
@@ -213,12 +249,88 @@ async def update_ongoing_matches():
         update_logger.error(f"An error occurred during the update ongoing matches process: {e}", exc_info=True)
         return
 
+# === Live match tracking (every few seconds) ===
+async def track_live_matches(queue_match):
+    """ 
+    Polls only the status and per-map score of the ongoing matches. Score changes are written to the
+    matches table and pushed over socketio. A status change is queued with queue_match(match_id, event_id),
+    so the full ingest runs as a regular exclusive update_matches job and not inside this poll.
+    
+    Transitions are detected against the last polled status, so a match is queued once per change even
+    while the stored status lags behind. Cancelled matches are not stored by the full ingest, their status
+    is written here directly so they leave the ongoing matches.
+    """
+    try:
+        df_ongoing = await run_db(gather_ongoing_matches)
+        
+        # Forget the matches that are no longer ongoing
+        for match_id in set(_LIVE_MATCH_STATE) - set(df_ongoing.get('match_id', [])):
+            _LIVE_MATCH_STATE.pop(match_id, None)
+        
+        if df_ongoing.empty:
+            return
+        
+        async with RequestDispatcher(request_limit=100, interval=10, concurrency=5) as dispatcher:
+            async with FaceitData(FACEIT_TOKEN, dispatcher) as faceit_data:
+                states = await asyncio.gather(*(
+                    process_match_live_state(match_id, faceit_data) for match_id in df_ongoing['match_id']
+                ))
+        
+        stored_status = dict(zip(df_ongoing['match_id'], df_ongoing['status']))
+        event_ids = dict(zip(df_ongoing['match_id'], df_ongoing['event_id']))
+        
+        score_changes, cancelled, transitions = {}, {}, []
+        for state in states:
+            if not state:
+                continue
+            match_id = state['match_id']
+            
+            # The stored status is only the reference for the first poll of a match
+            previous = _LIVE_MATCH_STATE.get(match_id, {'status': stored_status.get(match_id)})
+            
+            if state['status'] == 'CANCELLED':
+                cancelled[match_id] = state['status']
+            elif state['status'] != previous['status']:
+                transitions.append(match_id)
+            elif state['score'] != previous.get('score'):
+                score_changes[match_id] = state['score']
+            
+            _LIVE_MATCH_STATE[match_id] = {'status': state['status'], 'score': state['score']}
+        
+        if score_changes:
+            await run_db(update_match_scores, score_changes)
+            try:
+                socketio.emit('match_live_update', {'matches': [
+                    {'match_id': match_id, 'score': score} for match_id, score in score_changes.items()
+                ]})
+                socketio.emit('match_update', {'match_ids': list(score_changes)})
+            except Exception:
+                pass
+            update_logger.debug(f"[LIVE] Score changes for {len(score_changes)} matches.")
+        
+        if cancelled:
+            await run_db(update_match_statuses, cancelled)
+            try:
+                socketio.emit('match_update', {'match_ids': list(cancelled)})
+            except Exception:
+                pass
+            update_logger.info(f"[LIVE] {len(cancelled)} matches were cancelled.")
+        
+        if transitions:
+            update_logger.info(f"[LIVE] Status change for {len(transitions)} matches, queueing the full update.")
+            for match_id in transitions:
+                queue_match(match_id, event_ids[match_id])
+        
+    except Exception as e:
+        update_logger.error(f"An error occurred while tracking live matches: {e}", exc_info=True)
+        return
+
 # === 20 Minutes update interval ===
 async def update_upcoming_matches():
     """ Update matches from the database """
     ## Main logic
     try:
-        df_upcoming = gather_upcoming_matches()
+        df_upcoming = await run_db(gather_upcoming_matches)
         
         if df_upcoming.empty:
             return
@@ -266,7 +378,7 @@ async def update_esea_teams_benelux(team_ids: list = [], event_ids: list = [], s
         if not isinstance(team_ids, list) or not team_ids:
             team_ids = [team_ids]
           
-        df_event_players = gather_event_players(event_ids=event_ids, team_ids=team_ids, PAST=True)
+        df_event_players = await run_db(gather_event_players, event_ids=event_ids, team_ids=team_ids, PAST=True)
         # Use this dataframe to replace players_main and players_sub in df_teams_benelux for each team_id, event_id combination
         if not df_event_players.empty:
             # Merge on both keys, prioritizing df_event_players data
@@ -291,42 +403,40 @@ async def update_esea_teams_benelux(team_ids: list = [], event_ids: list = [], s
             async with FaceitData(FACEIT_TOKEN, dispatcher) as faceit_data, FaceitData_v1(dispatcher) as faceit_data_v1: 
                 
                 team_ids = df_teams_benelux['team_id'].unique().tolist()
-                player_ids = (
-                    pd.concat([df_teams_benelux['players_main'], df_teams_benelux['players_sub']])
-                    .explode()
-                    .apply(pd.Series)
-                    .drop_duplicates(subset='player_id')
-                    ['player_id']
-                    .unique()
-                    .tolist()
-                )
+                player_ids = rosters_to_long(df_teams_benelux)['player_id'].dropna().unique().tolist()
 
                 if isinstance(team_ids, str):
                     team_ids = [team_ids]
                 if isinstance(player_ids, str):
                     player_ids = [player_ids]
                 
-                df_teams = await process_team_details_batch(team_ids=team_ids, faceit_data=faceit_data)
-                df_players = await process_player_details_batch(player_ids=player_ids, faceit_data_v1=faceit_data_v1)
+                # Full refresh, this also keeps the team profile cache warm for match ingest
+                df_teams = await process_team_details_batch(team_ids=team_ids, faceit_data=faceit_data, max_age=0)
                 
+                # The teams are uploaded while the player details are fetched
+                upload_teams = None
                 if not isinstance(df_teams, pd.DataFrame) or df_teams.empty:
                     update_logger.warning("No team details found for the Benelux ESEA teams.")
                 else:
-                    upload_data("teams", df_teams)
+                    upload_teams = asyncio.ensure_future(run_db(upload_data, "teams", df_teams, diff=True))
+                
+                df_players = await process_player_details_batch(player_ids=player_ids, faceit_data_v1=faceit_data_v1)
+                if upload_teams is not None:
+                    await upload_teams
                 
                 if not isinstance(df_players, pd.DataFrame) or df_players.empty:
                     update_logger.warning("No player details found for the Benelux ESEA teams.")
                 else:
-                    upload_data("players", df_players)
+                    await run_db(upload_data, "players", df_players, diff=True)
     
         if isinstance(df_teams_benelux, pd.DataFrame) and not df_teams_benelux.empty:
-            upload_data("teams_benelux", df_teams_benelux, clear=clear)
+            await run_db(upload_data, "teams_benelux", df_teams_benelux, clear=clear, diff=True)
 
         update_logger.info("[END] Finished update of ESEA Benelux teams.")
         
     except Exception as e:
         update_logger.error(f"Error updating teams_benelux table: {e}", exc_info=True)
-        return
+        raise
 
 # === Hourly update interval ===
 async def update_new_matches_hub():
@@ -337,19 +447,17 @@ async def update_new_matches_hub():
         
         async with RequestDispatcher(request_limit=100, interval=10, concurrency=5) as dispatcher:
             async with FaceitData(FACEIT_TOKEN, dispatcher) as faceit_data, FaceitData_v1(dispatcher) as faceit_data_v1:
-                ## Gathering matches in hub
-                df_hub_matches = await gather_hub_matches(hub_id, faceit_data=faceit_data)
+                ## Gathering the matches in the hub since the newest stored finished match. The margin
+                ## also catches matches that were configured earlier but finished after it
+                high_water_mark = await run_db(gather_event_high_water_mark, hub_id)
+                since = high_water_mark - HUB_HIGH_WATER_MARK_MARGIN if high_water_mark is not None else None
+                df_hub_matches = await gather_hub_matches(hub_id, faceit_data=faceit_data, since=since)
                 
                 if df_hub_matches.empty:
                     update_logger.info("No matches found for the hub.")
                     return
                 
-                match_ids_database = gather_event_matches(event_ids=[hub_id])
-                df_matches_new = df_hub_matches[~df_hub_matches['match_id'].isin(match_ids_database)].drop_duplicates()
-                
-                match_ids = df_matches_new['match_id'].unique().tolist()
-                if isinstance(match_ids, str):
-                    match_ids = [match_ids]
+                match_ids = await run_db(gather_new_match_ids, df_hub_matches['match_id'].dropna().tolist(), event_ids=[hub_id])
                 event_ids = [hub_id]*len(match_ids)
                 
                 if not match_ids or not event_ids:
@@ -362,7 +470,7 @@ async def update_new_matches_hub():
                     faceit_data=faceit_data, faceit_data_v1=faceit_data_v1
                 )
                 
-                df_events = gather_internal_event_ids(event_ids=event_ids)
+                df_events = await run_db(gather_internal_event_ids, event_ids=event_ids)
                 df_matches = df_matches.merge(
                     df_events[['event_id', 'internal_event_id']],
                     on='event_id',
@@ -381,26 +489,31 @@ async def update_new_matches_hub():
         
         for name, df in dataframes.items():
             if not df.empty:
-                upload_data(name, df)
+                await run_db(upload_data, name, df)
             else:
                 update_logger.debug(f"No data to upload for {name}.")
         
+        if not df_matches.empty:
+            await run_db(refresh_stats_summaries, df_matches['match_id'].tolist())
         update_logger.info("[END] Finished updating new matches from Benelux Hub.")
              
     except Exception as e:
         update_logger.error(f"Error updating Benelux Hub matches: {e}", exc_info=True)
         return
 
-async def update_leaderboard(elo_cutoff=2000):
+async def update_leaderboard(elo_cutoff=2000, refresh_all=False):
+    """
+    Updates the players on the Benelux leaderboards. Only new players and players whose elo or nickname
+    changed are refreshed, with refresh_all=True the details of every player in the players table are refreshed.
+    """
     try:
         update_logger.info("[START] Updating leaderboard players.")
         
-        # Gather the leaderboard data from the API
-        df_leaderboard = await get_benelux_leaderboard_players(elo_cutoff=elo_cutoff)
-
-        # Gather the df_players dataframe from the database
-        # Gather the df_players dataframe from the database
-        df_players = gather_players(benelux=False)
+        # Gather the leaderboard data from the API and the df_players dataframe from the database at the same time
+        df_leaderboard, df_players = await asyncio.gather(
+            get_benelux_leaderboard_players(elo_cutoff=elo_cutoff),
+            run_db(gather_players, benelux=False),
+        )
         
         # Check if the dataframes are valid and not empty
         if df_leaderboard.empty:
@@ -408,38 +521,54 @@ async def update_leaderboard(elo_cutoff=2000):
             return
         
         ## ----- For the players table -----
-        await update_leaderboard_players(df_leaderboard=df_leaderboard, df_players=df_players)
+        await update_leaderboard_players(df_leaderboard=df_leaderboard, df_players=df_players, elo_cutoff=elo_cutoff, refresh_all=refresh_all)
 
         update_logger.info("[END] Finished updating leaderboard players.")
     except Exception as e:
         update_logger.error(f"Error updating leaderboard: {e}", exc_info=True)
         return
 
-async def update_leaderboard_players(df_leaderboard: pd.DataFrame, df_players: pd.DataFrame):
+async def update_leaderboard_players(df_leaderboard: pd.DataFrame, df_players: pd.DataFrame, elo_cutoff=2000, refresh_all=False):
     try:
         update_logger.info("[START] Updating leaderboard players table.")
         if df_players.empty:
             update_logger.warning("No players data found. Skipping update.")
             return
         
-        # Check if there are new players in the leaderboard
-        df_new_players = df_leaderboard[~df_leaderboard['player_id'].isin(df_players['player_id'])]
-
-        # Gather player data from these new players and the players in df_players
-        if df_new_players.empty:
-            update_logger.info("No new players found in the leaderboard for players table.")
-            player_ids = df_players['player_id'].tolist()
-        else:
+        if refresh_all:
+            # Every known player plus the new players in the leaderboard
+            df_new_players = df_leaderboard[~df_leaderboard['player_id'].isin(df_players['player_id'])]
             player_ids = df_players['player_id'].tolist() + df_new_players['player_id'].tolist()
+        else:
+            # Only the new, changed and dropped leaderboard players
+            player_ids = select_leaderboard_refresh(df_leaderboard, df_players, elo_cutoff=elo_cutoff)
+        
+        if not player_ids:
+            update_logger.info("No changed players found in the leaderboard for players table.")
+            return
             
-        async with RequestDispatcher(request_limit=350, interval=10, concurrency=5) as dispatcher:
-            async with FaceitData_v1(dispatcher) as faceit_data_v1: 
-                df_players_new = await process_player_details_batch(player_ids, faceit_data_v1)
-            
-        # Update the players table with the new players
-        # update_logger.debug(f"Found {len(df_players_new)} players to upload to players table.")
-        if not df_players_new.empty:
-            upload_data('players', df_players_new)
+        # Every finished wave is upserted right away, so partial progress is kept and memory stays flat.
+        # The upload runs in the database executor while the next wave is fetched, but only one is in
+        # flight: the previous upload is awaited before the next wave is queued.
+        pending_upload = None
+        async def upload_players_chunk(df_players_chunk: pd.DataFrame):
+            nonlocal pending_upload
+            if pending_upload is not None:
+                await pending_upload
+                pending_upload = None
+            if not df_players_chunk.empty:
+                pending_upload = asyncio.ensure_future(run_db(upload_data, 'players', df_players_chunk))
+        
+        try:
+            async with RequestDispatcher(request_limit=350, interval=10, concurrency=5) as dispatcher:
+                async with FaceitData_v1(dispatcher) as faceit_data_v1: 
+                    await process_player_details_batch(player_ids, faceit_data_v1, on_chunk=upload_players_chunk)
+            if pending_upload is not None:
+                await pending_upload
+        finally:
+            # Don't leave an upload running unobserved when the fetch fails
+            if pending_upload is not None and not pending_upload.done():
+                await asyncio.wait([pending_upload])
         
         update_logger.info("[END] Finished updating leaderboard players table.")
     except Exception as e:
@@ -451,7 +580,7 @@ async def update_elo_leaderboard():
     try:
         update_logger.info("[START] Updating elo_leaderboard_daily table.")
         
-        df_elo = gather_elo_snapshot()
+        df_elo = await run_db(gather_elo_snapshot)
         if df_elo.empty:
             update_logger.warning("No elo snapshot data found. Skipping update.")
             return
@@ -459,7 +588,7 @@ async def update_elo_leaderboard():
         today = date.today()
         df_elo['date'] = today
         
-        upload_data('elo_leaderboard_daily', df_elo)
+        await run_db(upload_data, 'elo_leaderboard_daily', df_elo)
         
         update_logger.info("[END] Finished updating elo_leaderboard_daily table.")
         
@@ -472,7 +601,7 @@ async def update_new_matches_esea():
     try:
         update_logger.info("[START] Updating new matches from ESEA.")
         
-        df_event_teams = gather_event_teams(ONGOING=True, ESEA=True)
+        df_event_teams = await run_db(gather_event_teams, ONGOING=True, ESEA=True)
         
         if df_event_teams.empty:
             update_logger.warning("No teams found for ongoing ESEA events.")
@@ -494,64 +623,25 @@ async def update_new_matches_esea():
         
         async with RequestDispatcher(request_limit=100, interval=10, concurrency=5) as dispatcher:
             async with FaceitData(FACEIT_TOKEN, dispatcher) as faceit_data, FaceitData_v1(dispatcher) as faceit_data_v1:
-                df_esea_matches = await gather_esea_matches(
-                    team_ids, 
-                    event_ids, 
-                    faceit_data_v1=faceit_data_v1, 
-                    match_amount="ALL",
-                    match_amount_type="ANY",
-                    from_timestamp=0,
-                ) # Get the match ids from the teams
-                
-                if df_esea_matches.empty:
-                    update_logger.info("No matches found for ongoing ESEA events.")
-                    return
-                
-                # Create dataframe with match_id and event_id for unique match_ids
-                match_ids_database = gather_event_matches(event_ids=df_event_teams['event_id'].tolist())
-
-                df_matches_events = df_esea_matches[~df_esea_matches['match_id'].isin(match_ids_database)][['match_id', 'event_id']].drop_duplicates()
-                
-                match_ids = df_matches_events['match_id'].unique().tolist()
-                if isinstance(match_ids, str):
-                    match_ids = [match_ids]
-                event_ids = df_matches_events['event_id'].to_list()
+                ## The new matches of every team are collected while the other teams are still discovered,
+                ## and the deduplicated set is processed once so shared team and player details are fetched once
+                known_event_ids = df_event_teams['event_id'].tolist()
+                match_events = {}
+                async for team_matches in stream_esea_matches(team_ids, event_ids, faceit_data_v1=faceit_data_v1):
+                    # Matches without a schedule are not played yet
+                    team_events = {m['match_id']: m['event_id'] for m in team_matches if m['match_time'] is not None}
+                    new_match_ids = await run_db(gather_new_match_ids, list(team_events), event_ids=known_event_ids)
+                    for match_id in new_match_ids:
+                        match_events.setdefault(match_id, team_events[match_id])
 
-                if not match_ids or not event_ids:
+                if not match_events:
                     update_logger.info("No new matches found for ESEA events.")
                     return
                 
-                ## Processing matches in esea
-                df_matches, df_teams_matches, df_teams, df_maps, df_teams_maps, df_players_stats, df_players = await process_matches(
-                    match_ids=match_ids, 
-                    event_ids=event_ids, 
-                    faceit_data=faceit_data, faceit_data_v1=faceit_data_v1
-                )
-                
-                df_events = gather_internal_event_ids(event_ids=event_ids)
-                df_matches = df_matches.merge(
-                    df_events[['event_id', 'internal_event_id']],
-                    on='event_id',
-                    how='left'
+                n_uploaded = await ingest_match_batch(
+                    list(match_events), list(match_events.values()), faceit_data, faceit_data_v1
                 )
-               
-        dataframes = {
-            "matches": df_matches,
-            "teams_matches": df_teams_matches,
-            "teams": df_teams,
-            "maps": df_maps,
-            "teams_maps": df_teams_maps,
-            "players_stats": df_players_stats,
-            "players": df_players,
-        }
-        
-        for name, df in dataframes.items():
-            if not df.empty:
-                upload_data(name, df)
-            else:
-                update_logger.debug(f"No data to upload for {name}.")
-            
-        update_logger.info("[END] Finished updating new matches from ESEA.")
+        update_logger.info(f"[END] Finished updating new matches from ESEA: {n_uploaded}/{len(match_events)} matches uploaded.")
         
     except Exception as e:
         update_logger.error(f"Error updating ESEA matches: {e}", exc_info=True)
@@ -563,7 +653,7 @@ async def update_league_teams():
         update_logger.info("[START] Updating league_teams table.")
         
         # Gather the league teams data from the API
-        df_teams, team_names_updated = gather_league_teams_merged()
+        df_teams, team_names_updated = await run_db(gather_league_teams_merged)
             
         if isinstance(team_names_updated, list) and team_names_updated:
             update_logger.info(f"Found {len(team_names_updated)} teams with updated names.")
@@ -572,7 +662,7 @@ async def update_league_teams():
             update_logger.info("No teams found for the league_teams update.")
             
         if isinstance(df_teams, pd.DataFrame) and not df_teams.empty:
-            upload_data("league_teams", df_teams, clear=False, preserve_existing=True)
+            await run_db(upload_data, "league_teams", df_teams, clear=False, preserve_existing=True)
         else:
             update_logger.info("No teams found for the league_teams update.")
             return
@@ -588,7 +678,7 @@ async def update_team_avatars():
     try:
         update_logger.info("[START] Updating team avatars.")
         
-        df_avatars = gather_league_team_avatars()
+        df_avatars = await run_db(gather_league_team_avatars)
         
         data = []
         for _, row in df_avatars.iterrows():
@@ -625,7 +715,7 @@ async def update_team_avatars():
         
         if data:
             df_team_leagues = pd.DataFrame(data)
-            upload_data("league_teams", df_team_leagues)
+            await run_db(upload_data, "league_teams", df_team_leagues)
         
         update_logger.info("[END] Finished updating team avatars.")
         
@@ -674,7 +764,7 @@ def save_avatar(team_id, season_number, avatar_bytes, project_root, master=False
 async def update_local_team_avatars():
     update_logger.info("[START] Updating local team avatars.")
     
-    df = gather_league_teams()
+    df = await run_db(gather_league_teams)
 
     # Determine project root (always BeneluxCS)
     try:
@@ -733,7 +823,7 @@ async def update_hub_events():
                     df_events = modify_keys(df_events)
                     
                     if isinstance(df_events, pd.DataFrame) and not df_events.empty:
-                        upload_data("events", df_events)
+                        await run_db(upload_data, "events", df_events)
         
         update_logger.info("[END] Finished updating hub events.")
         
@@ -758,10 +848,10 @@ async def update_esea_seasons_events():
                 df_events = modify_keys(df_events)
                 
                 if isinstance(df_seasons, pd.DataFrame) and not df_seasons.empty:
-                    upload_data("seasons", df_seasons)
+                    await run_db(upload_data, "seasons", df_seasons)
                 
                 if isinstance(df_events, pd.DataFrame) and not df_events.empty:
-                    upload_data("events", df_events) 
+                    await run_db(upload_data, "events", df_events) 
         
         update_logger.info("[END] Finished updating ESEA seasons and events tables.")
            
@@ -796,7 +886,7 @@ async def update_live_streams():
     from database.db_down_update import gather_live_streams
     
     try:
-        stream_ids = gather_live_streams()
+        stream_ids = await run_db(gather_live_streams)
         
         if not stream_ids:
             return
@@ -830,7 +920,7 @@ async def update_eventsub_subscriptions():
         subscribed_streamer_ids_set = set([sub['condition']['broadcaster_user_id'] for sub in existing_subscriptions])
         
         # Get streamers from database
-        df_streamers = gather_streamers(platforms=['twitch'])
+        df_streamers = await run_db(gather_streamers, platforms=['twitch'])
         db_streamer_ids = df_streamers['user_id'].tolist()
         streamer_ids_set = set(db_streamer_ids)
         
@@ -853,7 +943,185 @@ async def update_eventsub_subscriptions():
         
     except Exception as e:
         update_logger.error(f"An error occurred while updating EventSub subscriptions: {e}", exc_info=True)
-       
+
+# === Backfill jobs (run manually) ===
+async def run_backfill(
+    source: str,
+    fetch_chunk,
+    chunk_size: int = 100,
+    target_matches_per_minute: float | None = 60,
+    resume: bool = True,
+    max_chunks: int | None = None):
+    """
+    Runs a resumable backfill that stores its progress in the backfill_checkpoints table after every chunk.
+
+    Args:
+        source (str): Unique name of the backfill, used as the checkpoint key
+        fetch_chunk (callable): async function (offset, chunk_size, faceit_data, faceit_data_v1) -> (match_ids, event_ids, next_offset).
+            next_offset is None when the source is exhausted.
+        chunk_size (int): Number of items to fetch per chunk
+        target_matches_per_minute (float | None): Throughput target for ingested matches. None disables throttling.
+        resume (bool): If True, continue from the stored checkpoint. If False, start again from offset 0.
+        max_chunks (int | None): Stop after this many chunks (the checkpoint allows continuing later)
+    
+    Raises:
+        ValueError: When a chunk could not be ingested completely, its offset is not saved so a resume retries it
+    """
+    checkpoint = await run_db(gather_backfill_checkpoint, source) if resume else {}
+    if checkpoint.get('finished'):
+        update_logger.info(f"[BACKFILL] {source} already finished. Use resume=False to run it again.")
+        return
+
+    offset = int(checkpoint.get('page_offset') or 0)
+    processed = int(checkpoint.get('processed_matches') or 0)
+    last_match_id = checkpoint.get('last_match_id')
+
+    update_logger.info(f"[BACKFILL START] {source} from offset {offset} ({processed} matches processed before).")
+
+    chunks = 0
+    async with RequestDispatcher(request_limit=100, interval=10, concurrency=5) as dispatcher:
+        async with FaceitData(FACEIT_TOKEN, dispatcher) as faceit_data, FaceitData_v1(dispatcher) as faceit_data_v1:
+            while max_chunks is None or chunks < max_chunks:
+                started_at = time.monotonic()
+
+                match_ids, event_ids, next_offset = await fetch_chunk(offset, chunk_size, faceit_data, faceit_data_v1)
+
+                # Only ingest matches that are not in the database yet
+                chunk_events = dict(zip(match_ids, event_ids))
+                new_matches = [
+                    (match_id, chunk_events[match_id])
+                    for match_id in await run_db(gather_new_match_ids, match_ids, event_ids=event_ids)
+                ]
+
+                if new_matches:
+                    new_match_ids = [match_id for match_id, _ in new_matches]
+                    new_event_ids = [event_id for _, event_id in new_matches]
+                    # Raises when matches are missing that are not cancelled, the offset is then kept
+                    ingested = await ingest_match_batch(new_match_ids, new_event_ids, faceit_data, faceit_data_v1)
+
+                    processed += ingested
+                    last_match_id = new_match_ids[-1]
+
+                finished = next_offset is None
+                if not finished:
+                    offset = next_offset
+
+                await run_db(upload_data, 'backfill_checkpoints', pd.DataFrame([{
+                    'source': source,
+                    'page_offset': offset,
+                    'last_match_id': last_match_id,
+                    'processed_matches': processed,
+                    'finished': finished,
+                    'updated_at': int(time.time()),
+                }]))
+                chunks += 1
+
+                update_logger.info(f"[BACKFILL] {source}: chunk {chunks} done, {len(new_matches)} new matches, offset {offset}.")
+
+                if finished:
+                    update_logger.info(f"[BACKFILL END] {source} finished. {processed} matches processed.")
+                    return
+
+                # Throttle to the throughput target so the backfill does not use up the API quota
+                if target_matches_per_minute and new_matches:
+                    min_duration = len(new_matches) / target_matches_per_minute * 60
+                    elapsed = time.monotonic() - started_at
+                    if elapsed < min_duration:
+                        await asyncio.sleep(min_duration - elapsed)
+
+    update_logger.info(f"[BACKFILL PAUSED] {source} stopped after {chunks} chunks at offset {offset}.")
+
+async def backfill_hub_matches(chunk_size: int = 100, target_matches_per_minute: float | None = 60, resume: bool = True, max_chunks: int | None = None):
+    """ Backfills the finished matches of the Benelux Hub, newest first, page by page """
+    hub_id = "801f7e0c-1064-4dd1-a960-b2f54f8b5193"  # Benelux Hub ID
+    chunk_size = min(chunk_size, 100)  # Max page size of the hub matches endpoint
+
+    async def fetch_chunk(offset, chunk_size, faceit_data, faceit_data_v1):
+        df_page, item_count = await gather_hub_matches_page(hub_id, faceit_data, offset=offset, limit=chunk_size, type_of_match="past")
+
+        match_ids = df_page['match_id'].dropna().unique().tolist() if not df_page.empty else []
+        next_offset = offset + item_count if item_count == chunk_size else None
+
+        return match_ids, [hub_id]*len(match_ids), next_offset
+
+    try:
+        await run_backfill(f"hub:{hub_id}", fetch_chunk, chunk_size=chunk_size, target_matches_per_minute=target_matches_per_minute, resume=resume, max_chunks=max_chunks)
+    except Exception as e:
+        update_logger.error(f"Error during hub backfill: {e}", exc_info=True)
+
+async def backfill_esea_matches(chunk_size: int = 10, target_matches_per_minute: float | None = 60, resume: bool = True, max_chunks: int | None = None):
+    """ Backfills the matches of all Benelux ESEA teams in all seasons, in chunks of (team, event) pairs """
+    df_event_teams = await run_db(gather_event_teams, ESEA=True)
+    if df_event_teams.empty:
+        update_logger.warning("No teams found for the ESEA backfill.")
+        return
+
+    # Sort oldest events first so new seasons are appended and stored offsets stay valid
+    df_event_teams = df_event_teams.sort_values(by=['event_end', 'event_id', 'team_id'], na_position='last').reset_index(drop=True)
+    pairs = list(zip(df_event_teams['team_id'], df_event_teams['event_id']))
+
+    async def fetch_chunk(offset, chunk_size, faceit_data, faceit_data_v1):
+        chunk = pairs[offset:offset + chunk_size]
+        next_offset = offset + chunk_size if offset + chunk_size < len(pairs) else None
+        if not chunk:
+            return [], [], None
+
+        df_esea_matches = await gather_esea_matches(
+            [team_id for team_id, _ in chunk],
+            [event_id for _, event_id in chunk],
+            faceit_data_v1=faceit_data_v1,
+        )
+        if df_esea_matches.empty:
+            return [], [], next_offset
+
+        df_esea_matches = df_esea_matches[['match_id', 'event_id']].dropna().drop_duplicates(subset='match_id')
+        return df_esea_matches['match_id'].tolist(), df_esea_matches['event_id'].tolist(), next_offset
+
+    try:
+        await run_backfill("esea", fetch_chunk, chunk_size=chunk_size, target_matches_per_minute=target_matches_per_minute, resume=resume, max_chunks=max_chunks)
+    except Exception as e:
+        update_logger.error(f"Error during ESEA backfill: {e}", exc_info=True)
+
+
+def recompute_hltv(chunk_size: int = 50000):
+    """ 
+    Recomputes the HLTV rating of every players_stats row in chunks of chunk_size rows (in primary key order)
+    and writes back only the ratings that changed
+    """
+    update_logger.info("[START] Recomputing HLTV ratings for players_stats.")
+    after_key = None
+    total, changed = 0, 0
+    try:
+        while True:
+            df = gather_players_stats_hltv_chunk(after_key=after_key, limit=chunk_size)
+            if df.empty:
+                break
+            
+            hltv = hltv_kernel(
+                kills=pd.to_numeric(df['kills'], errors='coerce'),
+                deaths=pd.to_numeric(df['deaths'], errors='coerce'),
+                rounds=pd.to_numeric(df['rounds'], errors='coerce'),
+                double_kills=pd.to_numeric(df['double_kills'], errors='coerce'),
+                triple_kills=pd.to_numeric(df['triple_kills'], errors='coerce'),
+                quadro_kills=pd.to_numeric(df['quadro_kills'], errors='coerce'),
+                penta_kills=pd.to_numeric(df['penta_kills'], errors='coerce'),
+            )
+            hltv = [None if np.isnan(value) else float(value) for value in hltv]
+            
+            changed += update_players_stats_hltv(list(zip(df['player_id'].tolist(), df['match_id'].tolist(), df['match_round'].tolist(), hltv)))
+            total += len(df)
+            after_key = (df['player_id'].iloc[-1], df['match_id'].iloc[-1], df['match_round'].tolist()[-1])
+            update_logger.info(f"[HLTV] {total} rows recomputed, {changed} ratings changed.")
+            
+            if len(df) < chunk_size:
+                break
+        
+        if changed:
+            refresh_stats_summaries()
+        update_logger.info(f"[END] Recomputed HLTV ratings: {total} rows, {changed} ratings changed.")
+    except Exception as e:
+        update_logger.error(f"Error recomputing HLTV ratings: {e}", exc_info=True)
+
 
 if __name__ == "__main__":
     pass
@@ -865,4 +1133,7 @@ if __name__ == "__main__":
     # asyncio.run(update_new_matches_esea())
     # asyncio.run(update_league_teams())
     # asyncio.run(update_team_avatars())
-    # asyncio.run(update_local_team_avatars())
\ No newline at end of file
+    # asyncio.run(update_local_team_avatars())
+    # asyncio.run(backfill_hub_matches())
+    # asyncio.run(backfill_esea_matches())
+    # recompute_hltv()
\ No newline at end of file
@@ -1,6 +1,10 @@
 import eventlet
 eventlet.monkey_patch()
 
+# Queries must yield to the eventlet hub instead of blocking the website and the update jobs
+from database.db_manage import enable_green_psycopg
+enable_green_psycopg()
+
 from BeneluxWebb.website import create_app, socketio
 import os
 